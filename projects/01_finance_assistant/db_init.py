@@ -43,6 +43,8 @@ def initialize_database():
         category_id INTEGER,
         amount REAL,
         transaction_date TEXT,
+        description TEXT,
+        category_source TEXT,
         FOREIGN KEY (user_id) REFERENCES users (user_id),
         FOREIGN KEY (category_id) REFERENCES categories (category_id)
     )
@@ -66,10 +68,205 @@ def initialize_database():
     # Add sample transactions for the past 6 months
     add_sample_transactions(conn, 1)
 
+    # Create rollups, indexes and triggers
+    ensure_schema(conn)
+
     conn.commit()
     conn.close()
     print("Database initialized with sample data")
 
+def ensure_schema(conn):
+    """Create derived tables, indexes and triggers if they are missing.
+
+    This is safe to call on every start-up and on databases created by older
+    versions of the application. The ``monthly_rollups`` table holds one row per
+    (user, category, month) and is kept in sync with ``transactions`` by
+    triggers, so monthly aggregates never need a full scan of the transactions. The
+    ``transactions_fts`` FTS5 table indexes transaction descriptions for search.
+    ``data_versions`` holds a per-user counter that triggers bump whenever the
+    user's transactions or profile change, for caches of derived answers.
+
+    Args:
+        conn: An open SQLite connection
+    """
+    cursor = conn.cursor()
+
+    # Databases created before descriptions were stored lack the column
+    transaction_columns = [row[1] for row in cursor.execute("PRAGMA table_info(transactions)")]
+    if 'description' not in transaction_columns:
+        cursor.execute("ALTER TABLE transactions ADD COLUMN description TEXT")
+    # How the category was chosen, so re-categorization leaves the user's own choices
+    # alone; NULL for older rows, whose origin is unknown
+    if 'category_source' not in transaction_columns:
+        cursor.execute("ALTER TABLE transactions ADD COLUMN category_source TEXT")
+
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_transactions_user_date "
+        "ON transactions (user_id, transaction_date)"
+    )
+
+    has_rollups = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'monthly_rollups'"
+    ).fetchone()
+
+    if not has_rollups:
+        cursor.executescript('''
+        CREATE TABLE monthly_rollups (
+            user_id INTEGER,
+            category_id INTEGER,
+            month TEXT,
+            total_amount REAL,
+            txn_count INTEGER,
+            PRIMARY KEY (user_id, category_id, month)
+        ) WITHOUT ROWID;
+
+        INSERT INTO monthly_rollups (user_id, category_id, month, total_amount, txn_count)
+        SELECT user_id, category_id, strftime('%Y-%m', transaction_date), SUM(amount), COUNT(*)
+        FROM transactions
+        GROUP BY user_id, category_id, strftime('%Y-%m', transaction_date);
+
+        CREATE TRIGGER IF NOT EXISTS trg_rollups_insert AFTER INSERT ON transactions
+        BEGIN
+            INSERT INTO monthly_rollups (user_id, category_id, month, total_amount, txn_count)
+            VALUES (NEW.user_id, NEW.category_id, strftime('%Y-%m', NEW.transaction_date), NEW.amount, 1)
+            ON CONFLICT (user_id, category_id, month) DO UPDATE SET
+                total_amount = total_amount + excluded.total_amount,
+                txn_count = txn_count + 1;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_rollups_delete AFTER DELETE ON transactions
+        BEGIN
+            UPDATE monthly_rollups
+            SET total_amount = total_amount - OLD.amount, txn_count = txn_count - 1
+            WHERE user_id = OLD.user_id AND category_id = OLD.category_id
+                AND month = strftime('%Y-%m', OLD.transaction_date);
+            DELETE FROM monthly_rollups
+            WHERE user_id = OLD.user_id AND category_id = OLD.category_id
+                AND month = strftime('%Y-%m', OLD.transaction_date) AND txn_count <= 0;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_rollups_update
+        AFTER UPDATE OF user_id, category_id, amount, transaction_date ON transactions
+        BEGIN
+            UPDATE monthly_rollups
+            SET total_amount = total_amount - OLD.amount, txn_count = txn_count - 1
+            WHERE user_id = OLD.user_id AND category_id = OLD.category_id
+                AND month = strftime('%Y-%m', OLD.transaction_date);
+            DELETE FROM monthly_rollups
+            WHERE user_id = OLD.user_id AND category_id = OLD.category_id
+                AND month = strftime('%Y-%m', OLD.transaction_date) AND txn_count <= 0;
+            INSERT INTO monthly_rollups (user_id, category_id, month, total_amount, txn_count)
+            VALUES (NEW.user_id, NEW.category_id, strftime('%Y-%m', NEW.transaction_date), NEW.amount, 1)
+            ON CONFLICT (user_id, category_id, month) DO UPDATE SET
+                total_amount = total_amount + excluded.total_amount,
+                txn_count = txn_count + 1;
+        END;
+        ''')
+
+    # Full-text index over descriptions, kept in sync with transactions by triggers.
+    # user_id is indexed too, so a user's search is answered inside the index.
+    has_fts = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'transactions_fts'"
+    ).fetchone()
+
+    if not has_fts:
+        try:
+            cursor.execute('''
+            CREATE VIRTUAL TABLE transactions_fts USING fts5(
+                description,
+                user_id,
+                content = 'transactions',
+                content_rowid = 'transaction_id',
+                prefix = '2 3'
+            )
+            ''')
+        except sqlite3.OperationalError:
+            # SQLite was built without FTS5; searches fall back to LIKE
+            pass
+        else:
+            has_fts = True
+
+    if has_fts:
+        # Every row is indexed, as 'rebuild' does, including rows without a
+        # description (their user_id is still indexed). Triggers from older
+        # versions skipped those rows, so deleting one left a stale entry; they
+        # are replaced and the index is rebuilt once.
+        delete_trigger = cursor.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = 'trg_fts_delete'"
+        ).fetchone()
+        if delete_trigger is None or 'IS NOT NULL' in delete_trigger[0]:
+            cursor.executescript('''
+            DROP TRIGGER IF EXISTS trg_fts_insert;
+            DROP TRIGGER IF EXISTS trg_fts_delete;
+            DROP TRIGGER IF EXISTS trg_fts_update;
+
+            INSERT INTO transactions_fts (transactions_fts) VALUES ('rebuild');
+
+            CREATE TRIGGER trg_fts_insert AFTER INSERT ON transactions
+            BEGIN
+                INSERT INTO transactions_fts (rowid, description, user_id)
+                VALUES (NEW.transaction_id, NEW.description, NEW.user_id);
+            END;
+
+            CREATE TRIGGER trg_fts_delete AFTER DELETE ON transactions
+            BEGIN
+                INSERT INTO transactions_fts (transactions_fts, rowid, description, user_id)
+                VALUES ('delete', OLD.transaction_id, OLD.description, OLD.user_id);
+            END;
+
+            CREATE TRIGGER trg_fts_update AFTER UPDATE OF description, user_id ON transactions
+            BEGIN
+                INSERT INTO transactions_fts (transactions_fts, rowid, description, user_id)
+                VALUES ('delete', OLD.transaction_id, OLD.description, OLD.user_id);
+                INSERT INTO transactions_fts (rowid, description, user_id)
+                VALUES (NEW.transaction_id, NEW.description, NEW.user_id);
+            END;
+            ''')
+
+    # Per-user data version, bumped on every change to the user's transactions
+    cursor.executescript('''
+    CREATE TABLE IF NOT EXISTS data_versions (
+        user_id INTEGER PRIMARY KEY,
+        version INTEGER NOT NULL
+    );
+
+    CREATE TRIGGER IF NOT EXISTS trg_versions_insert AFTER INSERT ON transactions
+    BEGIN
+        INSERT INTO data_versions (user_id, version) VALUES (NEW.user_id, 1)
+        ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_versions_delete AFTER DELETE ON transactions
+    BEGIN
+        INSERT INTO data_versions (user_id, version) VALUES (OLD.user_id, 1)
+        ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_versions_update AFTER UPDATE ON transactions
+    BEGIN
+        INSERT INTO data_versions (user_id, version) VALUES (NEW.user_id, 1)
+        ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+        INSERT INTO data_versions (user_id, version)
+        SELECT OLD.user_id, 1 WHERE OLD.user_id IS NOT NEW.user_id
+        ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+    END;
+    ''')
+
+    # Income and name are part of the user's answers too
+    has_users = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'users'"
+    ).fetchone()
+    if has_users:
+        cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_versions_user_update AFTER UPDATE ON users
+        BEGIN
+            INSERT INTO data_versions (user_id, version) VALUES (NEW.user_id, 1)
+            ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+        END
+        ''')
+
+    conn.commit()
+
 def add_sample_transactions(conn, user_id):
     """Add sample transactions for a user."""
     cursor = conn.cursor()
@@ -0,0 +1,849 @@
+"""Transaction categorization module for assigning spending categories.
+
+This module provides functionality to categorize transactions from their
+descriptions using merchant and keyword rules compiled into a single
+multi-pattern matcher, so a whole imported column can be categorized at once,
+a hashed-feature linear classifier that learns from the user's category
+mappings, and a nearest-neighbour categorizer over Ollama embeddings for
+long-tail merchants. A resumable background job re-categorizes stored
+transactions whose category was assigned automatically when the rules or the
+learned model change.
+"""
+
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+from typing import Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+import requests
+from scipy import sparse
+
+from models.llm_assistant import shared_session
+from utils.data_processor import normalize_merchants
+from utils.queries import id_batches
+
+# Values of transactions.category_source for categories chosen automatically.
+# 'mapping' (the user's CSV category mapping) and 'manual' (entered by hand) are
+# the user's own choices and are never re-categorized.
+AUTOMATIC_CATEGORY_SOURCES = ('rules', 'classifier', 'embeddings', 'default')
+
+# Default merchant and keyword rules for the built-in categories
+DEFAULT_RULES = {
+    "Housing": [
+        "rent", "rent payment", "mortgage", "property management", "hoa", "landlord",
+        "apartments", "home insurance", "renters insurance",
+    ],
+    "Food": [
+        "grocery", "groceries", "supermarket", "market", "restaurant", "cafe", "coffee",
+        "bakery", "diner", "pizza", "burger", "sushi", "starbucks", "mcdonald's", "mcdonalds",
+        "chipotle", "subway", "whole foods", "trader joe's", "safeway", "kroger", "costco",
+        "aldi", "grocery outlet", "cheesecake factory", "doordash", "uber eats", "grubhub",
+        "dining", "food",
+    ],
+    "Transportation": [
+        "gas station", "fuel", "shell", "shell oil", "chevron", "exxon", "mobil", "bp",
+        "uber", "lyft", "taxi", "parking", "transit", "metro", "toll", "auto repair",
+        "car wash", "jiffy lube", "airline", "train", "bus",
+    ],
+    "Utilities": [
+        "electric", "electricity", "power company", "water bill", "water utility",
+        "gas company", "internet", "comcast", "xfinity", "verizon", "at&t", "t-mobile",
+        "phone bill", "utility", "utilities", "cable",
+    ],
+    "Entertainment": [
+        "netflix", "spotify", "hulu", "disney+", "hbo", "movie", "movies", "theater",
+        "theaters", "theatre", "cinema", "amc", "concert", "tickets", "steam", "xbox",
+        "playstation", "bowling",
+    ],
+    "Healthcare": [
+        "pharmacy", "cvs", "walgreens", "rite aid", "doctor", "dental", "dentist",
+        "hospital", "clinic", "medical", "optometrist", "urgent care", "health",
+    ],
+}
+
+_TOKEN_PATTERN = re.compile(r'[a-z]+')
+
+
+def _trie_pattern(keywords: Iterable[str]) -> str:
+    """Compile keywords into one regex alternation shaped like a prefix trie.
+
+    Shared prefixes are matched once, so the regex engine does work proportional
+    to the length of the text rather than the number of keywords. Optional
+    suffixes are greedy, so the longest keyword wins at a given position.
+    """
+    trie: Dict[str, dict] = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node: dict) -> str:
+        terminal = '' in node
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        if len(branches) == 1 and not terminal:
+            return branches[0]
+        pattern = '(?:' + '|'.join(branches) + ')'
+        return pattern + '?' if terminal else pattern
+
+    return build(trie)
+
+
+class RuleCategorizer:
+    """Categorizes transaction descriptions with merchant and keyword rules.
+
+    All rules are compiled into a single regular expression whose alternation is
+    factored as a prefix trie. Matching is case-insensitive on whole words; the
+    leftmost match in a description wins, and the longest keyword wins at the
+    same position (so "uber eats" is Food while "uber" is Transportation).
+    Keywords match the raw descriptions, so merchant normalization stays out of
+    the import path; store numbers and dates never form a whole-word keyword.
+    """
+
+    def __init__(self, rules: Optional[Dict[str, List[str]]] = None):
+        """Initialize the categorizer and compile its rules.
+
+        Args:
+            rules: Mapping of category name to keywords (default: DEFAULT_RULES)
+        """
+        self.rules: Dict[str, List[str]] = {}
+        self._keyword_categories: Dict[str, str] = {}
+        self._pattern = None
+        self.add_rules(rules if rules is not None else DEFAULT_RULES)
+
+    def add_rules(self, rules: Dict[str, List[str]]):
+        """Add keyword rules and recompile the matcher.
+
+        Args:
+            rules: Mapping of category name to keywords. A keyword that is already
+                assigned to another category is moved to the new one.
+        """
+        for category, keywords in rules.items():
+            for keyword in keywords:
+                keyword = ' '.join(keyword.lower().split())
+                if keyword:
+                    self._keyword_categories[keyword] = category
+
+        self.rules = {}
+        for keyword, category in self._keyword_categories.items():
+            self.rules.setdefault(category, []).append(keyword)
+
+        # Longest keywords first keeps the compiled trie deterministic
+        keywords = sorted(self._keyword_categories, key=lambda k: (-len(k), k))
+        self._pattern = re.compile(r'(?<!\w)(' + _trie_pattern(keywords) + r')(?!\w)')
+
+    @staticmethod
+    def _clean(descriptions: pd.Series) -> pd.Series:
+        """Lowercase descriptions and collapse runs of whitespace."""
+        return descriptions.astype(str).str.lower().str.replace(r'\s+', ' ', regex=True).str.strip()
+
+    def categorize(self, descriptions: Iterable[str]) -> pd.Series:
+        """Categorize a whole column of descriptions at once.
+
+        Statements repeat the same merchants many times, so the matcher only runs
+        on the distinct descriptions and the results are broadcast back.
+
+        Args:
+            descriptions: Transaction descriptions (missing values are allowed)
+
+        Returns:
+            Series of category names aligned with the input, None where no rule
+            matched
+        """
+        descriptions = pd.Series(descriptions)
+        codes, uniques = pd.factorize(descriptions)
+        if len(uniques) == 0:
+            return pd.Series([None] * len(descriptions), index=descriptions.index, dtype=object)
+
+        matches = self._clean(pd.Series(uniques, dtype=object)).str.extract(self._pattern, expand=False)
+        unique_categories = matches.map(self._keyword_categories).astype(object)
+        unique_categories = unique_categories.where(unique_categories.notna(), None).to_numpy()
+
+        categories = pd.Series(
+            unique_categories[codes], index=descriptions.index, dtype=object
+        )
+        categories[codes < 0] = None
+        return categories
+
+    def categorize_one(self, description: str) -> Optional[str]:
+        """Categorize a single description.
+
+        Args:
+            description: The transaction description
+
+        Returns:
+            The category name, or None if no rule matched
+        """
+        match = self._pattern.search(' '.join(str(description).lower().split()))
+        return self._keyword_categories[match.group(1)] if match else None
+
+
+def hash_features(descriptions: Iterable[str], n_features: int = 2 ** 17) -> sparse.csr_matrix:
+    """Build hashed bag-of-words and character trigram features.
+
+    Tokens are hashed with CRC32 so feature indices are stable across processes
+    and the model never needs a vocabulary. Rows are L2-normalized.
+
+    Args:
+        descriptions: Transaction descriptions
+        n_features: Number of hash buckets
+
+    Returns:
+        Sparse matrix of shape (len(descriptions), n_features)
+    """
+    descriptions = pd.Series(descriptions)
+    codes, uniques = pd.factorize(descriptions)
+    cleaned = RuleCategorizer._clean(normalize_merchants(uniques))
+
+    indptr = [0]
+    indices: List[int] = []
+    bucket_cache: Dict[str, int] = {}
+    for text in cleaned:
+        words = _TOKEN_PATTERN.findall(text)
+        tokens = ['w:' + word for word in words]
+        for word in words:
+            padded = ' ' + word + ' '
+            tokens.extend('c:' + padded[i:i + 3] for i in range(len(padded) - 2))
+        for token in tokens:
+            bucket = bucket_cache.get(token)
+            if bucket is None:
+                bucket = bucket_cache[token] = zlib.crc32(token.encode('utf-8')) % n_features
+            indices.append(bucket)
+        indptr.append(len(indices))
+
+    unique_matrix = sparse.csr_matrix(
+        (np.ones(len(indices), dtype=np.float32), indices, indptr),
+        shape=(len(uniques), n_features)
+    )
+    unique_matrix.sum_duplicates()
+    norms = np.sqrt(np.asarray(unique_matrix.multiply(unique_matrix).sum(axis=1)).ravel())
+    unique_matrix = sparse.diags(1.0 / np.maximum(norms, 1e-12)).dot(unique_matrix).tocsr()
+
+    # Missing descriptions get an empty row
+    unique_matrix = sparse.vstack(
+        [unique_matrix, sparse.csr_matrix((1, n_features), dtype=np.float32)]
+    ).tocsr()
+    return unique_matrix[np.where(codes < 0, len(uniques), codes)]
+
+
+class CategoryClassifier:
+    """Linear softmax classifier over hashed description features.
+
+    The weights live in a single float32 ``.npy`` file (one row per hash bucket,
+    one column per category) that is opened with
+    ``mmap_mode='r+'``, so every process serving the app shares one copy in the
+    page cache. ``partial_fit`` updates only the rows touched by a batch, which
+    makes learning from a user's category mapping an incremental update rather
+    than a retrain. Adding a category writes a grown copy of the file and
+    swaps it in with ``os.replace``; other instances notice the new file and
+    reopen it instead of reading through their old mapping.
+    """
+
+    def __init__(self, model_dir: str, n_features: int = 2 ** 17):
+        """Initialize the classifier, loading saved weights if present.
+
+        Args:
+            model_dir: Directory holding the weights and class names
+            n_features: Number of hash buckets for a new model
+        """
+        self.model_dir = model_dir
+        self.weights_path = os.path.join(model_dir, 'weights.npy')
+        self.classes_path = os.path.join(model_dir, 'classes.json')
+        self.n_features = n_features
+        self.classes: List[str] = []
+        self.weights = None
+        self._version = None
+        self._reload_if_changed()
+
+    def _reload_if_changed(self):
+        """Reopen the weights when the file on disk has been replaced.
+
+        The version is the file's inode and size, which change whenever
+        ``_add_classes`` swaps in a grown matrix. A matrix whose class names
+        have not been published yet is skipped until the next call.
+        """
+        try:
+            stat = os.stat(self.weights_path)
+            version = (stat.st_ino, stat.st_size)
+            if version == self._version:
+                return
+            with open(self.classes_path) as f:
+                classes = json.load(f)
+            weights = np.load(self.weights_path, mmap_mode='r+')
+        except (FileNotFoundError, ValueError):
+            # Not trained yet
+            return
+
+        if weights.shape[1] != len(classes):
+            # The grown matrix is in place but its class names are not yet
+            return
+        self.classes = classes
+        self.weights = weights
+        self.n_features = weights.shape[0]
+        self._version = version
+
+    @property
+    def is_trained(self) -> bool:
+        """Whether the model has learned at least one category."""
+        return self.weights is not None and len(self.classes) > 0
+
+    def _replace_file(self, suffix: str, write: Callable[[str], None], target: str):
+        """Write a temporary file next to ``target`` and move it into place."""
+        handle, temp_path = tempfile.mkstemp(dir=self.model_dir, suffix=suffix)
+        os.close(handle)
+        try:
+            write(temp_path)
+            os.replace(temp_path, target)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+    def _add_classes(self, new_classes: List[str]):
+        """Grow the weight matrix by one zero column per new category.
+
+        The live file is never rewritten in place, because other processes may
+        have it mapped. The new columns are zero, so a reader that sees the
+        grown matrix before the class names are published predicts as before.
+        """
+        os.makedirs(self.model_dir, exist_ok=True)
+        classes = self.classes + new_classes
+
+        def write_weights(path):
+            weights = np.lib.format.open_memmap(
+                path, mode='w+', dtype=np.float32, shape=(self.n_features, len(classes))
+            )
+            if self.weights is not None:
+                weights[:, :self.weights.shape[1]] = self.weights
+            weights.flush()
+            del weights
+
+        def write_classes(path):
+            with open(path, 'w') as f:
+                json.dump(classes, f)
+
+        self._replace_file('.npy', write_weights, self.weights_path)
+        self._replace_file('.json', write_classes, self.classes_path)
+        self._version = None
+        self._reload_if_changed()
+
+    def _scores(self, features: sparse.csr_matrix) -> np.ndarray:
+        """Compute softmax probabilities for a feature matrix.
+
+        There is no bias term, so a batch that teaches a single category cannot
+        pull unrelated descriptions towards it.
+        """
+        logits = features @ self.weights
+        logits -= logits.max(axis=1, keepdims=True)
+        probabilities = np.exp(logits)
+        probabilities /= probabilities.sum(axis=1, keepdims=True)
+        return probabilities
+
+    def predict_proba(self, descriptions: Iterable[str]) -> pd.DataFrame:
+        """Predict category probabilities for a batch of descriptions.
+
+        Args:
+            descriptions: Transaction descriptions
+
+        Returns:
+            DataFrame with one column per category, aligned with the input
+        """
+        descriptions = pd.Series(descriptions)
+        self._reload_if_changed()
+        if not self.is_trained:
+            return pd.DataFrame(index=descriptions.index)
+        features = hash_features(descriptions, self.n_features)
+        return pd.DataFrame(self._scores(features), index=descriptions.index, columns=self.classes)
+
+    def predict(self, descriptions: Iterable[str], min_confidence: float = 0.5) -> pd.Series:
+        """Predict the most likely category for a batch of descriptions.
+
+        Args:
+            descriptions: Transaction descriptions
+            min_confidence: Minimum probability required to return a category
+
+        Returns:
+            Series of category names aligned with the input, None where the model
+            is not confident, the description is missing or the model is untrained
+        """
+        descriptions = pd.Series(descriptions)
+        predictions = pd.Series([None] * len(descriptions), index=descriptions.index, dtype=object)
+        probabilities = self.predict_proba(descriptions)
+        if not self.is_trained:
+            return predictions
+
+        # Class names come from the same frame as the scores in case the file was swapped
+        classes = np.asarray(probabilities.columns, dtype=object)
+        probabilities = probabilities.to_numpy()
+        best = probabilities.argmax(axis=1)
+        confident = (probabilities[np.arange(len(best)), best] >= min_confidence) & descriptions.notna().to_numpy()
+        predictions[confident] = classes[best[confident]]
+        return predictions
+
+    def partial_fit(self, descriptions: Iterable[str], categories: Iterable[str],
+                    epochs: int = 10, learning_rate: float = 5.0):
+        """Update the model with labelled descriptions.
+
+        Args:
+            descriptions: Transaction descriptions
+            categories: The category name chosen for each description
+            epochs: Number of gradient steps over the batch
+            learning_rate: Step size for the updates
+        """
+        labelled = pd.DataFrame({'description': list(descriptions), 'category': list(categories)}).dropna()
+        if labelled.empty:
+            return
+
+        # Grow from the latest file so categories added by another process are kept
+        self._reload_if_changed()
+        new_classes = [c for c in pd.unique(labelled['category']) if c not in self.classes]
+        if new_classes or self.weights is None:
+            self._add_classes(new_classes)
+
+        class_index = {name: i for i, name in enumerate(self.classes)}
+        targets = np.zeros((len(labelled), len(self.classes)), dtype=np.float32)
+        targets[np.arange(len(labelled)), labelled['category'].map(class_index).to_numpy()] = 1.0
+
+        # Only the hash buckets present in the batch receive a gradient
+        features = hash_features(labelled['description'], self.n_features)
+        touched = np.unique(features.indices)
+        local = features[:, touched]
+
+        for _ in range(epochs):
+            gradient = (self._scores(features) - targets) / len(labelled)
+            self.weights[touched] -= learning_rate * (local.T @ gradient)
+
+        self.weights.flush()
+
+
+class EmbeddingCategorizer:
+    """Nearest-neighbour categorizer over Ollama text embeddings.
+
+    Catches long-tail merchants that neither the rules nor the linear model
+    know. Descriptions are normalized, embedded in batches through Ollama's
+    ``/api/embed`` endpoint and cached in SQLite as float32 blobs keyed by the
+    normalized text, so each merchant is embedded once. A description gets the
+    similarity-weighted majority category of its nearest labelled examples,
+    found with one matrix product.
+    """
+
+    def __init__(self, db_path: str, base_url: str = "http://localhost:11434",
+                 model_name: str = "nomic-embed-text", batch_size: int = 64,
+                 k: int = 5, min_similarity: float = 0.6, timeout: float = 30.0,
+                 session: Optional[requests.Session] = None):
+        """Initialize the categorizer.
+
+        Args:
+            db_path: Path to the SQLite database holding the cache and examples
+            base_url: The base URL for the Ollama API (e.g. OllamaAssistant.base_url)
+            model_name: The embedding model to use
+            batch_size: Number of texts sent per embeddings request
+            k: Number of nearest examples that vote on the category
+            min_similarity: Minimum cosine similarity of the best vote to accept
+            timeout: Request timeout in seconds
+            session: HTTP session to send requests through (default: the shared
+                keep-alive session used by OllamaAssistant)
+        """
+        self.db_path = db_path
+        self.base_url = base_url
+        self.session = session if session is not None else shared_session()
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.k = k
+        self.min_similarity = min_similarity
+        self.timeout = timeout
+        self._examples = None
+
+        with sqlite3.connect(self.db_path) as conn:
+            conn.executescript('''
+            CREATE TABLE IF NOT EXISTS embedding_cache (
+                model TEXT,
+                text TEXT,
+                vector BLOB,
+                PRIMARY KEY (model, text)
+            ) WITHOUT ROWID;
+
+            CREATE TABLE IF NOT EXISTS embedding_examples (
+                text TEXT PRIMARY KEY,
+                category TEXT
+            );
+            ''')
+
+    @staticmethod
+    def _normalize(descriptions: Iterable[str]) -> pd.Series:
+        """Normalize descriptions into the cache key text."""
+        return normalize_merchants(descriptions).str.lower()
+
+    def _request_embeddings(self, texts: List[str]) -> np.ndarray:
+        """Embed texts through the Ollama API in batches."""
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            response = self.session.post(
+                f"{self.base_url}/api/embed",
+                json={"model": self.model_name, "input": texts[start:start + self.batch_size]},
+                timeout=self.timeout
+            )
+            response.raise_for_status()
+            vectors.extend(response.json()['embeddings'])
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def embed(self, descriptions: Iterable[str]) -> np.ndarray:
+        """Get unit-length embeddings, calling the API only for uncached texts.
+
+        Args:
+            descriptions: Transaction descriptions
+
+        Returns:
+            Array of shape (len(descriptions), dimensions)
+
+        Raises:
+            requests.RequestException: If the embeddings API cannot be reached
+        """
+        codes, texts = pd.factorize(self._normalize(descriptions))
+        texts = list(texts)
+        cached: Dict[str, np.ndarray] = {}
+
+        conn = sqlite3.connect(self.db_path)
+        try:
+            for start in range(0, len(texts), 500):
+                chunk = texts[start:start + 500]
+                rows = conn.execute(
+                    f"""SELECT text, vector FROM embedding_cache
+                    WHERE model = ? AND text IN ({','.join('?' * len(chunk))})""",
+                    [self.model_name] + chunk
+                ).fetchall()
+                cached.update((text, np.frombuffer(vector, dtype=np.float32)) for text, vector in rows)
+
+            missing = [text for text in texts if text not in cached]
+            if missing:
+                vectors = self._request_embeddings(missing)
+                conn.executemany(
+                    "INSERT OR REPLACE INTO embedding_cache (model, text, vector) VALUES (?, ?, ?)",
+                    [(self.model_name, text, vector.tobytes()) for text, vector in zip(missing, vectors)]
+                )
+                conn.commit()
+                cached.update(zip(missing, vectors))
+        finally:
+            conn.close()
+
+        if not texts:
+            return np.zeros((len(codes), 0), dtype=np.float32)
+        return np.stack([cached[text] for text in texts])[codes]
+
+    def add_examples(self, descriptions: Iterable[str], categories: Iterable[str]):
+        """Add labelled examples for the nearest-neighbour search.
+
+        Args:
+            descriptions: Transaction descriptions
+            categories: The category name for each description
+        """
+        examples = pd.DataFrame({'text': self._normalize(list(descriptions)).to_numpy(),
+                                 'category': list(categories)})
+        examples = examples[(examples['text'] != '') & examples['category'].notna()]
+        examples = examples.drop_duplicates('text', keep='last')
+        if examples.empty:
+            return
+
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.executemany(
+                "INSERT OR REPLACE INTO embedding_examples (text, category) VALUES (?, ?)",
+                examples.itertuples(index=False, name=None)
+            )
+            conn.commit()
+        finally:
+            conn.close()
+        self._examples = None
+
+    def _load_examples(self):
+        """Load the labelled examples and their embeddings."""
+        if self._examples is None:
+            conn = sqlite3.connect(self.db_path)
+            try:
+                examples = pd.read_sql_query("SELECT text, category FROM embedding_examples", conn)
+            finally:
+                conn.close()
+            vectors = self.embed(examples['text']) if not examples.empty else None
+            self._examples = (examples['category'].to_numpy(dtype=object), vectors)
+        return self._examples
+
+    def predict(self, descriptions: Iterable[str]) -> pd.Series:
+        """Predict categories from the nearest labelled examples.
+
+        Args:
+            descriptions: Transaction descriptions
+
+        Returns:
+            Series of category names aligned with the input, None where no
+            example is similar enough or the embeddings API is unavailable
+        """
+        descriptions = pd.Series(descriptions)
+        predictions = pd.Series([None] * len(descriptions), index=descriptions.index, dtype=object)
+        valid = descriptions.notna().to_numpy()
+        if not valid.any():
+            return predictions
+
+        try:
+            labels, example_vectors = self._load_examples()
+            if example_vectors is None:
+                return predictions
+            query_vectors = self.embed(descriptions[valid])
+        except (requests.RequestException, KeyError, ValueError):
+            return predictions
+
+        similarities = query_vectors @ example_vectors.T
+        k = min(self.k, similarities.shape[1])
+        neighbours = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+        neighbour_similarities = np.take_along_axis(similarities, neighbours, axis=1)
+
+        # Similarity-weighted vote among the k nearest examples
+        label_codes, label_names = pd.factorize(labels)
+        votes = np.zeros((len(query_vectors), len(label_names)), dtype=np.float32)
+        np.add.at(votes, (np.arange(len(query_vectors))[:, None], label_codes[neighbours]),
+                  np.maximum(neighbour_similarities, 0))
+        best = votes.argmax(axis=1)
+        best_similarity = np.where(
+            label_codes[neighbours] == best[:, None], neighbour_similarities, -np.inf
+        ).max(axis=1)
+
+        accepted = best_similarity >= self.min_similarity
+        values = np.asarray(label_names, dtype=object)[best]
+        predictions.iloc[np.flatnonzero(valid)[accepted]] = values[accepted]
+        return predictions
+
+
+class RecategorizationJob:
+    """Resumable, throttled job that re-categorizes stored transactions.
+
+    Transactions are scanned in keyset-paginated chunks on ``transaction_id``
+    and categorized from their descriptions with the same chain an import uses:
+    the rules first, then the classifier when it is confident. Only rows whose
+    ``category_source`` is automatic are revisited, so categories from the
+    user's mappings or manual entries are kept, and rows neither step can
+    categorize keep their current category. Each chunk
+    is written in its own short transaction with one
+    ``UPDATE ... WHERE transaction_id IN (...)`` per category change, and the
+    rollup triggers keep ``monthly_rollups`` consistent. Progress is saved in
+    ``job_checkpoints`` with every chunk, so an interrupted run resumes where it
+    stopped, and the job sleeps between chunks so interactive reads and writes
+    are not starved.
+    """
+
+    def __init__(self, db_path: str, categorizer=None, job_name: str = 'recategorize',
+                 chunk_size: int = 5000, pause: float = 0.05,
+                 source_category_ids: Optional[List[int]] = None,
+                 on_finish: Optional[Callable[[], None]] = None,
+                 classifier: Optional[CategoryClassifier] = None,
+                 user_id: Optional[int] = None):
+        """Initialize the job.
+
+        Args:
+            db_path: Path to the SQLite database
+            categorizer: Object with a ``categorize(descriptions)`` method returning
+                category names (default: RuleCategorizer with the default rules)
+            job_name: Checkpoint name, so different jobs resume independently
+            chunk_size: Number of transactions read and written per chunk
+            pause: Seconds to sleep between chunks
+            source_category_ids: Only re-categorize transactions currently in
+                these categories (default: all categories)
+            on_finish: Called after a pass completes, e.g. to refresh tables
+                derived from the categories
+            classifier: Learned model for descriptions no rule matches
+                (default: rules only)
+            user_id: Only re-categorize this user's transactions (default: all users)
+        """
+        self.db_path = db_path
+        self.categorizer = categorizer if categorizer is not None else RuleCategorizer()
+        self.classifier = classifier
+        self.user_id = user_id
+        self.job_name = job_name
+        self.chunk_size = chunk_size
+        self.pause = pause
+        self.source_category_ids = source_category_ids
+        self.on_finish = on_finish
+        self._thread = None
+        self._stop = threading.Event()
+
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute('''
+            CREATE TABLE IF NOT EXISTS job_checkpoints (
+                job_name TEXT PRIMARY KEY,
+                last_transaction_id INTEGER,
+                scanned INTEGER,
+                updated INTEGER,
+                started_at TEXT,
+                updated_at TEXT,
+                finished_at TEXT
+            )
+            ''')
+
+    def status(self) -> Optional[Dict]:
+        """Get the saved progress of the job.
+
+        Returns:
+            Dictionary of checkpoint columns, or None if the job never ran
+        """
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.row_factory = sqlite3.Row
+            row = conn.execute(
+                "SELECT * FROM job_checkpoints WHERE job_name = ?", (self.job_name,)
+            ).fetchone()
+        finally:
+            conn.close()
+        return dict(row) if row else None
+
+    def _read_chunk(self, conn, last_id: int) -> pd.DataFrame:
+        """Read the next chunk of transactions after last_id."""
+        query = f"""SELECT transaction_id, category_id, description FROM transactions
+        WHERE transaction_id > ? AND description IS NOT NULL
+            AND category_source IN ({','.join('?' * len(AUTOMATIC_CATEGORY_SOURCES))})"""
+        params: List = [last_id, *AUTOMATIC_CATEGORY_SOURCES]
+        if self.user_id is not None:
+            query += " AND user_id = ?"
+            params.append(int(self.user_id))
+        if self.source_category_ids:
+            query += f" AND category_id IN ({','.join('?' * len(self.source_category_ids))})"
+            params.extend(self.source_category_ids)
+        query += " ORDER BY transaction_id LIMIT ?"
+        params.append(self.chunk_size)
+        return pd.read_sql_query(query, conn, params=params)
+
+    def run_chunk(self, conn, last_id: int, category_ids: Dict[str, int]):
+        """Re-categorize one chunk and save the checkpoint.
+
+        Args:
+            conn: An open SQLite connection
+            last_id: The last transaction_id already processed
+            category_ids: Mapping of category name to category_id
+
+        Returns:
+            Tuple of (last transaction_id in the chunk or None when done,
+            rows scanned, rows updated)
+        """
+        chunk = self._read_chunk(conn, last_id)
+        if chunk.empty:
+            return None, 0, 0
+
+        descriptions = chunk['description']
+        names = self.categorizer.categorize(descriptions)
+        sources = pd.Series('rules', index=chunk.index, dtype=object)
+        if self.classifier is not None and names.isna().any():
+            unmatched = names.isna()
+            names[unmatched] = self.classifier.predict(descriptions[unmatched])
+            sources[unmatched] = 'classifier'
+
+        new_ids = names.map(category_ids)
+        changed = chunk[new_ids.notna() & (new_ids != chunk['category_id'])].assign(
+            new_category_id=new_ids.astype('Int64'),
+            new_source=sources
+        )
+        chunk_last_id = int(chunk['transaction_id'].iloc[-1])
+
+        updated = 0
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # The old category in the WHERE clause skips rows edited since the read
+            groups = changed.groupby(['category_id', 'new_category_id', 'new_source'])
+            for (old_id, new_id, source), group in groups:
+                for batch in id_batches(group['transaction_id']):
+                    updated += conn.execute(
+                        f"""UPDATE transactions SET category_id = ?, category_source = ?
+                        WHERE category_id = ? AND transaction_id IN ({','.join('?' * len(batch))})""",
+                        [int(new_id), source, int(old_id)] + batch
+                    ).rowcount
+            conn.execute(
+                """UPDATE job_checkpoints
+                SET last_transaction_id = ?, scanned = scanned + ?, updated = updated + ?,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE job_name = ?""",
+                (chunk_last_id, len(chunk), updated, self.job_name)
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        return chunk_last_id, len(chunk), updated
+
+    def run(self, restart: bool = False, max_chunks: Optional[int] = None) -> Dict:
+        """Run the job until it finishes, is stopped or reaches max_chunks.
+
+        An unfinished previous run is resumed from its checkpoint; a finished one
+        starts a new pass.
+
+        Args:
+            restart: Start from the first transaction even if a run is unfinished
+            max_chunks: Maximum number of chunks to process in this call
+
+        Returns:
+            The checkpoint after this call
+        """
+        self._stop.clear()
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            checkpoint = self.status()
+            if restart or checkpoint is None or checkpoint['finished_at'] is not None:
+                conn.execute(
+                    """INSERT OR REPLACE INTO job_checkpoints
+                    (job_name, last_transaction_id, scanned, updated, started_at, updated_at, finished_at)
+                    VALUES (?, 0, 0, 0, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP, NULL)""",
+                    (self.job_name,)
+                )
+                last_id = 0
+            else:
+                last_id = checkpoint['last_transaction_id']
+
+            category_ids = dict(conn.execute("SELECT name, category_id FROM categories").fetchall())
+
+            chunks = 0
+            while not self._stop.is_set() and (max_chunks is None or chunks < max_chunks):
+                last_id, _, _ = self.run_chunk(conn, last_id, category_ids)
+                if last_id is None:
+                    conn.execute(
+                        "UPDATE job_checkpoints SET finished_at = CURRENT_TIMESTAMP WHERE job_name = ?",
+                        (self.job_name,)
+                    )
+                    if self.on_finish is not None:
+                        self.on_finish()
+                    break
+                chunks += 1
+                time.sleep(self.pause)
+        finally:
+            conn.close()
+
+        return self.status()
+
+    def start(self, restart: bool = False) -> bool:
+        """Run the job in a background thread.
+
+        Args:
+            restart: Start from the first transaction even if a run is unfinished
+
+        Returns:
+            True if a new thread was started, False if the job is already running
+        """
+        if self.is_running:
+            return False
+        self._thread = threading.Thread(target=self.run, kwargs={'restart': restart}, daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        """Ask a running job to stop after its current chunk."""
+        self._stop.set()
+
+    @property
+    def is_running(self) -> bool:
+        """Whether the job is running in a background thread."""
+        return self._thread is not None and self._thread.is_alive()
@@ -5,14 +5,96 @@ forecasts for future spending across different categories using time series anal
 """
 
 import sqlite3
-from datetime import datetime, timedelta
+from datetime import datetime
 import warnings
 
+import numpy as np
 import pandas as pd
 from statsmodels.tsa.arima.model import ARIMA
 
+from db_init import ensure_schema
+from models.recommender import recurring_schedule
+
 warnings.filterwarnings('ignore')
 
+# Supported granularities: pandas period frequency, period label format and the
+# SQL expression that buckets a date column into that label.
+GRANULARITIES = {
+    'day': ('D', '%Y-%m-%d', "strftime('%Y-%m-%d', {col})"),
+    'week': ('W-SUN', '%Y-%m-%d', "date({col}, 'weekday 0', '-6 days')"),
+    'month': ('M', '%Y-%m', "strftime('%Y-%m', {col})"),
+    'quarter': ('Q', '%YQ%q',
+                "strftime('%Y', {col}) || 'Q' || ((CAST(strftime('%m', {col}) AS INTEGER) + 2) / 3)"),
+}
+
+# Average number of months in one period, used to scale the income-based fallback
+PERIOD_MONTHS = {'day': 12 / 365.25, 'week': 7 * 12 / 365.25, 'month': 1, 'quarter': 3}
+
+# Sliding window cap on the history used for fitting (None keeps everything)
+MAX_HISTORY_PERIODS = {'day': 365, 'week': 156, 'month': None, 'quarter': None}
+
+# Seasonal cycle length checked at each granularity (weekly cycle for daily data)
+SEASONAL_PERIODS = {'day': 7, 'week': 52, 'month': 12, 'quarter': 4}
+
+
+def detect_seasonality(values, period, min_cycles=2, acf_threshold=0.3, power_threshold=0.25):
+    """Flag the series in a matrix that have significant seasonal structure.
+
+    All series are tested together: each column is detrended, a periodogram is
+    computed with one real FFT along the time axis, and the share of spectral power
+    at the seasonal frequency and its harmonics is combined with the
+    autocorrelation at the seasonal lag.
+
+    Args:
+        values: Array of shape (periods, series), one column per series
+        period: Seasonal cycle length in periods (e.g. 12 for monthly data)
+        min_cycles: Minimum number of complete cycles needed to test a series
+        acf_threshold: Minimum autocorrelation at lag ``period``
+        power_threshold: Minimum share of non-zero-frequency power at the seasonal
+            frequencies
+
+    Returns:
+        Tuple of (flags, strength) arrays of length ``series``. ``strength`` is the
+        seasonal share of spectral power.
+    """
+    values = np.asarray(values, dtype=float)
+    if values.ndim == 1:
+        values = values[:, None]
+    n_periods, n_series = values.shape
+
+    flags = np.zeros(n_series, dtype=bool)
+    strength = np.zeros(n_series)
+    if n_periods < max(min_cycles, 2) * period or period < 2:
+        return flags, strength
+
+    # Remove each column's mean and linear trend
+    t = np.arange(n_periods, dtype=float)
+    t -= t.mean()
+    centered = values - values.mean(axis=0)
+    slope = (t @ centered) / (t @ t)
+    detrended = centered - np.outer(t, slope)
+
+    # Periodogram of every column in one FFT; bin 0 is dropped by the detrending
+    power = np.abs(np.fft.rfft(detrended, axis=0)) ** 2
+    total_power = power[1:].sum(axis=0)
+    harmonics = np.unique(np.rint(
+        n_periods * np.arange(1, period // 2 + 1) / period
+    ).astype(int))
+    harmonics = harmonics[(harmonics > 0) & (harmonics < power.shape[0])]
+    seasonal_power = power[harmonics].sum(axis=0)
+
+    # Autocorrelation at the seasonal lag
+    variance = (detrended ** 2).sum(axis=0)
+    lagged = (detrended[period:] * detrended[:-period]).sum(axis=0)
+
+    valid = (total_power > 0) & (variance > 0)
+    strength[valid] = seasonal_power[valid] / total_power[valid]
+    acf = np.zeros(n_series)
+    acf[valid] = lagged[valid] / variance[valid]
+
+    flags = valid & (strength >= power_threshold) & (acf >= acf_threshold)
+    return flags, strength
+
 
 class SpendingForecaster:
     """Forecasts user spending patterns based on historical transaction data.
@@ -29,56 +111,226 @@ class SpendingForecaster:
         """
         self.db_path = db_path
 
-    def get_user_spending_history(self, user_id: int) -> pd.DataFrame:
-        """Get monthly spending history by category for a user.
+        # Make sure the rollup tables exist for databases created by older versions
+        with sqlite3.connect(self.db_path) as conn:
+            ensure_schema(conn)
+
+    def get_user_spending_history(self, user_id: int, granularity: str = 'month',
+                                  max_periods=None) -> pd.DataFrame:
+        """Get spending history by category for a user.
+
+        Totals are bucketed in SQL. Monthly and quarterly buckets are read from the
+        ``monthly_rollups`` table; daily and weekly buckets are grouped directly on
+        ``transactions`` using the (user_id, transaction_date) index. Periods with no
+        spending are filled with zeros on a dense calendar index.
 
         Args:
             user_id: The ID of the user to retrieve spending history for
+            granularity: One of 'day', 'week', 'month' or 'quarter'
+            max_periods: Only return the most recent number of periods
 
         Returns:
-            DataFrame with months as index and categories as columns
+            DataFrame with periods as index and categories as columns
         """
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"Unsupported granularity: {granularity}")
+
+        freq, _, bucket_sql = GRANULARITIES[granularity]
+
         with sqlite3.connect(self.db_path) as conn:
-            query = """
+            if granularity in ('month', 'quarter'):
+                source = "monthly_rollups t"
+                bucket = bucket_sql.format(col="t.month || '-01'")
+                amount = "t.total_amount"
+                date_col = "t.month || '-01'"
+            else:
+                source = "transactions t"
+                bucket = bucket_sql.format(col="t.transaction_date")
+                amount = "t.amount"
+                date_col = "t.transaction_date"
+
+            params = [user_id]
+            window_filter = ""
+            if max_periods:
+                last_date = conn.execute(
+                    "SELECT MAX(transaction_date) FROM transactions WHERE user_id = ?",
+                    (user_id,)
+                ).fetchone()[0]
+                if last_date:
+                    first_period = pd.Period(last_date, freq=freq) - (max_periods - 1)
+                    window_filter = f"AND {date_col} >= ?"
+                    params.append(first_period.start_time.strftime('%Y-%m-%d'))
+
+            query = f"""
             SELECT
-                strftime('%Y-%m', transaction_date) as month,
+                {bucket} as period,
                 c.name as category,
-                SUM(amount) as total_amount
-            FROM transactions t
+                SUM({amount}) as total_amount
+            FROM {source}
             JOIN categories c ON t.category_id = c.category_id
-            WHERE t.user_id = ?
-            GROUP BY month, c.name
-            ORDER BY month, c.name
+            WHERE t.user_id = ? {window_filter}
+            GROUP BY period, c.name
+            ORDER BY period, c.name
             """
-            spending_history = pd.read_sql(query, conn, params=(user_id,))
+            spending_history = pd.read_sql(query, conn, params=params)
 
         # Pivot to get categories as columns
         if not spending_history.empty:
             spending_pivot = spending_history.pivot(
-                index='month',
+                index='period',
                 columns='category',
                 values='total_amount'
+            )
+
+            # Reindex on a dense calendar so missing periods count as zero spending
+            periods = pd.period_range(
+                pd.Period(spending_pivot.index[0], freq=freq),
+                pd.Period(spending_pivot.index[-1], freq=freq),
+                freq=freq
+            )
+            spending_pivot = spending_pivot.reindex(
+                self._period_labels(periods, granularity)
             ).fillna(0)
+            spending_pivot.index.name = granularity
             return spending_pivot
 
         return pd.DataFrame()
 
-    def forecast_spending(self, user_id, forecast_months=3):
+    @staticmethod
+    def _period_labels(periods: pd.PeriodIndex, granularity: str) -> pd.Index:
+        """Format periods as the string labels used in the history index."""
+        label_format = GRANULARITIES[granularity][1]
+        if granularity == 'quarter':
+            return periods.strftime(label_format)
+        return periods.start_time.strftime(label_format)
+
+    def _future_labels(self, last_label: str, steps: int, granularity: str) -> list:
+        """Labels for the ``steps`` periods following ``last_label``."""
+        freq = GRANULARITIES[granularity][0]
+        start = pd.Period(last_label, freq=freq) + 1
+        periods = pd.period_range(start, periods=steps, freq=freq)
+        return list(self._period_labels(periods, granularity))
+
+    def forecast_spending(self, user_id, forecast_months=3, granularity='month', engine='auto'):
         """Forecast future spending by category.
 
         Args:
             user_id: The ID of the user to forecast spending for
-            forecast_months: Number of months to forecast into the future
+            forecast_months: Number of periods (months by default) to forecast
+            granularity: One of 'day', 'week', 'month' or 'quarter'
+            engine: 'arima' fits one ARIMA model per category, 'vectorized' fits an
+                AR(1) model to all categories at once with NumPy. 'auto' uses ARIMA
+                for monthly and quarterly series and the vectorized engine for the
+                much longer daily and weekly series. Categories with significant
+                seasonality are routed to the seasonal variant of the engine.
 
         Returns:
             DataFrame with forecasted spending by category
         """
-        spending_history = self.get_user_spending_history(user_id)
+        spending_history = self.get_user_spending_history(
+            user_id,
+            granularity=granularity,
+            max_periods=MAX_HISTORY_PERIODS[granularity]
+        )
 
         if spending_history.empty or len(spending_history) < 3:
-            return self._generate_simple_forecast(user_id, forecast_months)
+            return self._generate_simple_forecast(user_id, forecast_months, granularity)
+
+        if engine == 'auto':
+            engine = 'vectorized' if granularity in ('day', 'week') else 'arima'
+
+        forecast_idx = self._future_labels(spending_history.index[-1], forecast_months, granularity)
+
+        # Recurring payments are known almost exactly: take them out of the history,
+        # model only the residual spending and add the scheduled payments back.
+        # The schedule is stepped on the calendar from the last payment, so its dates
+        # can be a few days off the real postings; only month and quarter buckets are
+        # wide enough for the subtraction to hit the same period as the posting.
+        labels = list(spending_history.index) + forecast_idx
+        if granularity in ('month', 'quarter'):
+            recurring = self._recurring_component(user_id, labels, granularity)
+        else:
+            recurring = pd.DataFrame(0.0, index=labels, columns=[])
+        recurring = recurring.reindex(columns=spending_history.columns, fill_value=0)
+        residual = (spending_history - recurring.loc[spending_history.index]).clip(lower=0)
+
+        # Categories that are entirely recurring need no model at all
+        modelled = residual.columns[(residual != 0).any()]
+        forecasts = {category: [0.0] * forecast_months for category in residual.columns}
+
+        period = SEASONAL_PERIODS[granularity]
+        seasonal, _ = detect_seasonality(residual[modelled].to_numpy(), period)
+        seasonal_history = residual[modelled].loc[:, seasonal]
+        plain_history = residual[modelled].loc[:, ~seasonal]
+
+        if engine == 'vectorized':
+            forecasts.update(self._forecast_vectorized(plain_history, forecast_months))
+            forecasts.update(self._forecast_seasonal_vectorized(
+                seasonal_history, forecast_months, period))
+        else:
+            forecasts.update(self._forecast_arima(plain_history, forecast_months))
+            forecasts.update(self._forecast_arima(
+                seasonal_history, forecast_months, seasonal_period=period))
 
+        # Create forecast dataframe
+        forecast_df = pd.DataFrame(index=forecast_idx, columns=spending_history.columns)
+
+        for category in spending_history.columns:
+            forecast_df[category] = forecasts[category]
+
+        return forecast_df + recurring.loc[forecast_idx]
+
+    def _recurring_component(self, user_id, labels, granularity):
+        """Spending from detected recurring payments in each period.
+
+        Args:
+            user_id: The ID of the user
+            labels: Period labels to cover, in order
+            granularity: One of 'day', 'week', 'month' or 'quarter'
+
+        Returns:
+            DataFrame with the labels as index and categories as columns
+        """
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                payments = pd.read_sql(
+                    """SELECT c.name as category, r.amount, r.cadence, r.last_date, r.occurrences
+                    FROM recurring_payments r
+                    JOIN categories c ON r.category_id = c.category_id
+                    WHERE r.user_id = ?""",
+                    conn,
+                    params=(user_id,)
+                )
+        except (sqlite3.OperationalError, pd.errors.DatabaseError):
+            # Recurring payments have not been detected for this database
+            payments = pd.DataFrame()
+
+        component = pd.DataFrame(0.0, index=labels, columns=[])
+        if payments.empty:
+            return component
+
+        freq = GRANULARITIES[granularity][0]
+        end_date = pd.Period(labels[-1], freq=freq).end_time.normalize()
+        schedule = recurring_schedule(payments, end_date)
+        schedule['period'] = self._period_labels(
+            pd.PeriodIndex(schedule['date'], freq=freq), granularity
+        )
+        totals = schedule.pivot_table(index='period', columns='category', values='amount', aggfunc='sum')
+        return totals.reindex(labels).fillna(0)
+
+    def _forecast_arima(self, spending_history, steps, seasonal_period=None):
+        """Fit an ARIMA(1, 0, 0) model per category.
+
+        Args:
+            spending_history: DataFrame with periods as index and categories as columns
+            steps: Number of periods to forecast
+            seasonal_period: If given, add a seasonal AR(1) term with this period
+
+        Returns:
+            Dictionary mapping each category to a list of forecasted values
+        """
         forecasts = {}
+        seasonal_order = (1, 0, 0, seasonal_period) if seasonal_period else (0, 0, 0, 0)
 
         # Forecast each category
         for category in spending_history.columns:
@@ -86,37 +338,103 @@ class SpendingForecaster:
 
             try:
                 # Simple ARIMA model for forecasting
-                model = ARIMA(category_data, order=(1, 0, 0))
+                model = ARIMA(category_data.to_numpy(), order=(1, 0, 0),
+                              seasonal_order=seasonal_order)
                 model_fit = model.fit()
 
                 # Generate forecast
-                forecast = model_fit.forecast(steps=forecast_months)
+                forecast = model_fit.forecast(steps=steps)
                 forecasts[category] = forecast.tolist()
-            except (ValueError, TypeError, RuntimeError):
+            except (ValueError, TypeError, RuntimeError, np.linalg.LinAlgError):
                 # Fallback to simple average if ARIMA fails
                 avg_spending = category_data.mean()
-                forecasts[category] = [avg_spending] * forecast_months
+                forecasts[category] = [avg_spending] * steps
 
-        # Create forecast dataframe
-        last_month = pd.to_datetime(spending_history.index[-1])
-        forecast_months_idx = [
-            (last_month + pd.DateOffset(months=i+1)).strftime('%Y-%m')
-            for i in range(forecast_months)
-        ]
+        return forecasts
 
-        forecast_df = pd.DataFrame(index=forecast_months_idx, columns=spending_history.columns)
+    @staticmethod
+    def _forecast_vectorized(spending_history, steps):
+        """Fit an AR(1) model with mean to every category in one pass.
 
-        for category in spending_history.columns:
-            forecast_df[category] = forecasts[category]
+        The autoregressive coefficient is the conditional least squares estimate
+        computed column-wise, so the cost is a handful of array operations no
+        matter how many categories or periods there are.
 
-        return forecast_df
+        Args:
+            spending_history: DataFrame with periods as index and categories as columns
+            steps: Number of periods to forecast
+
+        Returns:
+            Dictionary mapping each category to a list of forecasted values
+        """
+        values = spending_history.to_numpy(dtype=float)
+        mean = values.mean(axis=0)
+        centered = values - mean
+
+        lagged, current = centered[:-1], centered[1:]
+        denominator = (lagged ** 2).sum(axis=0)
+        phi = np.divide(
+            (lagged * current).sum(axis=0),
+            denominator,
+            out=np.zeros_like(denominator),
+            where=denominator > 0
+        )
+        # Keep the process stationary so long horizons revert to the mean
+        phi = np.clip(phi, -0.99, 0.99)
+
+        horizons = np.arange(1, steps + 1)[:, None]
+        predicted = mean + phi ** horizons * centered[-1]
+
+        return {
+            category: predicted[:, i].tolist()
+            for i, category in enumerate(spending_history.columns)
+        }
+
+    @classmethod
+    def _forecast_seasonal_vectorized(cls, spending_history, steps, period):
+        """Vectorized AR(1) forecast on top of a per-category seasonal profile.
+
+        The average deviation from the mean at each phase of the cycle is removed,
+        the deseasonalized series are forecast with the AR(1) engine and the profile
+        is added back for the forecast periods.
+
+        Args:
+            spending_history: DataFrame with periods as index and categories as columns
+            steps: Number of periods to forecast
+            period: Seasonal cycle length in periods
+
+        Returns:
+            Dictionary mapping each category to a list of forecasted values
+        """
+        if spending_history.empty:
+            return {}
+
+        values = spending_history.to_numpy(dtype=float)
+        n_periods = len(values)
+        phases = np.arange(n_periods) % period
+
+        # Mean deviation per phase: sum over periods with the same phase
+        deviations = values - values.mean(axis=0)
+        profile = np.zeros((period, values.shape[1]))
+        np.add.at(profile, phases, deviations)
+        profile /= np.bincount(phases, minlength=period)[:, None]
+
+        deseasonalized = pd.DataFrame(values - profile[phases], columns=spending_history.columns)
+        base = cls._forecast_vectorized(deseasonalized, steps)
+
+        future_phases = np.arange(n_periods, n_periods + steps) % period
+        return {
+            category: (np.asarray(base[category]) + profile[future_phases, i]).tolist()
+            for i, category in enumerate(spending_history.columns)
+        }
 
-    def _generate_simple_forecast(self, user_id, forecast_months):
+    def _generate_simple_forecast(self, user_id, forecast_months, granularity='month'):
         """Generate a simple forecast when not enough history is available.
 
         Args:
             user_id: The ID of the user to forecast spending for
-            forecast_months: Number of months to forecast into the future
+            forecast_months: Number of periods to forecast into the future
+            granularity: One of 'day', 'week', 'month' or 'quarter'
 
         Returns:
             DataFrame with estimated spending by category
@@ -149,14 +467,15 @@ class SpendingForecaster:
         }
 
         # Calculate average spending per category
-        avg_spending = income * 0.5  # Assume 50% of income is spent
+        avg_spending = income * 0.5 * PERIOD_MONTHS[granularity]  # Assume 50% of income is spent
         category_spending = {cat: avg_spending * weight for cat, weight in category_weights.items()}
 
         # Create forecast dataframe
-        forecast_months_idx = [
-            (datetime.now() + timedelta(days=30*i)).strftime('%Y-%m')
-            for i in range(1, forecast_months+1)
-        ]
+        current_label = self._period_labels(
+            pd.period_range(datetime.now(), periods=1, freq=GRANULARITIES[granularity][0]),
+            granularity
+        )[0]
+        forecast_months_idx = self._future_labels(current_label, forecast_months, granularity)
 
         forecast_df = pd.DataFrame(index=forecast_months_idx, columns=categories['name'])
 
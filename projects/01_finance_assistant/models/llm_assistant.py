@@ -5,25 +5,1434 @@ enhancing the chat capabilities of the Finance Assistant application.
 """
 
 import requests
+import asyncio
+import hashlib
 import json
+import math
 import os
-from typing import Dict, Any, List, Optional
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+from typing import Dict, Any, Iterator, List, Optional, Union
+
+import pandas as pd
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from utils.queries import FinanceQueries
+
+# Read timeout for the model list and availability checks, which Ollama answers
+# immediately even while it is generating
+METADATA_READ_TIMEOUT = 10.0
+
+# Added to the system prompt when the model answers with tools
+TOOL_INSTRUCTIONS = ("Use the tools to look up the figures a question needs before answering, "
+                     "and quote the amounts they return. Dates are YYYY-MM-DD.")
+
+# Context detail levels, most detailed first
+DETAIL_LEVELS = ('full', 'standard', 'brief')
+
+
+def create_session(pool_size: int = 10, retries: int = 2, backoff_factor: float = 0.3) -> requests.Session:
+    """Create a keep-alive HTTP session for the Ollama API.
+
+    Connections are pooled, so repeated calls skip the TCP handshake. Failed
+    connection attempts and 502/503/504 responses are retried with exponential
+    backoff. Reads are never retried, so a generation that already started is
+    not run twice.
+
+    Args:
+        pool_size: Maximum number of connections kept open per host
+        retries: Number of retries for connection errors and unavailable responses
+        backoff_factor: Base delay in seconds between retries (doubled each time)
+
+    Returns:
+        The configured session
+    """
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=0,
+        status=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset({'GET', 'POST'}),
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+@lru_cache(maxsize=None)
+def shared_session(pool_size: int = 10, retries: int = 2, backoff_factor: float = 0.3) -> requests.Session:
+    """Get the process-wide session for the given settings (see ``create_session``)."""
+    return create_session(pool_size=pool_size, retries=retries, backoff_factor=backoff_factor)
+
+
+def _shutdown_response(response: requests.Response):
+    """Shut down a response's connection so a read blocked on it returns at once."""
+    try:
+        shutdown = getattr(response.raw, 'shutdown', None)
+        if shutdown is not None:
+            shutdown()
+        else:
+            response.close()
+    except OSError:
+        pass
+
+
+class _Cancellation:
+    """A cancel flag that also runs the callbacks attached to it.
+
+    ``read_chunks()`` attaches a callback that shuts down its open response,
+    so cancelling from another thread ends a read that is blocked waiting for
+    Ollama's next line instead of leaving it until the line arrives.
+    """
+
+    def __init__(self):
+        """Initialize an unset flag."""
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+
+    def is_set(self) -> bool:
+        """Whether the request was cancelled."""
+        return self._event.is_set()
+
+    def set(self):
+        """Cancel, running every attached callback once."""
+        with self._lock:
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+            # Run under the lock so a callback never runs after detach() returned
+            for callback in callbacks:
+                callback()
+
+    def attach(self, callback):
+        """Run a callback on cancellation, or at once if already cancelled."""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+            callback()
+
+    def detach(self, callback):
+        """Stop running a callback on cancellation."""
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+
+def read_chunks(session: requests.Session, url: str, payload: Dict[str, Any], timeout,
+                cancellation: Optional[_Cancellation] = None) -> Iterator[Dict[str, Any]]:
+    """Send a request to Ollama and yield the JSON objects of its response.
+
+    A streamed response yields one object per line as it arrives. Any other
+    response yields its body once.
+
+    Args:
+        session: HTTP session to send the request through
+        url: The Ollama endpoint
+        payload: The request body
+        timeout: Connect and read timeouts
+        cancellation: Flag whose cancellation shuts the response down while it
+            is being read
+
+    Yields:
+        The response objects
+
+    Raises:
+        requests.HTTPError: If Ollama answers with an error status
+        requests.RequestException: If Ollama cannot be reached
+    """
+    with session.post(url, json=payload, stream=True, timeout=timeout) as response:
+        shutdown = partial(_shutdown_response, response)
+        if cancellation is not None:
+            cancellation.attach(shutdown)
+        try:
+            response.raise_for_status()
+            if not payload.get("stream", True):
+                yield response.json()
+                return
+            # Read each chunk as it arrives instead of waiting for a full buffer, and
+            # keep reading after the final "done" object so the stream ends cleanly
+            # and the connection goes back to the pool
+            for line in response.iter_lines(chunk_size=None):
+                if line:
+                    yield json.loads(line)
+        finally:
+            # Detach before the connection goes back to the pool for reuse
+            if cancellation is not None:
+                cancellation.detach(shutdown)
+
+
+class OllamaBusyError(RuntimeError):
+    """Raised when the request queue is full and a request is turned away."""
+
+
+class _QueuedRequest:
+    """A request waiting in, or being run by, an ``AsyncOllamaClient``."""
+
+    # Marks the end of a request's output
+    DONE = object()
+
+    def __init__(self, reader, url: str, payload: Dict[str, Any], timeout, deadline: Optional[float]):
+        """Initialize the request.
+
+        Args:
+            reader: Callable sending the request, like ``read_chunks()`` with its
+                session bound. It is passed the request's ``cancellation``.
+            url: The Ollama endpoint
+            payload: The request body
+            timeout: Connect and read timeouts for the HTTP call
+            deadline: ``time.monotonic()`` value the request must finish by (None
+                for no deadline)
+        """
+        self.reader = reader
+        self.url = url
+        self.payload = payload
+        self.timeout = timeout
+        self.deadline = deadline
+        self.output = queue.Queue()
+        self.cancelled = _Cancellation()
+        self.enqueued_at = time.monotonic()
+        # 'queued' until a worker starts it or the caller gives up on it
+        self.state = 'queued'
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left before the deadline (None without one)."""
+        return None if self.deadline is None else self.deadline - time.monotonic()
+
+    def run(self):
+        """Send the request and pass each response object to the waiting caller."""
+        chunks = self.reader(self.url, self.payload, self.timeout, cancellation=self.cancelled)
+        try:
+            for chunk in chunks:
+                if self.cancelled.is_set():
+                    break
+                remaining = self.remaining()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError("The request passed its deadline while generating")
+                self.output.put(chunk)
+        except Exception as e:
+            self.output.put(e)
+        finally:
+            # Closing the response mid-stream makes Ollama stop generating
+            chunks.close()
+            self.output.put(self.DONE)
+
+
+class AsyncOllamaClient:
+    """Process-wide queue that limits how many Ollama generations run at once.
+
+    Requests from every chat session go into one asyncio queue. A fixed number
+    of worker coroutines on a background event loop take them in order and run
+    each request's blocking HTTP call on a thread pool, so at most
+    ``max_in_flight`` generations reach Ollama at a time. The caller's thread
+    receives the response objects as they stream in.
+
+    At most ``max_queue`` requests wait for a slot. Beyond that a request is
+    turned away at once with ``OllamaBusyError``. A request that passes its
+    deadline while waiting or generating fails with ``TimeoutError``. A caller
+    that stops reading, for example because its Streamlit session went away,
+    cancels its request: a waiting request is skipped and a running one is
+    closed. ``metrics()`` reports the queue depth, in-flight count, outcomes
+    and queue waits.
+
+    The HTTP calls are blocking ``requests`` calls on worker threads, which
+    cannot be interrupted. Cancelling shuts down the open response's
+    connection, which ends a read waiting for Ollama's next line and makes
+    Ollama stop generating. There is no response to shut down while a request
+    is still connecting or waiting for the response headers, so such a
+    request keeps its thread and slot until the headers arrive or its
+    timeout expires.
+
+    Extra requests sent on behalf of a running one, such as an
+    ``EndpointPool`` hedge, take a slot with ``try_acquire_slot()`` so they
+    count against ``max_in_flight`` too.
+    """
+
+    def __init__(self, max_in_flight: int = 2, max_queue: int = 16, deadline: Optional[float] = 300.0,
+                 session: Optional[requests.Session] = None):
+        """Initialize the client and start its event loop.
+
+        Args:
+            max_in_flight: Maximum number of requests sent to Ollama at once
+            max_queue: Maximum number of requests waiting for a slot
+            deadline: Default seconds a request may take, waiting included
+                (None for no deadline)
+            session: HTTP session to send requests through (default: the shared
+                keep-alive session)
+        """
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.deadline = deadline
+        self.session = session if session is not None else shared_session()
+        self._lock = threading.Lock()
+        self._counts = {outcome: 0 for outcome in ('submitted', 'completed', 'failed', 'rejected',
+                                                   'timed_out', 'cancelled')}
+        self._in_flight = 0
+        self._queued = 0
+        self._waits = deque(maxlen=200)
+
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="ollama-request")
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="ollama-queue", daemon=True)
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._start_workers(), self._loop).result()
+
+    async def _start_workers(self):
+        """Create the queue and workers on the event loop."""
+        self._queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.max_in_flight)
+        self._workers = [asyncio.ensure_future(self._worker()) for _ in range(self.max_in_flight)]
+
+    async def _stop_workers(self):
+        """Cancel the workers and fail the requests still waiting."""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        while not self._queue.empty():
+            request = self._queue.get_nowait()
+            request.output.put(OllamaBusyError("The request queue was closed"))
+
+    async def _enqueue(self, request: _QueuedRequest) -> bool:
+        """Add a request to the queue unless the queue is full.
+
+        Requests the caller gave up on leave the count at once, so they never
+        hold a place while they wait to be skipped.
+
+        Returns:
+            True if the request was queued
+        """
+        with self._lock:
+            if self._queued + self._in_flight >= self.max_queue + self.max_in_flight:
+                return False
+            self._queued += 1
+        self._queue.put_nowait(request)
+        return True
+
+    async def _worker(self):
+        """Run queued requests one at a time until the loop stops."""
+        loop = asyncio.get_running_loop()
+        while True:
+            request = await self._queue.get()
+            if request.state != 'queued':
+                continue
+            # A hedged request may be holding a slot
+            await self._slots.acquire()
+            with self._lock:
+                # Skip requests whose caller has given up while they waited
+                if request.state != 'queued':
+                    self._slots.release()
+                    continue
+                request.state = 'running'
+                self._queued -= 1
+                self._in_flight += 1
+                self._waits.append(time.monotonic() - request.enqueued_at)
+            try:
+                await loop.run_in_executor(self._executor, request.run)
+            finally:
+                with self._lock:
+                    self._in_flight -= 1
+                self._slots.release()
+
+    async def _try_acquire_slot(self) -> bool:
+        """Take a free slot on the event loop without waiting for one."""
+        if self._slots.locked():
+            return False
+        await self._slots.acquire()
+        with self._lock:
+            self._in_flight += 1
+        return True
+
+    def try_acquire_slot(self) -> bool:
+        """Take a free request slot for an extra request, if one is free now.
+
+        Call from a thread other than the client's event loop, such as the one
+        running a request. Give the slot back with ``release_slot()``.
+
+        Returns:
+            True if a slot was taken
+        """
+        return asyncio.run_coroutine_threadsafe(self._try_acquire_slot(), self._loop).result()
+
+    def release_slot(self):
+        """Give back a slot taken with ``try_acquire_slot()``."""
+        with self._lock:
+            self._in_flight -= 1
+        if not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._slots.release)
+
+    def _count(self, outcome: str):
+        """Add one to an outcome's count."""
+        with self._lock:
+            self._counts[outcome] += 1
+
+    def stream(self, url: str, payload: Dict[str, Any], timeout=None,
+               deadline: Optional[float] = None, reader=None) -> Iterator[Dict[str, Any]]:
+        """Queue a request and yield the JSON objects of its response.
+
+        Args:
+            url: The Ollama endpoint
+            payload: The request body
+            timeout: Connect and read timeouts for the HTTP call
+            deadline: Seconds the request may take, waiting included (default:
+                the client's deadline)
+            reader: Callable that sends the request, such as
+                ``EndpointPool.read_chunks`` with a path for ``url`` (default:
+                ``read_chunks()`` with the client's session). It must accept a
+                ``cancellation`` keyword argument as ``read_chunks()`` does.
+
+        Yields:
+            The response objects, as ``read_chunks()`` does
+
+        Raises:
+            OllamaBusyError: If the queue is full
+            TimeoutError: If the request passes its deadline
+            requests.RequestException: If Ollama cannot be reached or fails
+        """
+        deadline = self.deadline if deadline is None else deadline
+        reader = reader if reader is not None else partial(read_chunks, self.session)
+        request = _QueuedRequest(reader, url, payload, timeout,
+                                 None if deadline is None else time.monotonic() + deadline)
+        if not asyncio.run_coroutine_threadsafe(self._enqueue(request), self._loop).result():
+            self._count('rejected')
+            raise OllamaBusyError(f"{self.max_queue} requests are already waiting for the model")
+        self._count('submitted')
+
+        outcome = 'cancelled'
+        try:
+            while True:
+                remaining = request.remaining()
+                try:
+                    item = request.output.get(timeout=None if remaining is None else max(remaining, 0))
+                except queue.Empty:
+                    outcome = 'timed_out'
+                    raise TimeoutError("The request passed its deadline waiting for the model")
+                if item is _QueuedRequest.DONE:
+                    outcome = 'completed'
+                    return
+                if isinstance(item, Exception):
+                    outcome = 'timed_out' if isinstance(item, TimeoutError) else 'failed'
+                    raise item
+                yield item
+        finally:
+            request.cancelled.set()
+            with self._lock:
+                self._counts[outcome] += 1
+                if request.state == 'queued':
+                    request.state = 'abandoned'
+                    self._queued -= 1
+
+    def metrics(self) -> Dict[str, Any]:
+        """Report the queue's current load and past outcomes.
+
+        Returns:
+            Dictionary with queued, in_flight, max_in_flight, max_queue, the counts
+            of submitted, completed, failed, rejected, timed_out and cancelled
+            requests, and the average and 95th percentile queue wait in seconds
+            over recent requests
+        """
+        with self._lock:
+            waits = sorted(self._waits)
+            metrics = {
+                'queued': self._queued,
+                'in_flight': self._in_flight,
+                'max_in_flight': self.max_in_flight,
+                'max_queue': self.max_queue,
+                **self._counts,
+            }
+        metrics['wait_avg'] = sum(waits) / len(waits) if waits else 0.0
+        metrics['wait_p95'] = waits[min(int(len(waits) * 0.95), len(waits) - 1)] if waits else 0.0
+        return metrics
+
+    def close(self):
+        """Stop the event loop and the request threads."""
+        asyncio.run_coroutine_threadsafe(self._stop_workers(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class _Endpoint:
+    """Load and health of one Ollama instance in an ``EndpointPool``."""
+
+    def __init__(self, base_url: str):
+        """Initialize the endpoint.
+
+        Args:
+            base_url: The base URL of the Ollama instance
+        """
+        self.base_url = base_url.rstrip('/')
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+        self.down_until = 0.0
+        self.latency: Optional[float] = None
+        # Models this instance has served recently, and likely still has loaded
+        self.recent_models: OrderedDict = OrderedDict()
+        # Models installed on the instance, once a health check has listed them
+        self.installed: Optional[List[str]] = None
+
+    def has_model(self, model: str) -> bool:
+        """Whether the last health check listed the model (True before any check)."""
+        if self.installed is None:
+            return True
+        # Installed names carry a tag; match requests made without one too
+        return model in self.installed or f"{model}:latest" in self.installed
+
+    def healthy(self, now: float) -> bool:
+        """Whether the endpoint is outside its failure cooldown."""
+        return now >= self.down_until
+
+    def status(self, now: float) -> Dict[str, Any]:
+        """Describe the endpoint for ``EndpointPool.status()``."""
+        return {
+            'base_url': self.base_url,
+            'healthy': self.healthy(now),
+            'outstanding': self.outstanding,
+            'requests': self.requests,
+            'failures': self.failures,
+            'latency': self.latency,
+            'models': list(self.recent_models),
+            'installed': list(self.installed) if self.installed is not None else None,
+        }
+
+
+class EndpointPool:
+    """Spreads Ollama requests over several instances.
+
+    Each request goes to the healthy endpoint with the fewest requests in
+    progress. With ``balancing="model_affinity"``, endpoints that served the
+    same model recently come first, since they most likely still have it
+    loaded. Endpoints whose health check showed the model is not installed
+    are skipped.
+
+    An endpoint that fails ``failure_threshold`` times in a row, or fails a
+    health check, is left out for ``cooldown`` seconds. A request that fails before its first response
+    object is retried on the next endpoint. With ``hedge_after`` set, a
+    request with no response after that many seconds is also sent to a second
+    endpoint. The first endpoint to answer wins, and the other request is
+    closed. When requests go through an ``AsyncOllamaClient``, pass it as
+    ``slots`` so a hedge is only sent while the client has a free slot.
+    """
+
+    BALANCING = ('least_outstanding', 'model_affinity')
+
+    def __init__(self, base_urls: List[str], session: Optional[requests.Session] = None,
+                 balancing: str = 'least_outstanding', failure_threshold: int = 2, cooldown: float = 30.0,
+                 hedge_after: Optional[float] = None, affinity_size: int = 3):
+        """Initialize the pool.
+
+        Args:
+            base_urls: Base URLs of the Ollama instances
+            session: HTTP session to send requests through (default: the shared
+                keep-alive session)
+            balancing: "least_outstanding" or "model_affinity"
+            failure_threshold: Consecutive failures that take an endpoint out
+            cooldown: Seconds a failed endpoint is left out
+            hedge_after: Seconds to wait for a response before sending the request
+                to a second endpoint as well (None to never hedge)
+            affinity_size: Recently served models remembered per endpoint
+        """
+        if not base_urls:
+            raise ValueError("An endpoint pool needs at least one base URL")
+        if balancing not in self.BALANCING:
+            raise ValueError(f"Unsupported balancing: {balancing}")
+        self.endpoints = [_Endpoint(base_url) for base_url in base_urls]
+        self.session = session if session is not None else shared_session()
+        self.balancing = balancing
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.hedge_after = hedge_after
+        self.affinity_size = affinity_size
+        self.hedged = 0
+        self.hedge_wins = 0
+        self._lock = threading.Lock()
+
+    @property
+    def base_urls(self) -> List[str]:
+        """The base URLs of the endpoints, in the order given."""
+        return [endpoint.base_url for endpoint in self.endpoints]
+
+    def _acquire(self, model: Optional[str], exclude=()) -> Optional[_Endpoint]:
+        """Pick the endpoint for a request and count the request against it.
+
+        Returns:
+            The endpoint, or None when every endpoint is excluded
+        """
+        with self._lock:
+            now = time.monotonic()
+            candidates = [endpoint for endpoint in self.endpoints if endpoint not in exclude]
+            if model is not None:
+                # Leave out endpoints known not to have the model, unless that is all of them
+                candidates = [endpoint for endpoint in candidates if endpoint.has_model(model)] or candidates
+            if not candidates:
+                return None
+
+            # Endpoints in cooldown are only tried once every other one is
+            healthy = [endpoint for endpoint in candidates if endpoint.healthy(now)]
+            if healthy:
+                candidates = healthy
+            else:
+                candidates = [min(candidates, key=lambda endpoint: endpoint.down_until)]
+            if self.balancing == 'model_affinity' and model is not None:
+                candidates = [endpoint for endpoint in candidates if model in endpoint.recent_models] or candidates
+
+            endpoint = min(candidates, key=lambda endpoint: (
+                endpoint.outstanding, endpoint.latency if endpoint.latency is not None else 0.0
+            ))
+            endpoint.outstanding += 1
+            endpoint.requests += 1
+            return endpoint
+
+    def _release(self, endpoint: _Endpoint):
+        """Mark a request to an endpoint as finished."""
+        with self._lock:
+            endpoint.outstanding -= 1
+
+    def _record_first_response(self, endpoint: _Endpoint, model: Optional[str], latency: float):
+        """Record a healthy answer and its time to the first response object."""
+        with self._lock:
+            endpoint.failures = 0
+            endpoint.down_until = 0.0
+            endpoint.latency = latency if endpoint.latency is None else 0.7 * endpoint.latency + 0.3 * latency
+            if model is not None:
+                endpoint.recent_models[model] = True
+                endpoint.recent_models.move_to_end(model)
+                while len(endpoint.recent_models) > self.affinity_size:
+                    endpoint.recent_models.popitem(last=False)
+
+    def _record_failure(self, endpoint: _Endpoint):
+        """Count a failure, taking the endpoint out once there are enough in a row."""
+        with self._lock:
+            endpoint.failures += 1
+            if endpoint.failures >= self.failure_threshold:
+                endpoint.down_until = time.monotonic() + self.cooldown
+
+    @staticmethod
+    def _retryable(error: Exception) -> bool:
+        """Whether another endpoint might succeed where this one failed."""
+        if isinstance(error, requests.HTTPError):
+            # Missing model or a server error; a bad request fails everywhere
+            return error.response.status_code == 404 or error.response.status_code >= 500
+        return isinstance(error, requests.RequestException)
+
+    def read_chunks(self, path: str, payload: Dict[str, Any], timeout, slots=None,
+                    cancellation: Optional[_Cancellation] = None) -> Iterator[Dict[str, Any]]:
+        """Send a request to the pool and yield the JSON objects of its response.
+
+        Takes the same arguments as ``read_chunks()``, with a path such as
+        "/api/generate" in place of the full URL. ``slots`` is an object with
+        ``try_acquire_slot()`` and ``release_slot()``, such as the
+        ``AsyncOllamaClient`` running the request; hedges wait for one of its
+        slots (None to hedge without a limit).
+
+        Raises:
+            requests.HTTPError: If Ollama answers with an error status
+            requests.RequestException: If no endpoint can be reached
+        """
+        if self.hedge_after is not None and len(self.endpoints) > 1:
+            yield from self._read_hedged(path, payload, timeout, slots, cancellation)
+            return
+
+        model = payload.get('model')
+        tried = []
+        last_error = None
+        while True:
+            endpoint = self._acquire(model, exclude=tried)
+            if endpoint is None:
+                raise last_error
+            tried.append(endpoint)
+            started = time.monotonic()
+            answered = False
+            try:
+                for chunk in read_chunks(self.session, endpoint.base_url + path, payload, timeout,
+                                         cancellation):
+                    if not answered:
+                        answered = True
+                        self._record_first_response(endpoint, model, time.monotonic() - started)
+                    yield chunk
+                return
+            except requests.RequestException as e:
+                # A request shut down by its caller says nothing about the endpoint
+                if cancellation is not None and cancellation.is_set():
+                    raise
+                if not isinstance(e, requests.HTTPError) or e.response.status_code >= 500:
+                    self._record_failure(endpoint)
+                # A response that already started cannot be moved to another endpoint
+                if answered or not self._retryable(e):
+                    raise
+                last_error = e
+            finally:
+                self._release(endpoint)
+
+    def _read_hedged(self, path: str, payload: Dict[str, Any], timeout, slots=None,
+                     cancellation: Optional[_Cancellation] = None) -> Iterator[Dict[str, Any]]:
+        """Read a response, sending the request to a second endpoint if the first is slow."""
+        model = payload.get('model')
+        results = queue.Queue()
+        attempts = []
+        done = object()
+
+        def attempt(endpoint, cancelled, slot):
+            started = time.monotonic()
+            answered = False
+            chunks = read_chunks(self.session, endpoint.base_url + path, payload, timeout, cancelled)
+            try:
+                for chunk in chunks:
+                    if cancelled.is_set():
+                        break
+                    if not answered:
+                        answered = True
+                        self._record_first_response(endpoint, model, time.monotonic() - started)
+                    results.put((endpoint, chunk))
+                results.put((endpoint, done))
+            except Exception as e:
+                if cancelled.is_set():
+                    results.put((endpoint, done))
+                    return
+                if not isinstance(e, requests.HTTPError) or e.response.status_code >= 500:
+                    self._record_failure(endpoint)
+                results.put((endpoint, e))
+            finally:
+                chunks.close()
+                if cancellation is not None:
+                    cancellation.detach(cancelled.set)
+                self._release(endpoint)
+                if slot:
+                    slots.release_slot()
+
+        def start(exclude, slot=False):
+            endpoint = self._acquire(model, exclude=exclude)
+            if endpoint is None:
+                return False
+            # Cancelling the caller's request also shuts this attempt down
+            cancelled = _Cancellation()
+            if cancellation is not None:
+                cancellation.attach(cancelled.set)
+            attempts.append((endpoint, cancelled))
+            threading.Thread(target=attempt, args=(endpoint, cancelled, slot), name="ollama-hedge",
+                             daemon=True).start()
+            return True
+
+        start(())
+        winner = None
+        failed = 0
+        last_error = None
+        try:
+            while True:
+                wait = self.hedge_after if winner is None and len(attempts) == 1 else None
+                try:
+                    endpoint, item = results.get(timeout=wait)
+                except queue.Empty:
+                    # No answer yet: race a second endpoint against the first, if
+                    # the client has a free slot for it (otherwise check again later)
+                    if slots is not None and not slots.try_acquire_slot():
+                        continue
+                    if start([tried for tried, _ in attempts], slot=slots is not None):
+                        with self._lock:
+                            self.hedged += 1
+                    elif slots is not None:
+                        slots.release_slot()
+                    continue
+
+                if cancellation is not None and cancellation.is_set():
+                    return
+                if winner is not None and endpoint is not winner:
+                    continue
+                if isinstance(item, Exception):
+                    if winner is not None or not self._retryable(item):
+                        raise item
+                    failed += 1
+                    last_error = item
+                    # Fail over when every attempt so far has failed
+                    if failed == len(attempts) and not start([tried for tried, _ in attempts]):
+                        raise last_error
+                    continue
+                if winner is None:
+                    winner = endpoint
+                    if len(attempts) > 1 and endpoint is not attempts[0][0]:
+                        with self._lock:
+                            self.hedge_wins += 1
+                    for other, cancelled in attempts:
+                        if other is not winner:
+                            cancelled.set()
+                if item is done:
+                    return
+                yield item
+        finally:
+            for _, cancelled in attempts:
+                cancelled.set()
+
+    def check(self, timeout=2.0, session: Optional[requests.Session] = None) -> List[Dict[str, Any]]:
+        """Probe every endpoint's model list to update its health.
+
+        An endpoint that does not answer is taken out at once, since a failed
+        probe means the server is down rather than one request going wrong.
+
+        Args:
+            timeout: Seconds to wait for each endpoint, or a (connect, read) pair
+            session: HTTP session to probe through (default: the pool's session)
+
+        Returns:
+            The pool's status after the check
+        """
+        session = session if session is not None else self.session
+        for endpoint in self.endpoints:
+            try:
+                response = session.get(f"{endpoint.base_url}/api/tags", timeout=timeout)
+                response.raise_for_status()
+                installed = [model["name"] for model in response.json().get("models", [])]
+            except (requests.RequestException, ValueError):
+                with self._lock:
+                    endpoint.failures += 1
+                    endpoint.down_until = time.monotonic() + self.cooldown
+                continue
+            with self._lock:
+                endpoint.installed = installed
+                endpoint.failures = 0
+                endpoint.down_until = 0.0
+        return self.status()
+
+    def status(self) -> List[Dict[str, Any]]:
+        """Report each endpoint's health, load and recent models."""
+        with self._lock:
+            now = time.monotonic()
+            return [endpoint.status(now) for endpoint in self.endpoints]
+
+
+class ResponseCache:
+    """Exact-match cache of LLM answers.
+
+    Entries are keyed on a hash of everything that determines the answer: model,
+    sampling settings, system prompt, prompt (formatted context plus question)
+    and the user's data version. A change to the user's data therefore never
+    serves an old answer; the orphaned entries age out. The in-memory tier is an
+    LRU with a TTL. With ``db_path`` set, answers are also written to the
+    ``llm_response_cache`` table, so they survive restarts and are shared between
+    processes.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: float = 3600.0, db_path: Optional[str] = None):
+        """Initialize the cache.
+
+        Args:
+            max_entries: Maximum number of answers kept in memory
+            ttl: Seconds an answer stays valid
+            db_path: Path to a SQLite database for the persistent tier (default: memory only)
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.db_path = db_path
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        if self.db_path:
+            with sqlite3.connect(self.db_path) as conn:
+                conn.execute('''
+                CREATE TABLE IF NOT EXISTS llm_response_cache (
+                    key TEXT PRIMARY KEY,
+                    answer TEXT,
+                    created_at REAL
+                ) WITHOUT ROWID
+                ''')
+                conn.execute("DELETE FROM llm_response_cache WHERE created_at < ?", (time.time() - self.ttl,))
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        """Hash the inputs of a generation into a cache key."""
+        return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Look up an answer.
+
+        Args:
+            key: Key from ``make_key``
+
+        Returns:
+            The cached answer, or None on a miss or an expired entry
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[1] <= self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+
+        if self.db_path:
+            conn = sqlite3.connect(self.db_path)
+            try:
+                row = conn.execute(
+                    "SELECT answer, created_at FROM llm_response_cache WHERE key = ? AND created_at >= ?",
+                    (key, now - self.ttl)
+                ).fetchone()
+            finally:
+                conn.close()
+            if row is not None:
+                with self._lock:
+                    self._store(key, row[0], row[1])
+                    self.hits += 1
+                return row[0]
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, answer: str):
+        """Store an answer.
+
+        Args:
+            key: Key from ``make_key``
+            answer: The generated answer
+        """
+        created_at = time.time()
+        with self._lock:
+            self._store(key, answer, created_at)
+
+        if self.db_path:
+            conn = sqlite3.connect(self.db_path)
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO llm_response_cache (key, answer, created_at) VALUES (?, ?, ?)",
+                    (key, answer, created_at)
+                )
+                conn.commit()
+            finally:
+                conn.close()
+
+    def _store(self, key: str, answer: str, created_at: float):
+        """Insert into the memory tier, evicting the least recently used entries."""
+        self._entries[key] = (answer, created_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        """Remove every cached answer from both tiers."""
+        with self._lock:
+            self._entries.clear()
+        if self.db_path:
+            with sqlite3.connect(self.db_path) as conn:
+                conn.execute("DELETE FROM llm_response_cache")
+
+
+class ConversationMemory:
+    """Bounded conversation memory: recent turns plus a rolling summary.
+
+    The last ``max_messages`` messages are kept verbatim. Older messages are
+    folded into a running summary by ``summarizer`` on a background thread, so
+    adding a message never waits on the model and the memory stays the same
+    size however long the conversation runs. If the summarizer fails, a short
+    extractive summary is used instead. The memory may outlive the assistant
+    that writes to it, so an assistant passes its own summarizer with each
+    message rather than binding one to the memory.
+    """
+
+    def __init__(self, max_messages: int = 12, summarizer=None, max_summary_chars: int = 1500,
+                 background: bool = True):
+        """Initialize the memory.
+
+        Args:
+            max_messages: Number of recent messages kept verbatim
+            summarizer: Callable taking (summary, messages) and returning the new
+                summary, used when ``append`` is not given one (default: extractive)
+            max_summary_chars: Maximum length of the summary
+            background: Whether to summarize on a background thread
+        """
+        self.max_messages = max_messages
+        self.summarizer = summarizer
+        self.max_summary_chars = max_summary_chars
+        self.background = background
+        self.messages: List[Dict[str, str]] = []
+        self.summary = ""
+        # Ollama's token state after the last answer, and what it was built from
+        self.model_context: Optional[List[int]] = None
+        self.model_context_key: Optional[str] = None
+        self._pending: List[Dict[str, str]] = []
+        self._pending_summarizer = None
+        self._lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+
+    def append(self, role: str, content: str, summarizer=None):
+        """Add a message, moving the oldest ones out to be summarized.
+
+        Args:
+            role: "user" or "assistant"
+            content: The message text
+            summarizer: Summarizer for the messages this call moves out
+                (default: the memory's own)
+        """
+        with self._lock:
+            self.messages.append({"role": role, "content": content})
+            overflow = len(self.messages) - self.max_messages
+            if overflow <= 0:
+                return
+            self._pending.extend(self.messages[:overflow])
+            self._pending_summarizer = summarizer
+            del self.messages[:overflow]
+            if self._worker is not None:
+                return
+            if self.background:
+                self._worker = threading.Thread(target=self._summarize_pending, name="conversation-summary",
+                                                daemon=True)
+                self._worker.start()
+                return
+            self._worker = threading.current_thread()
+        self._summarize_pending()
+
+    def _summarize_pending(self):
+        """Fold pending messages into the summary until none are left."""
+        while True:
+            with self._lock:
+                batch, self._pending = self._pending, []
+                if not batch:
+                    self._worker = None
+                    return
+                summary = self.summary
+                summarizer = self._pending_summarizer or self.summarizer or self.extractive_summary
+
+            try:
+                summary = summarizer(summary, batch)
+            except Exception:
+                summary = self.extractive_summary(summary, batch)
+
+            with self._lock:
+                self.summary = self._trim(summary)
+
+    def _trim(self, summary: str) -> str:
+        """Keep the most recent part of a summary, cut at a line boundary."""
+        summary = summary.strip()
+        if len(summary) <= self.max_summary_chars:
+            return summary
+        summary = summary[-self.max_summary_chars:]
+        return summary[summary.find('\n') + 1:] if '\n' in summary else summary
+
+    @staticmethod
+    def extractive_summary(summary: str, messages: List[Dict[str, str]]) -> str:
+        """Summarize messages by their opening sentence, appended to the summary."""
+        lines = [summary] if summary else []
+        for message in messages:
+            first_sentence = message["content"].strip().split('\n')[0].split('. ')[0][:200]
+            lines.append(f"{'User asked' if message['role'] == 'user' else 'Assistant said'}: {first_sentence}")
+        return '\n'.join(lines)
+
+    def wait(self, timeout: Optional[float] = None):
+        """Wait for a running summary update to finish."""
+        worker = self._worker
+        if worker is not None and worker is not threading.current_thread():
+            worker.join(timeout)
+
+    def prompt_context(self) -> str:
+        """Format the summary and recent messages for a prompt ('' if empty)."""
+        with self._lock:
+            sections = []
+            if self.summary:
+                sections.append(f"Earlier in this conversation:\n{self.summary}")
+            if self.messages:
+                turns = '\n'.join(f"{message['role'].title()}: {message['content']}" for message in self.messages)
+                sections.append(f"Recent conversation:\n{turns}")
+        return '\n\n'.join(sections)
+
+    def clear(self):
+        """Forget every message, the summary and the model's token state."""
+        self.wait()
+        with self._lock:
+            self.messages = []
+            self._pending = []
+            self._pending_summarizer = None
+            self.summary = ""
+            self.model_context = None
+            self.model_context_key = None
+
+
+class FinancialContextBuilder:
+    """Builds the financial summary sent with each question, sized to a token budget.
+
+    The summary is rendered at every detail level once per user and data
+    version and kept in an LRU cache, so repeated questions only pick a cached
+    string. The most detailed level whose estimated token count fits the budget
+    is used, which keeps prompt processing time flat as a user's history grows.
+    """
+
+    def __init__(self, token_budget: int = 768, chars_per_token: float = 4.0, cache_size: int = 128):
+        """Initialize the builder.
+
+        Args:
+            token_budget: Maximum estimated tokens for the financial context
+            chars_per_token: Average characters per token used for estimates
+            cache_size: Number of rendered summaries kept
+        """
+        self.token_budget = token_budget
+        self.chars_per_token = chars_per_token
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def estimate_tokens(self, text: str) -> int:
+        """Estimate the number of tokens in a text from its length."""
+        return math.ceil(len(text) / self.chars_per_token)
+
+    def build(self, financial_data: Dict[str, Any], token_budget: Optional[int] = None) -> str:
+        """Get the context for a question.
+
+        Args:
+            financial_data: Dictionary containing the user's financial data; with a
+                ``data_version`` the rendered levels are cached
+            token_budget: Override for the builder's budget
+
+        Returns:
+            Formatted context string
+        """
+        budget = token_budget if token_budget is not None else self.token_budget
+
+        # The merchant lookup depends on the question, so it is never cached
+        merchant_line = self.merchant_line(financial_data)
+        budget -= self.estimate_tokens(merchant_line)
+
+        levels = self._levels(financial_data)
+        for level in DETAIL_LEVELS:
+            if self.estimate_tokens(levels[level]) <= budget:
+                return levels[level] + merchant_line
+
+        # Even the brief summary is too long: cut it to the budget
+        return levels['brief'][:max(int(budget * self.chars_per_token), 0)] + merchant_line
+
+    @staticmethod
+    def merchant_line(financial_data: Dict[str, Any]) -> str:
+        """Format the merchant lookup for the current question ('' without one)."""
+        merchant_search = financial_data.get('merchant_search', None)
+        if not merchant_search:
+            return ""
+        return (f"- Spending at {merchant_search['merchant']}: ${merchant_search['total']:,.2f} "
+                f"across {merchant_search['count']} transactions "
+                f"({merchant_search['first_date']} to {merchant_search['last_date']})\n")
+
+    def _levels(self, financial_data: Dict[str, Any]) -> Dict[str, str]:
+        """Get the rendered levels, from the cache when the data version is known."""
+        data_version = financial_data.get('data_version', None)
+        if data_version is None:
+            return self.render_levels(financial_data)
+
+        user_info = financial_data.get('user_info', {}) or {}
+        key = (user_info.get('user_id', user_info.get('name')), data_version)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        levels = self.render_levels(financial_data)
+        with self._lock:
+            self._cache[key] = levels
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return levels
+
+    @staticmethod
+    def render_levels(financial_data: Dict[str, Any]) -> Dict[str, str]:
+        """Render the financial summary at every detail level.
+
+        Args:
+            financial_data: Dictionary containing the user's financial data
+
+        Returns:
+            Dictionary of detail level to context string
+        """
+        lines = {level: ["Financial Data Summary:"] for level in DETAIL_LEVELS}
+
+        def add(text, levels=DETAIL_LEVELS):
+            for level in levels:
+                lines[level].append(text)
+
+        # User info
+        user_info = financial_data.get('user_info', {})
+        if user_info:
+            add(f"- Name: {user_info.get('name', 'Unknown')}")
+            add(f"- Monthly Income: ${user_info.get('income', 0):,.2f}")
+
+        # Spending summary
+        spending_history = financial_data.get('spending_history', None)
+        if spending_history is not None and hasattr(spending_history, 'empty') and not spending_history.empty:
+            monthly_totals = spending_history.sum(axis=1)
+            avg_monthly_spending = monthly_totals.mean()
+            category_totals = spending_history.sum().sort_values(ascending=False)
+            category_lines = [f"  * {cat}: ${amount:.2f} ({amount/avg_monthly_spending*100:.1f}%)"
+                              for cat, amount in category_totals.items()]
+
+            add(f"- Average Monthly Spending: ${avg_monthly_spending:,.2f}")
+            add(f"- Top Spending Category: {category_totals.index[0]}", ('brief',))
+            add("- Top Spending Categories:", ('standard',))
+            add('\n'.join(category_lines[:3]), ('standard',))
+            add("- Spending by Category:", ('full',))
+            add('\n'.join(category_lines), ('full',))
+            recent_totals = ', '.join(f"{period}: ${total:,.2f}" for period, total in monthly_totals.tail(3).items())
+            add(f"- Last Months: {recent_totals}", ('full',))
+
+        # Recent transactions
+        transactions = financial_data.get('transactions', None)
+        if transactions is not None and hasattr(transactions, 'empty') and not transactions.empty:
+            recent = transactions.head(10)
+            dates = pd.to_datetime(recent['transaction_date']).dt.strftime('%Y-%m-%d')
+            transaction_lines = [f"  * ${amount:.2f} for {category} on {date}"
+                                 for amount, category, date in zip(recent['amount'], recent['category'], dates)]
+            add("- Recent Transactions:", ('full', 'standard'))
+            add('\n'.join(transaction_lines[:3]), ('standard',))
+            add('\n'.join(transaction_lines), ('full',))
+
+        # Forecast
+        forecast = financial_data.get('forecast', None)
+        if forecast is not None and hasattr(forecast, 'empty') and not forecast.empty:
+            next_month = forecast.iloc[0]
+            add(f"- Forecast for Next Month: ${next_month.sum():,.2f}")
+            top_forecast = ', '.join(f"{cat}: ${amount:,.2f}" for cat, amount in next_month.nlargest(3).items())
+            add(f"- Largest Forecast Categories: {top_forecast}", ('full',))
+
+        return {level: '\n'.join(level_lines) + '\n' for level, level_lines in lines.items()}
+
+
+class FinanceTools:
+    """Query tools the model can call to look up a user's data on demand.
+
+    Each tool is a cheap indexed query from ``FinanceQueries`` (or a lookup in
+    the forecast already computed for the user) and returns a small JSON
+    result, so the model fetches only the figures a question needs instead of
+    receiving a summary of everything.
+    """
+
+    # Ollama tool definitions, one per method of the same name
+    DEFINITIONS = [
+        {
+            "type": "function",
+            "function": {
+                "name": "category_totals",
+                "description": "Total spending per category between two dates.",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "start_date": {"type": "string", "description": "First date, YYYY-MM-DD"},
+                        "end_date": {"type": "string", "description": "Last date, YYYY-MM-DD"},
+                        "category": {"type": "string", "description": "Only this category"},
+                    },
+                },
+            },
+        },
+        {
+            "type": "function",
+            "function": {
+                "name": "top_merchants",
+                "description": "Merchants the user spent the most at between two dates.",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "start_date": {"type": "string", "description": "First date, YYYY-MM-DD"},
+                        "end_date": {"type": "string", "description": "Last date, YYYY-MM-DD"},
+                        "limit": {"type": "integer", "description": "Number of merchants (default 5)"},
+                    },
+                },
+            },
+        },
+        {
+            "type": "function",
+            "function": {
+                "name": "forecast",
+                "description": "Forecast spending for the coming months, in total or for one category.",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "category": {"type": "string", "description": "Only this category"},
+                    },
+                },
+            },
+        },
+        {
+            "type": "function",
+            "function": {
+                "name": "search_transactions",
+                "description": "Find transactions whose description mentions a merchant or word.",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "query": {"type": "string", "description": "Merchant name or words to search for"},
+                        "start_date": {"type": "string", "description": "First date, YYYY-MM-DD"},
+                        "end_date": {"type": "string", "description": "Last date, YYYY-MM-DD"},
+                    },
+                    "required": ["query"],
+                },
+            },
+        },
+    ]
+
+    def __init__(self, db_path: str, user_id: int, forecast: Optional[pd.DataFrame] = None,
+                 max_rows: int = 10):
+        """Initialize the tools for one user.
+
+        Args:
+            db_path: Path to the SQLite database
+            user_id: The user whose data the tools read
+            forecast: Forecast spending (periods by categories), if one was computed
+            max_rows: Maximum number of rows a tool returns
+        """
+        self.queries = FinanceQueries(db_path)
+        self.user_id = user_id
+        self.forecast_data = forecast
+        self.max_rows = max_rows
+
+    def overview(self) -> str:
+        """Describe the data the tools cover, so the model can pick arguments."""
+        first_date, last_date = self.queries.activity_span(self.user_id)
+        if first_date is None:
+            return "The user has no transactions yet."
+        categories = self.queries.spending_aggregate(self.user_id, granularity=None)['category']
+        return (f"The user's transactions run from {first_date} to {last_date}. "
+                f"Spending categories: {', '.join(categories)}.")
+
+    def data_version(self) -> int:
+        """The user's data version, for caching answers built from the tools."""
+        return self.queries.data_version(self.user_id)
+
+    def call(self, name: str, arguments: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Run a tool the model asked for.
+
+        Args:
+            name: The tool's name
+            arguments: The tool's arguments
+
+        Returns:
+            The tool's result, or a dictionary with an ``error`` message the model
+            can read and correct
+        """
+        if name not in {definition["function"]["name"] for definition in self.DEFINITIONS}:
+            return {"error": f"Unknown tool: {name}"}
+        try:
+            return getattr(self, name)(**(arguments or {}))
+        except (TypeError, ValueError) as e:
+            return {"error": f"Invalid arguments for {name}: {e}"}
+
+    def category_totals(self, start_date: Optional[str] = None, end_date: Optional[str] = None,
+                        category: Optional[str] = None) -> Dict[str, Any]:
+        """Total spending per category between two dates."""
+        totals = self.queries.spending_aggregate(
+            self.user_id, start_date or None, end_date or None,
+            categories=[category] if category else None, granularity=None
+        ).sort_values('total', ascending=False)
+        return {
+            "start_date": start_date, "end_date": end_date,
+            "total": round(float(totals['total'].sum()), 2),
+            "categories": [{"category": row.category, "total": round(float(row.total), 2), "count": int(row.count)}
+                           for row in totals.head(self.max_rows).itertuples()],
+        }
+
+    def top_merchants(self, start_date: Optional[str] = None, end_date: Optional[str] = None,
+                      limit: int = 5) -> Dict[str, Any]:
+        """Merchants the user spent the most at between two dates."""
+        merchants = self.queries.top_merchants(self.user_id, start_date or None, end_date or None,
+                                               limit=min(int(limit), self.max_rows))
+        return {
+            "start_date": start_date, "end_date": end_date,
+            "merchants": [{"merchant": row.merchant, "total": round(float(row.total), 2), "count": int(row.count)}
+                          for row in merchants.itertuples()],
+        }
+
+    def forecast(self, category: Optional[str] = None) -> Dict[str, Any]:
+        """Forecast spending for the coming months, in total or for one category."""
+        if self.forecast_data is None or self.forecast_data.empty:
+            return {"error": "No forecast is available for this user."}
+        if category and category not in self.forecast_data.columns:
+            return {"error": f"No forecast for category {category}. "
+                             f"Categories: {', '.join(self.forecast_data.columns)}"}
+        values = self.forecast_data[category] if category else self.forecast_data.sum(axis=1)
+        return {
+            "category": category or "all",
+            "periods": [{"period": str(period), "amount": round(float(amount), 2)}
+                        for period, amount in values.head(self.max_rows).items()],
+        }
+
+    def search_transactions(self, query: str, start_date: Optional[str] = None,
+                            end_date: Optional[str] = None) -> Dict[str, Any]:
+        """Find transactions whose description mentions a merchant or word."""
+        summary = self.queries.search_summary(self.user_id, query, start_date or None, end_date or None)
+        matches = self.queries.search_transactions(self.user_id, query, start_date or None, end_date or None,
+                                                   limit=self.max_rows)
+        return {
+            "query": query,
+            "total": round(summary['total'], 2),
+            "count": summary['count'],
+            "first_date": summary['first_date'],
+            "last_date": summary['last_date'],
+            "latest": [{"date": row.transaction_date, "amount": round(float(row.amount), 2),
+                        "category": row.category, "description": row.description}
+                       for row in matches.itertuples()],
+        }
+
+
+# Errors a request to Ollama can fail with; the chat shows them as a message
+REQUEST_ERRORS = (requests.RequestException, OllamaBusyError, TimeoutError)
+
 
 class OllamaAssistant:
     """Assistant powered by locally running Ollama LLM."""
 
-    def __init__(self, model_name: str = "llama3", base_url: str = "http://localhost:11434"):
+    def __init__(self, model_name: str = "llama3", base_url: Union[str, List[str]] = "http://localhost:11434",
+                 session: Optional[requests.Session] = None, connect_timeout: float = 3.05,
+                 read_timeout: float = 120.0, response_cache: Optional[ResponseCache] = None,
+                 memory: Optional[ConversationMemory] = None,
+                 context_builder: Optional[FinancialContextBuilder] = None,
+                 keep_alive: str = "30m", context_window: int = 2048,
+                 client: Optional[AsyncOllamaClient] = None, pool: Optional[EndpointPool] = None):
         """Initialize the Ollama assistant.
 
         Args:
             model_name: The name of the model to use (default: "llama3")
-            base_url: The base URL for the Ollama API (default: "http://localhost:11434")
+            base_url: The base URL for the Ollama API, or a list of them to spread
+                generations over (default: "http://localhost:11434")
+            session: HTTP session to send requests through (default: the shared
+                keep-alive session)
+            connect_timeout: Seconds to wait for a connection to Ollama
+            read_timeout: Seconds to wait for the model between response chunks
+            response_cache: Cache of earlier answers to serve repeated questions from
+            memory: Conversation memory to continue (default: a new one, summarized
+                by this assistant's model)
+            context_builder: Builder for the financial context (default: a new one
+                with the default token budget)
+            keep_alive: How long Ollama keeps the model loaded after a request
+            context_window: Tokens the model can attend to; a conversation whose
+                token state would outgrow it starts again from a full prompt
+            client: Shared request queue to send generations through (default:
+                send them directly with ``session``)
+            pool: Shared endpoint pool to send generations to (default: a new pool
+                over ``base_url``)
         """
         self.model_name = model_name
-        self.base_url = base_url
-        self.api_endpoint = f"{base_url}/api/generate"
+        self.session = session if session is not None else shared_session()
+        base_urls = [base_url] if isinstance(base_url, str) else list(base_url)
+        self.pool = pool if pool is not None else EndpointPool(base_urls, session=self.session)
+        # Metadata requests go to the first endpoint
+        self.base_url = self.pool.base_urls[0]
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.response_cache = response_cache
+        self.keep_alive = keep_alive
+        self.context_window = context_window
+        self.client = client
+        self.api_endpoint = f"{self.base_url}/api/generate"
+        self.chat_endpoint = f"{self.base_url}/api/chat"
         self.system_prompt = self._get_system_prompt()
-        self.conversation_history = []
+        self.context_builder = context_builder if context_builder is not None else FinancialContextBuilder()
+        self.memory = memory if memory is not None else ConversationMemory()
 
     def _get_system_prompt(self) -> str:
         """Get the system prompt for the financial assistant."""
@@ -43,7 +1452,8 @@ class OllamaAssistant:
     def check_ollama_availability(self) -> bool:
         """Check if Ollama is available at the specified URL."""
         try:
-            response = requests.get(f"{self.base_url}/api/tags")
+            response = self.session.get(f"{self.base_url}/api/tags",
+                                        timeout=(self.connect_timeout, METADATA_READ_TIMEOUT))
             return response.status_code == 200
         except requests.RequestException:
             return False
@@ -51,7 +1461,8 @@ class OllamaAssistant:
     def get_available_models(self) -> List[str]:
         """Get a list of available models from Ollama."""
         try:
-            response = requests.get(f"{self.base_url}/api/tags")
+            response = self.session.get(f"{self.base_url}/api/tags",
+                                        timeout=(self.connect_timeout, METADATA_READ_TIMEOUT))
             if response.status_code == 200:
                 data = response.json()
                 return [model['name'] for model in data.get('models', [])]
@@ -59,6 +1470,145 @@ class OllamaAssistant:
         except requests.RequestException:
             return []
 
+    def _context_key(self, financial_data: Dict[str, Any]) -> Optional[str]:
+        """Identify the model, prompt and data a token state was built from.
+
+        Returns:
+            The key, or None when the data version is unknown and a stored token
+            state cannot be trusted to match the data
+        """
+        data_version = financial_data.get('data_version', None)
+        if data_version is None:
+            return None
+        user_info = financial_data.get('user_info', {}) or {}
+        return ResponseCache.make_key(self.model_name, self.system_prompt, self.context_builder.token_budget,
+                                      user_info.get('user_id', user_info.get('name')), data_version)
+
+    def _build_payload(self, user_query: str, financial_data: Dict[str, Any],
+                       temperature: float, max_tokens: int, stream: bool):
+        """Build the /api/generate request for a question and record it in the history.
+
+        The first turn sends the system prompt, financial context and conversation
+        memory. Ollama answers with the token state it ended on, and later turns
+        on the same model and data send that state with only the new question, so
+        the model does not process the whole prompt again.
+
+        Returns:
+            Tuple of (request payload, cache prompt, token state key); the cache
+            prompt is the financial context and question without the conversation,
+            so a repeated question is answered from the response cache
+        """
+        # Format the financial data as context for the LLM
+        context = self._format_financial_data(financial_data)
+        cache_prompt = f"{context}\n\nUser question: {user_query}\n\nResponse:"
+
+        # Construct the prompt with context and the conversation so far
+        conversation = self.memory.prompt_context()
+        if conversation:
+            context = f"{context}\n\n{conversation}"
+        prompt = f"{context}\n\nUser question: {user_query}\n\nResponse:"
+
+        payload = {
+            "model": self.model_name,
+            "prompt": prompt,
+            "system": self.system_prompt,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "stream": stream,
+            "keep_alive": self.keep_alive
+        }
+
+        # Continue from the model's token state when it was built from the same data
+        context_key = self._context_key(financial_data)
+        model_context = self.memory.model_context
+        if context_key is not None and model_context and self.memory.model_context_key == context_key:
+            turn = (f"{self.context_builder.merchant_line(financial_data)}"
+                    f"User question: {user_query}\n\nResponse:")
+            needed = len(model_context) + self.context_builder.estimate_tokens(turn) + max_tokens
+            if needed <= self.context_window:
+                payload["prompt"] = turn
+                payload["context"] = model_context
+                del payload["system"]
+
+        # Add to conversation history
+        self.memory.append("user", user_query, self.summarize_conversation)
+
+        return payload, cache_prompt, context_key
+
+    def _cached_answer(self, payload: Dict[str, Any], cache_prompt: str, financial_data: Dict[str, Any]):
+        """Look up the answer to a request in the response cache.
+
+        The key is the model, sampling settings, system prompt, cache prompt
+        (financial context and question) and data version.
+
+        Returns:
+            Tuple of (cache key, cached answer or None); both are None without a cache
+        """
+        if self.response_cache is None:
+            return None, None
+        key = ResponseCache.make_key(
+            payload["model"], payload["temperature"], payload["max_tokens"],
+            self.system_prompt, cache_prompt, financial_data.get("data_version")
+        )
+        answer = self.response_cache.get(key)
+        if answer is not None:
+            self.memory.append("assistant", answer, self.summarize_conversation)
+            # The model never saw this answer, so its token state is behind the conversation
+            self._remember_model_context(None, None)
+        return key, answer
+
+    def _remember_model_context(self, context_key: Optional[str], model_context: Optional[List[int]]):
+        """Keep the token state Ollama returned for the next turn (None to drop it)."""
+        if context_key is None or not model_context:
+            context_key, model_context = None, None
+        self.memory.model_context = model_context
+        self.memory.model_context_key = context_key
+
+    def _request(self, path: str, payload: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """Send a generation request to the endpoint pool, through the shared queue when there is one.
+
+        Yields:
+            The JSON objects of the response
+        """
+        timeout = (self.connect_timeout, self.read_timeout)
+        if self.client is not None:
+            return self.client.stream(path, payload, timeout=timeout,
+                                      reader=partial(self.pool.read_chunks, slots=self.client))
+        return self.pool.read_chunks(path, payload, timeout)
+
+    @staticmethod
+    def _error_message(error: Exception) -> str:
+        """Describe a failed request for the chat."""
+        if isinstance(error, requests.HTTPError):
+            return f"I'm sorry, I couldn't process your request. Error: {error.response.status_code}"
+        if isinstance(error, OllamaBusyError):
+            return "I'm sorry, the language model is busy with other questions. Please try again in a moment."
+        if isinstance(error, TimeoutError):
+            return "I'm sorry, the language model took too long to answer. Please try again."
+        return f"I'm sorry, I couldn't connect to the language model. Error: {str(error)}"
+
+    def warm_up(self, model_name: Optional[str] = None) -> bool:
+        """Load a model into Ollama's memory ahead of the first question.
+
+        A generate request without a prompt only loads the model, which then
+        stays loaded for ``keep_alive``.
+
+        Args:
+            model_name: The model to load (default: the assistant's model)
+
+        Returns:
+            True if Ollama loaded the model, False otherwise
+        """
+        try:
+            list(self._request("/api/generate", {
+                "model": model_name or self.model_name,
+                "keep_alive": self.keep_alive,
+                "stream": False
+            }))
+            return True
+        except REQUEST_ERRORS:
+            return False
+
     def generate_response(self,
                          user_query: str,
                          financial_data: Dict[str, Any],
@@ -75,44 +1625,221 @@ class OllamaAssistant:
         Returns:
             The LLM's response as a string
         """
-        # Format the financial data as context for the LLM
-        context = self._format_financial_data(financial_data)
+        payload, cache_prompt, context_key = self._build_payload(user_query, financial_data, temperature, max_tokens,
+                                                                 stream=False)
+        cache_key, cached = self._cached_answer(payload, cache_prompt, financial_data)
+        if cached is not None:
+            return cached
 
-        # Construct the prompt with context
-        prompt = f"{context}\n\nUser question: {user_query}\n\nResponse:"
+        try:
+            # Make the API request
+            result = list(self._request("/api/generate", payload))[-1]
+        except REQUEST_ERRORS as e:
+            # Fallback to a default response if the API call fails
+            self._remember_model_context(None, None)
+            return self._error_message(e)
+
+        answer = result.get('response', '')
 
         # Add to conversation history
-        self.conversation_history.append({"role": "user", "content": user_query})
+        self.memory.append("assistant", answer, self.summarize_conversation)
+        self._remember_model_context(context_key, result.get('context'))
+        if cache_key is not None:
+            self.response_cache.put(cache_key, answer)
+
+        return answer
+
+    def stream_response(self,
+                        user_query: str,
+                        financial_data: Dict[str, Any],
+                        temperature: float = 0.7,
+                        max_tokens: int = 500) -> Iterator[str]:
+        """Generate a response token by token as the model produces it.
+
+        Ollama streams one JSON object per line; each carries the next piece of
+        the answer, so the UI can show text as soon as the first token arrives.
+        The complete answer is added to the conversation history once the
+        stream finishes. A cached answer is yielded whole.
+
+        Args:
+            user_query: The user's question or request
+            financial_data: Dictionary containing the user's financial data
+            temperature: Controls randomness (0.0 to 1.0)
+            max_tokens: Maximum number of tokens to generate
+
+        Yields:
+            Pieces of the response text, or a single error message
+        """
+        payload, cache_prompt, context_key = self._build_payload(user_query, financial_data, temperature, max_tokens,
+                                                                 stream=True)
+        cache_key, cached = self._cached_answer(payload, cache_prompt, financial_data)
+        if cached is not None:
+            yield cached
+            return
+        # Drop the token state until the stream completes, so an interrupted
+        # answer is not continued from
+        self._remember_model_context(None, None)
+        parts = []
+        model_context = None
 
         try:
-            # Prepare the request payload
+            for chunk in self._request("/api/generate", payload):
+                if 'error' in chunk:
+                    yield f"I'm sorry, I couldn't process your request. Error: {chunk['error']}"
+                    return
+                token = chunk.get('response', '')
+                if token:
+                    parts.append(token)
+                    yield token
+                if chunk.get('done'):
+                    model_context = chunk.get('context')
+
+        except REQUEST_ERRORS as e:
+            yield self._error_message(e)
+            return
+
+        # Add to conversation history
+        answer = ''.join(parts)
+        self.memory.append("assistant", answer, self.summarize_conversation)
+        self._remember_model_context(context_key, model_context)
+        if cache_key is not None:
+            self.response_cache.put(cache_key, answer)
+
+    def stream_response_with_tools(self,
+                                   user_query: str,
+                                   tools: FinanceTools,
+                                   financial_data: Optional[Dict[str, Any]] = None,
+                                   temperature: float = 0.7,
+                                   max_tokens: int = 500,
+                                   max_rounds: int = 4) -> Iterator[str]:
+        """Answer a question by letting the model query the user's data.
+
+        Instead of a summary of everything, the model gets the tool catalogue
+        and a one-line overview of the data on Ollama's /api/chat endpoint.
+        Each round it either asks for tool calls, which are run and sent back,
+        or writes the answer, which is streamed. After ``max_rounds`` rounds
+        of tool calls the model must answer with what it has. Models without
+        tool support get the formatted ``financial_data`` instead.
+
+        Args:
+            user_query: The user's question or request
+            tools: Tools over the user's data
+            financial_data: Dictionary containing the user's financial data, for
+                the user's profile and the fallback prompt
+            temperature: Controls randomness (0.0 to 1.0)
+            max_tokens: Maximum number of tokens to generate per round
+            max_rounds: Maximum number of rounds of tool calls
+
+        Yields:
+            Pieces of the response text, or a single error message
+        """
+        system = f"{self.system_prompt}\n{TOOL_INSTRUCTIONS}\n{tools.overview()}"
+        user_info = (financial_data or {}).get('user_info', None)
+        if user_info:
+            system += (f"\nThe user is {user_info.get('name', 'Unknown')}, "
+                       f"with a monthly income of ${user_info.get('income', 0):,.2f}.")
+        # The conversation is left out of the key, so a repeated question is a cache hit
+        cache_key = None
+        if self.response_cache is not None:
+            cache_key = ResponseCache.make_key("tools", self.model_name, temperature, max_tokens, system,
+                                               user_query, tools.data_version())
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                self.memory.append("user", user_query, self.summarize_conversation)
+                self.memory.append("assistant", cached, self.summarize_conversation)
+                self._remember_model_context(None, None)
+                yield cached
+                return
+
+        messages = [{"role": "system", "content": system}]
+        conversation = self.memory.prompt_context()
+        if conversation:
+            messages.append({"role": "system", "content": conversation})
+        messages.append({"role": "user", "content": user_query})
+
+        parts = []
+        for round_number in range(max_rounds + 1):
             payload = {
                 "model": self.model_name,
-                "prompt": prompt,
-                "system": self.system_prompt,
-                "temperature": temperature,
-                "max_tokens": max_tokens,
-                "stream": False
+                "messages": messages,
+                "stream": True,
+                "keep_alive": self.keep_alive,
+                "options": {"temperature": temperature, "num_predict": max_tokens}
             }
+            if round_number < max_rounds:
+                payload["tools"] = tools.DEFINITIONS
+            content, tool_calls = [], []
+            unsupported = False
 
-            # Make the API request
-            response = requests.post(self.api_endpoint, json=payload)
+            try:
+                for chunk in self._request("/api/chat", payload):
+                    if 'error' in chunk:
+                        yield f"I'm sorry, I couldn't process your request. Error: {chunk['error']}"
+                        return
+                    message = chunk.get('message', {})
+                    token = message.get('content', '')
+                    if token:
+                        content.append(token)
+                        yield token
+                    tool_calls.extend(message.get('tool_calls') or [])
 
-            if response.status_code == 200:
-                result = response.json()
-                answer = result.get('response', '')
+            except requests.HTTPError as e:
+                # Models without tool support reject the request outright
+                if e.response.status_code == 400 and round_number == 0 and financial_data is not None:
+                    unsupported = True
+                else:
+                    yield self._error_message(e)
+                    return
+            except REQUEST_ERRORS as e:
+                yield self._error_message(e)
+                return
 
-                # Add to conversation history
-                self.conversation_history.append({"role": "assistant", "content": answer})
+            if unsupported:
+                yield from self.stream_response(user_query, financial_data, temperature, max_tokens)
+                return
 
-                return answer
-            else:
-                # Fallback to a default response if the API call fails
-                return f"I'm sorry, I couldn't process your request. Error: {response.status_code}"
+            parts.extend(content)
+            if not tool_calls:
+                break
+
+            # Run the requested queries and hand the results back to the model
+            messages.append({"role": "assistant", "content": ''.join(content), "tool_calls": tool_calls})
+            for tool_call in tool_calls:
+                function = tool_call.get('function', {})
+                arguments = function.get('arguments') or {}
+                if isinstance(arguments, str):
+                    try:
+                        arguments = json.loads(arguments)
+                    except json.JSONDecodeError:
+                        arguments = {}
+                result = tools.call(function.get('name', ''), arguments)
+                messages.append({"role": "tool", "tool_name": function.get('name', ''),
+                                 "content": json.dumps(result, default=str)})
+
+        # Add to conversation history; the generate endpoint's token state did not see this turn
+        answer = ''.join(parts)
+        self.memory.append("user", user_query, self.summarize_conversation)
+        self.memory.append("assistant", answer, self.summarize_conversation)
+        self._remember_model_context(None, None)
+        if cache_key is not None:
+            self.response_cache.put(cache_key, answer)
 
-        except requests.RequestException as e:
-            # Handle connection errors
-            return f"I'm sorry, I couldn't connect to the language model. Error: {str(e)}"
+    def generate_response_with_tools(self,
+                                     user_query: str,
+                                     tools: FinanceTools,
+                                     financial_data: Optional[Dict[str, Any]] = None,
+                                     temperature: float = 0.7,
+                                     max_tokens: int = 500,
+                                     max_rounds: int = 4) -> str:
+        """Answer a question by letting the model query the user's data.
+
+        Takes the same arguments as ``stream_response_with_tools()``.
+
+        Returns:
+            The LLM's response as a string
+        """
+        return ''.join(self.stream_response_with_tools(user_query, tools, financial_data, temperature,
+                                                       max_tokens, max_rounds))
 
     def _format_financial_data(self, financial_data: Dict[str, Any]) -> str:
         """Format the financial data as context for the LLM.
@@ -121,47 +1848,159 @@ class OllamaAssistant:
             financial_data: Dictionary containing the user's financial data
 
         Returns:
-            Formatted context string
+            Formatted context string, sized to the context builder's token budget
         """
-        context = "Financial Data Summary:\n"
+        return self.context_builder.build(financial_data)
 
-        # Add user info
-        user_info = financial_data.get('user_info', {})
-        if user_info:
-            context += f"- Name: {user_info.get('name', 'Unknown')}\n"
-            context += f"- Monthly Income: ${user_info.get('income', 0):,.2f}\n"
-
-        # Add spending summary
-        spending_history = financial_data.get('spending_history', None)
-        if spending_history is not None and hasattr(spending_history, 'empty') and not spending_history.empty:
-            avg_monthly_spending = spending_history.sum(axis=1).mean()
-            context += f"- Average Monthly Spending: ${avg_monthly_spending:,.2f}\n"
+    @property
+    def conversation_history(self) -> List[Dict[str, str]]:
+        """The recent messages kept verbatim in the conversation memory."""
+        return list(self.memory.messages)
 
-            # Top spending categories
-            category_totals = spending_history.sum()
-            top_categories = category_totals.nlargest(min(3, len(category_totals)))
-            context += "- Top Spending Categories:\n"
-            for cat, amount in top_categories.items():
-                context += f"  * {cat}: ${amount:.2f} ({amount/avg_monthly_spending*100:.1f}%)\n"
+    def summarize_conversation(self, summary: str, messages: List[Dict[str, str]]) -> str:
+        """Fold messages into a conversation summary with the model.
 
-        # Add recent transactions
-        transactions = financial_data.get('transactions', None)
-        if transactions is not None and hasattr(transactions, 'empty') and not transactions.empty:
-            context += "- Recent Transactions:\n"
-            for _, row in transactions.head(min(3, len(transactions))).iterrows():
-                context += f"  * ${row['amount']:.2f} for {row['category']} on {row['transaction_date'].strftime('%Y-%m-%d')}\n"
+        Args:
+            summary: The summary so far ('' at first)
+            messages: Messages to add to it, oldest first
 
-        # Add forecast info
-        forecast = financial_data.get('forecast', None)
-        if forecast is not None and hasattr(forecast, 'empty') and not forecast.empty:
-            next_month_total = forecast.iloc[0].sum()
-            context += f"- Forecast for Next Month: ${next_month_total:,.2f}\n"
+        Returns:
+            The updated summary
 
-        return context
+        Raises:
+            requests.RequestException: If Ollama cannot be reached or fails
+            OllamaBusyError: If the shared request queue is full
+            TimeoutError: If the request passes the queue's deadline
+        """
+        transcript = '\n'.join(f"{message['role'].title()}: {message['content']}" for message in messages)
+        prompt = (f"Summary so far:\n{summary or '(none)'}\n\nNew messages:\n{transcript}\n\n"
+                  "Update the summary with the new messages in at most five short sentences. "
+                  "Keep amounts, categories and anything the user asked to remember.\n\nSummary:")
+        result = list(self._request("/api/generate", {
+            "model": self.model_name,
+            "prompt": prompt,
+            "stream": False,
+            "keep_alive": self.keep_alive
+        }))[-1]
+        return result.get('response', '').strip()
 
     def clear_conversation(self):
         """Clear the conversation history."""
-        self.conversation_history = []
+        self.memory.clear()
+
+
+class OllamaHealthMonitor:
+    """Polls Ollama in the background and caches whether it is up.
+
+    A daemon thread requests ``/api/tags`` every ``interval`` seconds and keeps
+    the availability and model list from the last answer. Readers get the cached
+    state without any network call. A result older than ``ttl`` is treated as
+    unavailable, so a stalled monitor never reports a server that has gone away.
+    With a ``pool``, each probe is the pool's ``check()``: Ollama is available
+    while any instance is healthy, and the models are those installed on the
+    healthy instances.
+    """
+
+    def __init__(self, base_url: str = "http://localhost:11434", interval: float = 15.0,
+                 ttl: float = 60.0, session: Optional[requests.Session] = None,
+                 connect_timeout: float = 1.0, pool: Optional[EndpointPool] = None):
+        """Initialize the monitor.
+
+        Args:
+            base_url: The base URL for the Ollama API (ignored with a pool)
+            interval: Seconds between probes
+            ttl: Seconds a probe result stays valid
+            session: HTTP session to probe through (default: a session without
+                retries, so a down server is reported at once)
+            connect_timeout: Seconds to wait for a connection to Ollama
+            pool: Endpoint pool whose instances are probed instead of base_url
+        """
+        self.pool = pool
+        self.base_url = pool.base_urls[0] if pool is not None else base_url
+        self.interval = interval
+        self.ttl = ttl
+        self.session = session if session is not None else shared_session(pool_size=1, retries=0)
+        self.connect_timeout = connect_timeout
+        self._lock = threading.Lock()
+        self._available = False
+        self._models: List[str] = []
+        self._checked_at: Optional[float] = None
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def refresh(self) -> Dict[str, Any]:
+        """Probe Ollama now and update the cached state.
+
+        Returns:
+            The new state (see ``status``)
+        """
+        if self.pool is not None:
+            endpoints = [endpoint for endpoint in self.pool.check(
+                timeout=(self.connect_timeout, METADATA_READ_TIMEOUT), session=self.session
+            ) if endpoint['healthy']]
+            available = bool(endpoints)
+            # Every model any healthy instance can serve, in the order they were listed
+            models = list(dict.fromkeys(
+                name for endpoint in endpoints for name in endpoint['installed'] or []
+            ))
+        else:
+            try:
+                response = self.session.get(f"{self.base_url}/api/tags",
+                                            timeout=(self.connect_timeout, METADATA_READ_TIMEOUT))
+                available = response.status_code == 200
+                models = [model['name'] for model in response.json().get('models', [])] if available else []
+            except (requests.RequestException, ValueError):
+                available, models = False, []
+
+        with self._lock:
+            self._available = available
+            self._models = models
+            self._checked_at = time.monotonic()
+        return self.status()
+
+    def status(self) -> Dict[str, Any]:
+        """Get the cached state without touching the network.
+
+        Returns:
+            Dictionary with available, models, checked (whether any probe has
+            finished yet) and age (seconds since the last probe, or None)
+        """
+        with self._lock:
+            if self._checked_at is None:
+                return {'available': False, 'models': [], 'checked': False, 'age': None}
+            age = time.monotonic() - self._checked_at
+            fresh = age <= self.ttl
+            return {
+                'available': self._available and fresh,
+                'models': list(self._models) if fresh else [],
+                'checked': True,
+                'age': age
+            }
+
+    def _run(self):
+        """Probe until stopped."""
+        while not self._stop_event.is_set():
+            self.refresh()
+            self._stop_event.wait(self.interval)
+
+    def start(self):
+        """Start polling in a daemon thread (no-op if already running)."""
+        if self.is_running:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="ollama-health", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop polling and wait for the thread to exit."""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    @property
+    def is_running(self) -> bool:
+        """Whether the polling thread is alive."""
+        return self._thread is not None and self._thread.is_alive()
 
 
 # Example usage
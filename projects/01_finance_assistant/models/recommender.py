@@ -0,0 +1,770 @@
+"""Recommendation engine module for personalized financial advice.
+
+This module provides functionality to flag unusual spending as transactions
+arrive, using running per-category spending profiles that are updated in
+constant time per transaction, to detect recurring payments such as rent,
+utilities and subscriptions, and to compute budget recommendations for every
+user at once.
+"""
+
+import sqlite3
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from scipy.signal import lfilter
+
+from utils.data_processor import normalize_merchants
+from utils.queries import id_batches
+
+# Recommended maximum share of income per category; other categories use the default
+CATEGORY_TARGETS = {
+    "Housing": 0.30,
+    "Food": 0.15,
+    "Transportation": 0.15,
+    "Entertainment": 0.10,
+}
+DEFAULT_CATEGORY_TARGET = 0.10
+
+# Categories counted as needs in the 50/30/20 rule; everything else is a want
+NEEDS_CATEGORIES = {"Housing", "Food", "Transportation", "Utilities", "Healthcare"}
+
+# Recognized payment cadences: name, nominal interval in days and calendar step
+CADENCES = [
+    ('weekly', 7.0, pd.DateOffset(weeks=1)),
+    ('biweekly', 14.0, pd.DateOffset(weeks=2)),
+    ('monthly', 30.44, pd.DateOffset(months=1)),
+    ('quarterly', 91.31, pd.DateOffset(months=3)),
+    ('yearly', 365.25, pd.DateOffset(years=1)),
+]
+
+
+class SpendingAnomalyDetector:
+    """Flags transactions that are unusually large for their category.
+
+    The detector keeps an exponentially weighted moving average (EWMA) of the
+    amount and its variance for every (user, category) pair in the
+    ``anomaly_state`` table. Each new transaction is scored against the state
+    before it, the state is updated in O(1), and transactions whose z-score
+    exceeds the threshold are written to the ``anomalies`` table.
+    """
+
+    def __init__(self, db_path, alpha=0.1, threshold=3.5, min_observations=8):
+        """Initialize the detector with a database path.
+
+        Args:
+            db_path: Path to the SQLite database containing transaction data
+            alpha: EWMA smoothing factor; higher values adapt faster
+            threshold: z-score above which a transaction is flagged
+            min_observations: Number of transactions a category needs before
+                its transactions can be flagged
+        """
+        self.db_path = db_path
+        self.alpha = alpha
+        self.threshold = threshold
+        self.min_observations = min_observations
+
+        with sqlite3.connect(self.db_path) as conn:
+            self._ensure_tables(conn)
+
+    @staticmethod
+    def _ensure_tables(conn):
+        """Create the state and anomaly tables if they do not exist."""
+        conn.executescript('''
+        CREATE TABLE IF NOT EXISTS anomaly_state (
+            user_id INTEGER,
+            category_id INTEGER,
+            observations INTEGER,
+            ewma_mean REAL,
+            ewma_var REAL,
+            PRIMARY KEY (user_id, category_id)
+        );
+
+        CREATE TABLE IF NOT EXISTS anomalies (
+            transaction_id INTEGER PRIMARY KEY,
+            user_id INTEGER,
+            category_id INTEGER,
+            amount REAL,
+            expected_amount REAL,
+            score REAL,
+            detected_at TEXT
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_anomalies_user ON anomalies (user_id);
+        ''')
+
+    def score_transactions(self, transactions: pd.DataFrame) -> pd.DataFrame:
+        """Score new transactions and update the running state.
+
+        Within each (user, category) transactions are applied to the state in
+        date order. The work is one state lookup for the affected users, two
+        linear IIR filter passes per (user, category) group and one batched
+        write, so history is never re-queried per transaction.
+
+        Args:
+            transactions: DataFrame with transaction_id, user_id, category_id,
+                amount and transaction_date columns
+
+        Returns:
+            DataFrame with transaction_id, expected_amount, score and is_anomaly
+            columns, in the input order
+        """
+        if transactions.empty:
+            return pd.DataFrame(columns=['transaction_id', 'expected_amount', 'score', 'is_anomaly'])
+
+        frame = transactions[['transaction_id', 'user_id', 'category_id', 'amount', 'transaction_date']]
+        frame = frame.reset_index(drop=True)
+        order = np.lexsort((
+            frame['transaction_id'].to_numpy(),
+            frame['transaction_date'].astype(str).to_numpy(),
+            frame['category_id'].to_numpy(),
+            frame['user_id'].to_numpy(),
+        ))
+        ordered = frame.iloc[order]
+
+        user_ids = ordered['user_id'].to_numpy()
+        category_ids = ordered['category_id'].to_numpy()
+        amounts = ordered['amount'].to_numpy(dtype=float)
+
+        with sqlite3.connect(self.db_path) as conn:
+            state = self._load_state(conn, np.unique(user_ids))
+
+            expected = np.empty(len(ordered))
+            scores = np.zeros(len(ordered))
+            new_state = []
+
+            # Group boundaries in the sorted arrays
+            boundaries = np.flatnonzero(
+                (np.diff(user_ids) != 0) | (np.diff(category_ids) != 0)
+            ) + 1
+            starts = np.concatenate(([0], boundaries))
+            ends = np.concatenate((boundaries, [len(ordered)]))
+
+            for start, end in zip(starts, ends):
+                key = (int(user_ids[start]), int(category_ids[start]))
+                group_state = state.get(key, (0, amounts[start], 0.0))
+                group_expected, group_scores, final_state = self._score_group(
+                    amounts[start:end], *group_state
+                )
+                expected[start:end] = group_expected
+                scores[start:end] = group_scores
+                new_state.append((*key, *final_state))
+
+            flagged = scores > self.threshold
+            detected_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+            conn.executemany(
+                """INSERT INTO anomaly_state
+                (user_id, category_id, observations, ewma_mean, ewma_var)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (user_id, category_id) DO UPDATE SET
+                    observations = excluded.observations,
+                    ewma_mean = excluded.ewma_mean,
+                    ewma_var = excluded.ewma_var""",
+                new_state
+            )
+            conn.executemany(
+                """INSERT OR REPLACE INTO anomalies
+                (transaction_id, user_id, category_id, amount, expected_amount, score, detected_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                [
+                    (int(tid), int(uid), int(cid), float(amt), float(exp), float(score), detected_at)
+                    for tid, uid, cid, amt, exp, score in zip(
+                        ordered['transaction_id'].to_numpy()[flagged],
+                        user_ids[flagged],
+                        category_ids[flagged],
+                        amounts[flagged],
+                        expected[flagged],
+                        scores[flagged],
+                    )
+                ]
+            )
+
+        result = pd.DataFrame({
+            'transaction_id': ordered['transaction_id'].to_numpy(),
+            'expected_amount': expected,
+            'score': scores,
+            'is_anomaly': flagged,
+        }, index=ordered.index)
+        return result.sort_index().reset_index(drop=True)
+
+    def _score_group(self, amounts, observations, mean, variance):
+        """Run the EWMA recursions for one (user, category) group.
+
+        The mean update m[t] = a * x[t] + (1 - a) * m[t-1] and the variance
+        update v[t] = (1 - a) * (v[t-1] + a * d[t]^2), with d[t] = x[t] - m[t-1],
+        are first-order IIR filters, so both are evaluated with ``lfilter``.
+
+        Args:
+            amounts: Transaction amounts in processing order
+            observations: Number of transactions already seen in the group
+            mean: EWMA mean before the first amount
+            variance: EWMA variance before the first amount
+
+        Returns:
+            Tuple of (expected amounts, z-scores, (observations, mean, variance))
+        """
+        alpha = self.alpha
+        decay = 1 - alpha
+        feedback = [1, -decay]
+
+        means, _ = lfilter([alpha], feedback, amounts, zi=[decay * mean])
+        prior_means = np.concatenate(([mean], means[:-1]))
+        deviations = amounts - prior_means
+
+        variances, _ = lfilter([1], feedback, decay * alpha * deviations ** 2, zi=[decay * variance])
+        prior_variances = np.concatenate(([variance], variances[:-1]))
+
+        # The variance starts at zero when a group's first amount seeds the mean,
+        # so correct the start-up bias by the weight accumulated since then
+        prior_counts = observations + np.arange(len(amounts))
+        scores = np.zeros(len(amounts))
+        ready = (prior_counts >= max(self.min_observations, 2)) & (prior_variances > 0)
+        corrected = prior_variances[ready] / (1 - decay ** (prior_counts[ready] - 1))
+        scores[ready] = deviations[ready] / np.sqrt(corrected)
+
+        final_state = (int(observations + len(amounts)), float(means[-1]), float(variances[-1]))
+        return prior_means, scores, final_state
+
+    @staticmethod
+    def _load_state(conn, user_ids):
+        """Load the running state for the given users, keyed by (user, category)."""
+        state = {}
+        for batch in id_batches(user_ids):
+            rows = conn.execute(
+                f"""SELECT user_id, category_id, observations, ewma_mean, ewma_var
+                FROM anomaly_state WHERE user_id IN ({', '.join('?' for _ in batch)})""",
+                batch
+            ).fetchall()
+            state.update({(row[0], row[1]): (row[2], row[3], row[4]) for row in rows})
+        return state
+
+    def rebuild(self, user_id=None):
+        """Recompute the state and anomalies from the full transaction history.
+
+        Args:
+            user_id: Only rebuild this user (default: all users)
+
+        Returns:
+            Number of transactions flagged
+        """
+        user_filter = "WHERE user_id = ?" if user_id is not None else ""
+        params = (user_id,) if user_id is not None else ()
+
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute(f"DELETE FROM anomaly_state {user_filter}", params)
+            conn.execute(f"DELETE FROM anomalies {user_filter}", params)
+            transactions = pd.read_sql(
+                f"""SELECT transaction_id, user_id, category_id, amount, transaction_date
+                FROM transactions {user_filter}""",
+                conn,
+                params=params
+            )
+
+        return int(self.score_transactions(transactions)['is_anomaly'].sum())
+
+    def get_anomalies(self, user_id: int) -> pd.DataFrame:
+        """Get the flagged transactions for a user, most recent first.
+
+        Args:
+            user_id: The ID of the user
+
+        Returns:
+            DataFrame of flagged transactions with their expected amount and score
+        """
+        with sqlite3.connect(self.db_path) as conn:
+            query = """
+            SELECT a.transaction_id, t.transaction_date, c.name as category,
+                a.amount, a.expected_amount, a.score
+            FROM anomalies a
+            JOIN transactions t ON a.transaction_id = t.transaction_id
+            JOIN categories c ON a.category_id = c.category_id
+            WHERE a.user_id = ?
+            ORDER BY t.transaction_date DESC
+            """
+            return pd.read_sql(query, conn, params=(user_id,))
+
+
+class RecurringPaymentDetector:
+    """Detects payments that repeat with a regular amount and interval.
+
+    Transactions are grouped by user, merchant and amount with sorts rather than
+    hash lookups: after one sort on (user, merchant, amount) a new amount bucket
+    starts wherever the amount jumps by more than the tolerance, and after a
+    second sort on (bucket, date) the intervals between payments are plain
+    differences of adjacent rows. A bucket is recurring when it has enough
+    payments and its intervals match a known cadence with little variation.
+    """
+
+    def __init__(self, db_path, amount_tolerance=0.1, min_occurrences=3, max_interval_cv=0.25):
+        """Initialize the detector with a database path.
+
+        Args:
+            db_path: Path to the SQLite database containing transaction data
+            amount_tolerance: Relative amount change that starts a new bucket
+            min_occurrences: Minimum number of payments in a recurring bucket
+            max_interval_cv: Maximum coefficient of variation of the intervals
+        """
+        self.db_path = db_path
+        self.amount_tolerance = amount_tolerance
+        self.min_occurrences = min_occurrences
+        self.max_interval_cv = max_interval_cv
+
+        with sqlite3.connect(self.db_path) as conn:
+            conn.executescript('''
+            CREATE TABLE IF NOT EXISTS recurring_payments (
+                user_id INTEGER,
+                category_id INTEGER,
+                merchant TEXT,
+                amount REAL,
+                cadence TEXT,
+                interval_days REAL,
+                occurrences INTEGER,
+                first_date TEXT,
+                last_date TEXT,
+                next_date TEXT
+            );
+
+            CREATE INDEX IF NOT EXISTS idx_recurring_payments_user ON recurring_payments (user_id);
+            ''')
+
+    @staticmethod
+    def merchant_codes(transactions: pd.DataFrame):
+        """Factorize transactions into merchant grouping keys.
+
+        Uses the normalized description when one is available and falls back to
+        the category, so rent or insurance without descriptions is still grouped.
+        Descriptions go through the shared merchant normalizer, so store numbers
+        and card suffixes do not split a merchant into several groups.
+
+        Returns:
+            Tuple of (integer code per transaction, array of merchant names)
+        """
+        category_codes, category_values = pd.factorize(transactions['category_id'])
+        fallback = np.array([f'category:{value}' for value in category_values], dtype=object)
+        if 'description' not in transactions.columns:
+            return category_codes, fallback
+
+        description_codes, descriptions = pd.factorize(transactions['description'])
+        normalized = normalize_merchants(descriptions).str.lower()
+        merchant_codes, merchants = pd.factorize(normalized.where(normalized != ''))
+
+        # Description codes first, then the category fallbacks after them; the
+        # appended -1 is what missing descriptions (code -1) look up
+        codes = np.append(merchant_codes, -1)[description_codes]
+        codes = np.where(codes >= 0, codes, len(merchants) + category_codes)
+        return codes, np.concatenate([np.asarray(merchants, dtype=object), fallback])
+
+    def detect(self, transactions: pd.DataFrame) -> pd.DataFrame:
+        """Find recurring payments in a batch of transactions.
+
+        Args:
+            transactions: DataFrame with user_id, category_id, amount and
+                transaction_date columns, and optionally description
+
+        Returns:
+            DataFrame with one row per active recurring payment
+        """
+        columns = ['user_id', 'category_id', 'merchant', 'amount', 'cadence', 'interval_days',
+                   'occurrences', 'first_date', 'last_date', 'next_date']
+        transactions = transactions[transactions['amount'] > 0]
+        if transactions.empty:
+            return pd.DataFrame(columns=columns)
+
+        merchant_codes, merchants = self.merchant_codes(transactions)
+        users = transactions['user_id'].to_numpy()
+        categories = transactions['category_id'].to_numpy()
+        amounts = transactions['amount'].to_numpy(dtype=float)
+        days = (
+            transactions['transaction_date'].to_numpy().astype('datetime64[D]').astype(np.int64)
+        )
+
+        # Dense (user, merchant) ids, then one sort on a packed (pair, cents) key
+        pairs = users.astype(np.int64) * (len(merchants) + 1) + merchant_codes
+        _, pair_ids = np.unique(pairs, return_inverse=True)
+        cents = np.minimum(np.rint(amounts * 100), 2 ** 32 - 1).astype(np.int64)
+        order = np.argsort((pair_ids.astype(np.int64) << 32) | cents)
+        pair_ids, users, merchant_codes = pair_ids[order], users[order], merchant_codes[order]
+        categories, amounts, days = categories[order], amounts[order], days[order]
+
+        # A new amount bucket starts at a new pair or a relative jump in the amount
+        new_bucket = np.ones(len(amounts), dtype=bool)
+        new_bucket[1:] = (
+            (pair_ids[1:] != pair_ids[:-1])
+            | (amounts[1:] > amounts[:-1] * (1 + self.amount_tolerance))
+        )
+        buckets = np.cumsum(new_bucket) - 1
+
+        # Sort each bucket by date so intervals are differences of adjacent rows
+        order = np.argsort((buckets.astype(np.int64) << 32) | (days - days.min()))
+        buckets, users, merchant_codes = buckets[order], users[order], merchant_codes[order]
+        categories, amounts, days = categories[order], amounts[order], days[order]
+
+        starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+        counts = np.diff(np.r_[starts, len(buckets)])
+        intervals = np.diff(days).astype(float)
+        same_bucket = buckets[1:] == buckets[:-1]
+
+        n_buckets = len(starts)
+        interval_count = np.bincount(buckets[1:][same_bucket], minlength=n_buckets)
+        interval_sum = np.bincount(buckets[1:][same_bucket], intervals[same_bucket], minlength=n_buckets)
+        interval_sq = np.bincount(buckets[1:][same_bucket], intervals[same_bucket] ** 2, minlength=n_buckets)
+        amount_sum = np.add.reduceat(amounts, starts)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean_interval = interval_sum / interval_count
+            interval_std = np.sqrt(np.maximum(interval_sq / interval_count - mean_interval ** 2, 0))
+            interval_cv = interval_std / mean_interval
+
+        candidates = (
+            (counts >= self.min_occurrences)
+            & (mean_interval > 0)
+            & (interval_cv <= self.max_interval_cv)
+        )
+
+        # Snap the mean interval to the nearest known cadence
+        nominal = np.array([cadence[1] for cadence in CADENCES])
+        nearest = np.abs(mean_interval[:, None] - nominal[None, :]).argmin(axis=1)
+        candidates &= np.abs(mean_interval - nominal[nearest]) <= 0.15 * nominal[nearest]
+
+        last_days = days[starts + counts - 1]
+        # Drop payments that stopped: no payment within 1.5 intervals of the user's latest date
+        user_last_day = pd.Series(days).groupby(users).max()
+        reference_day = user_last_day.reindex(users[starts]).to_numpy()
+        candidates &= (reference_day - last_days) <= 1.5 * mean_interval
+
+        selected = np.flatnonzero(candidates)
+        if len(selected) == 0:
+            return pd.DataFrame(columns=columns)
+
+        first_dates = pd.to_datetime(days[starts[selected]], unit='D')
+        last_dates = pd.to_datetime(last_days[selected], unit='D')
+        steps = [CADENCES[i][2] for i in nearest[selected]]
+        next_dates = [last + step for last, step in zip(last_dates, steps)]
+
+        return pd.DataFrame({
+            'user_id': users[starts[selected]],
+            'category_id': categories[starts[selected] + counts[selected] - 1],
+            'merchant': merchants[merchant_codes[starts[selected]]],
+            'amount': np.round(amount_sum[selected] / counts[selected], 2),
+            'cadence': [CADENCES[i][0] for i in nearest[selected]],
+            'interval_days': np.round(mean_interval[selected], 1),
+            'occurrences': counts[selected],
+            'first_date': first_dates.strftime('%Y-%m-%d'),
+            'last_date': last_dates.strftime('%Y-%m-%d'),
+            'next_date': pd.DatetimeIndex(next_dates).strftime('%Y-%m-%d'),
+        }, columns=columns)
+
+    def refresh(self, user_id=None) -> pd.DataFrame:
+        """Re-detect recurring payments and store them in ``recurring_payments``.
+
+        Args:
+            user_id: Only refresh this user (default: all users)
+
+        Returns:
+            DataFrame of the detected recurring payments
+        """
+        user_filter = "WHERE user_id = ?" if user_id is not None else ""
+        params = (user_id,) if user_id is not None else ()
+
+        with sqlite3.connect(self.db_path) as conn:
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(transactions)")}
+            description = ", description" if 'description' in columns else ""
+            transactions = pd.read_sql(
+                f"""SELECT user_id, category_id, amount, transaction_date{description}
+                FROM transactions {user_filter}""",
+                conn,
+                params=params
+            )
+
+            payments = self.detect(transactions)
+
+            conn.execute(f"DELETE FROM recurring_payments {user_filter}", params)
+            conn.executemany(
+                """INSERT INTO recurring_payments
+                (user_id, category_id, merchant, amount, cadence, interval_days,
+                 occurrences, first_date, last_date, next_date)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                payments.astype(object).itertuples(index=False, name=None)
+            )
+
+        return payments
+
+    def get_recurring_payments(self, user_id: int) -> pd.DataFrame:
+        """Get the stored recurring payments for a user with category names.
+
+        Args:
+            user_id: The ID of the user
+
+        Returns:
+            DataFrame of recurring payments ordered by next payment date
+        """
+        with sqlite3.connect(self.db_path) as conn:
+            query = """
+            SELECT r.*, c.name as category
+            FROM recurring_payments r
+            JOIN categories c ON r.category_id = c.category_id
+            WHERE r.user_id = ?
+            ORDER BY r.next_date
+            """
+            return pd.read_sql(query, conn, params=(user_id,))
+
+
+class BudgetRecommender:
+    """Computes budget recommendations for all users with array operations.
+
+    Per-category totals come from the ``monthly_rollups`` table, aggregated in
+    SQL to one row per (user, category) along the table's primary key. They
+    are scattered into a users x categories matrix, and average monthly
+    spending, category targets, savings rate and 50/30/20 gaps are computed for
+    every user at once. Results are written to ``budget_recommendations`` and
+    ``category_budgets`` so the UI and the chatbot only need a lookup.
+    """
+
+    def __init__(self, db_path):
+        """Initialize the recommender with a database path.
+
+        Args:
+            db_path: Path to the SQLite database containing transaction data
+        """
+        self.db_path = db_path
+
+        with sqlite3.connect(self.db_path) as conn:
+            conn.executescript('''
+            CREATE TABLE IF NOT EXISTS budget_recommendations (
+                user_id INTEGER PRIMARY KEY,
+                income REAL,
+                months INTEGER,
+                avg_spending REAL,
+                savings REAL,
+                savings_rate REAL,
+                needs_share REAL,
+                wants_share REAL,
+                needs_gap REAL,
+                wants_gap REAL,
+                savings_gap REAL,
+                computed_at TEXT
+            );
+
+            CREATE TABLE IF NOT EXISTS category_budgets (
+                user_id INTEGER,
+                category TEXT,
+                avg_spending REAL,
+                target REAL,
+                share_of_income REAL,
+                over_budget INTEGER,
+                PRIMARY KEY (user_id, category)
+            );
+            ''')
+
+    def compute(self, user_ids=None):
+        """Compute recommendations without storing them.
+
+        Args:
+            user_ids: Only compute these users (default: all users)
+
+        Returns:
+            Tuple of (per-user summary DataFrame, per-category budget DataFrame)
+        """
+        # Each batch covers whole users, so the per-user groups never straddle two reads
+        batches = [None] if user_ids is None else id_batches(user_ids)
+
+        with sqlite3.connect(self.db_path) as conn:
+            # Grouping on the rollup primary key needs no sort; names are joined after
+            frames = []
+            for batch in batches:
+                user_filter = ""
+                if batch is not None:
+                    user_filter = f"WHERE r.user_id IN ({', '.join('?' for _ in batch)})"
+                frames.append(pd.read_sql(
+                    f"""SELECT r.user_id, r.category_id, SUM(r.total_amount) as total,
+                        MIN(r.month) as first_month, MAX(r.month) as last_month
+                    FROM monthly_rollups r
+                    {user_filter}
+                    GROUP BY r.user_id, r.category_id""",
+                    conn,
+                    params=batch or []
+                ))
+            totals = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+            users = pd.read_sql("SELECT user_id, income FROM users", conn)
+            category_names = pd.read_sql("SELECT category_id, name FROM categories", conn)
+
+        if totals.empty:
+            return pd.DataFrame(), pd.DataFrame()
+
+        totals['category'] = totals['category_id'].map(
+            category_names.set_index('category_id')['name']
+        ).fillna('Uncategorized')
+
+        user_codes, user_index = pd.factorize(totals['user_id'], sort=True)
+        category_codes, category_index = pd.factorize(totals['category'], sort=True)
+        n_users, n_categories = len(user_index), len(category_index)
+
+        # Users x categories matrix of total spending
+        spending = np.zeros((n_users, n_categories))
+        np.add.at(spending, (user_codes, category_codes), totals['total'].to_numpy(dtype=float))
+
+        # Months of history per user, counting gaps, as in the spending history table
+        first = self._month_numbers(totals['first_month'])
+        last = self._month_numbers(totals['last_month'])
+        first_month = np.full(n_users, np.iinfo(np.int64).max)
+        last_month = np.full(n_users, np.iinfo(np.int64).min)
+        np.minimum.at(first_month, user_codes, first)
+        np.maximum.at(last_month, user_codes, last)
+        months = last_month - first_month + 1
+
+        income = (
+            users.set_index('user_id')['income'].reindex(user_index)
+            .fillna(0).to_numpy(dtype=float)
+        )
+        safe_income = np.where(income > 0, income, np.nan)
+
+        monthly = spending / months[:, None]
+        avg_spending = monthly.sum(axis=1)
+        savings = income - avg_spending
+        savings_rate = savings / safe_income
+
+        is_need = np.array([category in NEEDS_CATEGORIES for category in category_index])
+        needs_share = monthly[:, is_need].sum(axis=1) / safe_income
+        wants_share = monthly[:, ~is_need].sum(axis=1) / safe_income
+
+        target_share = np.array([
+            CATEGORY_TARGETS.get(category, DEFAULT_CATEGORY_TARGET) for category in category_index
+        ])
+        targets = income[:, None] * target_share[None, :]
+        share_of_income = monthly / safe_income[:, None]
+
+        summary = pd.DataFrame({
+            'user_id': np.asarray(user_index),
+            'income': income,
+            'months': months,
+            'avg_spending': avg_spending,
+            'savings': savings,
+            'savings_rate': savings_rate,
+            'needs_share': needs_share,
+            'wants_share': wants_share,
+            'needs_gap': needs_share - 0.5,
+            'wants_gap': wants_share - 0.3,
+            'savings_gap': 0.2 - savings_rate,
+        })
+
+        # Only keep categories the user has actually spent in
+        user_rows, category_cols = np.nonzero(spending)
+        categories = pd.DataFrame({
+            'user_id': np.asarray(user_index)[user_rows],
+            'category': np.asarray(category_index)[category_cols],
+            'avg_spending': monthly[user_rows, category_cols],
+            'target': targets[user_rows, category_cols],
+            'share_of_income': share_of_income[user_rows, category_cols],
+            'over_budget': monthly[user_rows, category_cols] > targets[user_rows, category_cols],
+        })
+
+        return summary, categories
+
+    @staticmethod
+    def _month_numbers(months: pd.Series) -> np.ndarray:
+        """Convert 'YYYY-MM' strings to consecutive month numbers."""
+        return months.str[:4].astype(int).to_numpy() * 12 + months.str[5:7].astype(int).to_numpy()
+
+    def refresh(self, user_ids=None):
+        """Compute recommendations and store them for the UI and chatbot.
+
+        Args:
+            user_ids: Only refresh these users (default: all users)
+
+        Returns:
+            Number of users refreshed
+        """
+        summary, categories = self.compute(user_ids)
+        computed_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+        with sqlite3.connect(self.db_path) as conn:
+            if user_ids is None:
+                conn.execute("DELETE FROM budget_recommendations")
+                conn.execute("DELETE FROM category_budgets")
+            else:
+                for batch in id_batches(user_ids):
+                    placeholders = ', '.join('?' for _ in batch)
+                    conn.execute(f"DELETE FROM budget_recommendations WHERE user_id IN ({placeholders})", batch)
+                    conn.execute(f"DELETE FROM category_budgets WHERE user_id IN ({placeholders})", batch)
+
+            if summary.empty:
+                return 0
+
+            summary = summary.assign(computed_at=computed_at)
+            conn.executemany(
+                f"""INSERT INTO budget_recommendations ({', '.join(summary.columns)})
+                VALUES ({', '.join('?' for _ in summary.columns)})""",
+                summary.astype(object).where(summary.notna(), None).itertuples(index=False, name=None)
+            )
+            conn.executemany(
+                f"""INSERT INTO category_budgets ({', '.join(categories.columns)})
+                VALUES ({', '.join('?' for _ in categories.columns)})""",
+                categories.astype(object).where(categories.notna(), None).itertuples(index=False, name=None)
+            )
+
+        return len(summary)
+
+    def get_recommendations(self, user_id: int):
+        """Look up the stored recommendations for a user.
+
+        Args:
+            user_id: The ID of the user
+
+        Returns:
+            Tuple of (summary dict or None, category budgets DataFrame ordered by
+            average spending)
+        """
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            row = conn.execute(
+                "SELECT * FROM budget_recommendations WHERE user_id = ?", (user_id,)
+            ).fetchone()
+            categories = pd.read_sql(
+                """SELECT category, avg_spending, target, share_of_income, over_budget
+                FROM category_budgets WHERE user_id = ?
+                ORDER BY avg_spending DESC""",
+                conn,
+                params=(user_id,)
+            )
+
+        return (dict(row) if row is not None else None), categories
+
+
+def recurring_schedule(payments: pd.DataFrame, end_date) -> pd.DataFrame:
+    """Expand recurring payments into individual payment dates.
+
+    Each payment is stepped on its calendar cadence from its last observed date,
+    backwards over its observed occurrences and forwards up to ``end_date``, so
+    the schedule covers the past payments and the expected future ones. Past
+    dates are stepped rather than observed, so they can be a few days off the
+    real postings (a payment on the 31st steps back to the 30th).
+
+    Args:
+        payments: DataFrame with category, amount, cadence, last_date and
+            occurrences columns
+        end_date: Last date to include
+
+    Returns:
+        DataFrame with category, date and amount columns
+    """
+    cadences = {name: (days, step) for name, days, step in CADENCES}
+    end_date = pd.Timestamp(end_date)
+    schedule = []
+
+    for payment in payments.itertuples(index=False):
+        nominal_days, step = cadences[payment.cadence]
+        last_date = pd.Timestamp(payment.last_date)
+        ahead = max(int(np.ceil((end_date - last_date).days / nominal_days)) + 1, 0)
+        dates = pd.DatetimeIndex([
+            last_date + step * k for k in range(1 - int(payment.occurrences), ahead + 1)
+        ])
+        schedule.append(pd.DataFrame({
+            'category': payment.category,
+            'date': dates[dates <= end_date],
+            'amount': payment.amount
+        }))
+
+    if not schedule:
+        return pd.DataFrame(columns=['category', 'date', 'amount'])
+    return pd.concat(schedule, ignore_index=True)
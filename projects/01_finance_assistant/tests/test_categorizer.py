@@ -0,0 +1,394 @@
+"""Tests for the transaction categorizer module."""
+
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+from db_init import ensure_schema
+from models.categorizer import (
+    RuleCategorizer, CategoryClassifier, EmbeddingCategorizer, RecategorizationJob,
+    hash_features, _trie_pattern
+)
+
+
+class StubEmbeddingHandler(BaseHTTPRequestHandler):
+    """Mimics Ollama's /api/embed endpoint with character trigram embeddings."""
+
+    requests_seen = []
+
+    def do_POST(self):
+        """Return one deterministic embedding per input text."""
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        if self.path != '/api/embed':
+            self.send_error(404)
+            return
+        self.requests_seen.append(payload['input'])
+
+        embeddings = []
+        for text in payload['input']:
+            vector = [0.0] * 64
+            padded = f' {text} '
+            for i in range(len(padded) - 2):
+                vector[zlib.crc32(padded[i:i + 3].encode()) % 64] += 1.0
+            embeddings.append(vector)
+
+        body = json.dumps({'model': payload['model'], 'embeddings': embeddings}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        """Keep test output quiet."""
+
+
+class TestRuleCategorizer(unittest.TestCase):
+    """Test cases for the RuleCategorizer class."""
+
+    def setUp(self):
+        """Set up the default categorizer."""
+        self.categorizer = RuleCategorizer()
+
+    def test_trie_pattern_matches_every_keyword(self):
+        """Test that the compiled trie matches exactly the keywords it was built from."""
+        import re
+        keywords = ['car', 'card', 'care', 'cart', 'bus', 'c']
+        pattern = re.compile('(?:' + _trie_pattern(keywords) + r')\Z')
+        for keyword in keywords:
+            self.assertTrue(pattern.match(keyword), keyword)
+        for other in ['ca', 'cards', 'bu', '']:
+            self.assertIsNone(pattern.match(other), other)
+
+    def test_categorize_sample_descriptions(self):
+        """Test categorizing typical bank statement descriptions."""
+        descriptions = pd.Series([
+            'GROCERY STORE #123', 'RENT PAYMENT', 'GAS STATION #789', 'NETFLIX/SPOTIFY',
+            'ELECTRIC COMPANY', 'MEDICAL CENTER', 'PAYROLL DEPOSIT'
+        ])
+        result = self.categorizer.categorize(descriptions)
+
+        self.assertEqual(result.tolist(), [
+            'Food', 'Housing', 'Transportation', 'Entertainment', 'Utilities', 'Healthcare', None
+        ])
+
+    def test_longest_keyword_wins(self):
+        """Test that a longer keyword takes precedence at the same position."""
+        self.assertEqual(self.categorizer.categorize_one('UBER   EATS 8841'), 'Food')
+        self.assertEqual(self.categorizer.categorize_one('UBER TRIP HELP.UBER.COM'), 'Transportation')
+
+    def test_whole_words_only(self):
+        """Test that keywords do not match inside other words."""
+        self.assertIsNone(self.categorizer.categorize_one('PARENTAL SERVICES'))
+        self.assertEqual(self.categorizer.categorize_one('RENT-A-SPACE'), 'Housing')
+
+    def test_batch_matches_single_and_handles_missing(self):
+        """Test that the batch API agrees with single lookups and keeps the index."""
+        descriptions = pd.Series(
+            ['Starbucks 55', None, 'Starbucks 55', 'CVS/PHARMACY', 'Unknown Shop'],
+            index=[10, 11, 12, 13, 14]
+        )
+        result = self.categorizer.categorize(descriptions)
+
+        self.assertEqual(list(result.index), [10, 11, 12, 13, 14])
+        self.assertIsNone(result[11])
+        for idx in [10, 12, 13, 14]:
+            self.assertEqual(result[idx], self.categorizer.categorize_one(descriptions[idx]))
+
+    def test_add_rules_overrides_keyword(self):
+        """Test that custom rules are compiled in and can reassign a keyword."""
+        categorizer = RuleCategorizer({'Food': ['acme']})
+        self.assertEqual(categorizer.categorize_one('ACME CORP'), 'Food')
+
+        categorizer.add_rules({'Miscellaneous': ['acme', 'acme corp']})
+        self.assertEqual(categorizer.categorize_one('ACME CORP'), 'Miscellaneous')
+        self.assertEqual(categorizer.rules, {'Miscellaneous': ['acme', 'acme corp']})
+
+
+class TestCategoryClassifier(unittest.TestCase):
+    """Test cases for the CategoryClassifier class."""
+
+    def setUp(self):
+        """Set up a temporary model directory and training data."""
+        self.model_dir = tempfile.mkdtemp()
+        self.descriptions = [
+            'GROCERY STORE #123', 'SAFEWAY 0042', 'NETFLIX.COM', 'SPOTIFY USA',
+            'SHELL OIL 5544', 'CHEVRON 0031', 'PG&E ELECTRIC', 'COMCAST CABLE'
+        ]
+        self.categories = [
+            'Food', 'Food', 'Entertainment', 'Entertainment',
+            'Transportation', 'Transportation', 'Utilities', 'Utilities'
+        ]
+
+    def tearDown(self):
+        """Remove the temporary model directory."""
+        shutil.rmtree(self.model_dir)
+
+    def test_hash_features(self):
+        """Test that features are stable, normalized and ignore store numbers."""
+        features = hash_features(['GROCERY STORE #123', 'grocery store #999', None], n_features=1024)
+
+        self.assertEqual(features.shape, (3, 1024))
+        np.testing.assert_allclose(features[0].toarray(), features[1].toarray())
+        self.assertAlmostEqual(float(features[0].multiply(features[0]).sum()), 1.0, places=5)
+        self.assertEqual(features[2].nnz, 0)
+
+    def test_untrained_model_predicts_nothing(self):
+        """Test that an untrained model returns no categories."""
+        classifier = CategoryClassifier(self.model_dir)
+
+        self.assertFalse(classifier.is_trained)
+        self.assertEqual(classifier.predict(['NETFLIX.COM']).tolist(), [None])
+
+    def test_partial_fit_and_predict(self):
+        """Test that the model learns categories from labelled descriptions."""
+        classifier = CategoryClassifier(self.model_dir)
+        classifier.partial_fit(self.descriptions, self.categories)
+
+        predictions = classifier.predict(
+            ['GROCERY STORE #999', 'NETFLIX 12', 'SHELL 99', 'COMCAST INTERNET', 'ZZZ', None]
+        )
+        self.assertEqual(predictions.tolist(), ['Food', 'Entertainment', 'Transportation', 'Utilities', None, None])
+
+    def test_weights_are_shared_and_updated_incrementally(self):
+        """Test that weights are memory-mapped and new categories extend the model."""
+        CategoryClassifier(self.model_dir).partial_fit(self.descriptions, self.categories)
+
+        classifier = CategoryClassifier(self.model_dir)
+        self.assertIsInstance(classifier.weights, np.memmap)
+        self.assertEqual(classifier.classes, ['Food', 'Entertainment', 'Transportation', 'Utilities'])
+
+        # A single new example must not pull unrelated descriptions towards its category
+        classifier.partial_fit(['WALGREENS 12'], ['Healthcare'])
+        self.assertEqual(classifier.predict(['WALGREENS 55', 'SAFEWAY 1']).tolist(), ['Healthcare', 'Food'])
+        self.assertEqual(CategoryClassifier(self.model_dir).weights.shape[1], 5)
+
+    def test_new_categories_replace_the_file_for_other_readers(self):
+        """Test that growing the model swaps in a new file that other instances reopen."""
+        writer = CategoryClassifier(self.model_dir)
+        writer.partial_fit(self.descriptions, self.categories)
+        reader = CategoryClassifier(self.model_dir)
+        old_mapping = reader.weights
+        old_snapshot = np.array(old_mapping)
+
+        writer.partial_fit(['WALGREENS 12'], ['Healthcare'])
+
+        # The reader's old mapping still holds the old matrix rather than a half-written one
+        np.testing.assert_array_equal(old_mapping, old_snapshot)
+        self.assertEqual(reader.predict(['WALGREENS 55']).tolist(), ['Healthcare'])
+        self.assertEqual(reader.weights.shape[1], 5)
+        self.assertEqual(sorted(os.listdir(self.model_dir)), ['classes.json', 'weights.npy'])
+
+
+class TestEmbeddingCategorizer(unittest.TestCase):
+    """Test cases for the EmbeddingCategorizer class against a stub server."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Start the stub embeddings server."""
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubEmbeddingHandler)
+        cls.base_url = f'http://127.0.0.1:{cls.server.server_address[1]}'
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        """Stop the stub embeddings server."""
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        """Set up a temporary database and a categorizer with labelled examples."""
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        StubEmbeddingHandler.requests_seen.clear()
+        self.categorizer = EmbeddingCategorizer(self.db_path, base_url=self.base_url, batch_size=2, k=1)
+        self.categorizer.add_examples(
+            ['BLUE BOTTLE COFFEE #12', 'PLANET FITNESS 0042', 'JIFFY LUBE 889'],
+            ['Food', 'Healthcare', 'Transportation']
+        )
+
+    def tearDown(self):
+        """Remove the temporary database."""
+        os.close(self.db_fd)
+        os.unlink(self.db_path)
+
+    def test_predict_nearest_example(self):
+        """Test that descriptions take the category of their nearest example."""
+        predictions = self.categorizer.predict(
+            ['BLUE BOTTLE COFFEE #99', 'SQ *PLANET FITNESS', None, 'ZQXJ VRRK']
+        )
+
+        self.assertEqual(predictions.tolist(), ['Food', 'Healthcare', None, None])
+
+    def test_embeddings_are_batched_and_cached(self):
+        """Test that texts are sent in batches and each is embedded only once."""
+        self.categorizer.embed(['NETFLIX.COM 1', 'NETFLIX.COM 2', 'SPOTIFY', 'HULU', 'AMC'])
+        self.assertEqual([len(batch) for batch in StubEmbeddingHandler.requests_seen], [2, 2])
+        self.assertEqual(sorted(sum(StubEmbeddingHandler.requests_seen, [])), ['amc', 'hulu', 'netflix.com', 'spotify'])
+
+        # A new instance reads the same merchants from the on-disk cache
+        StubEmbeddingHandler.requests_seen.clear()
+        other = EmbeddingCategorizer(self.db_path, base_url=self.base_url)
+        vectors = other.embed(['Netflix.com #7', 'HULU'])
+        self.assertEqual(StubEmbeddingHandler.requests_seen, [])
+        self.assertEqual(vectors.shape, (2, 64))
+        np.testing.assert_allclose(np.linalg.norm(vectors, axis=1), 1.0, rtol=1e-5)
+
+    def test_unreachable_server_predicts_nothing(self):
+        """Test that categorization degrades gracefully without Ollama."""
+        categorizer = EmbeddingCategorizer(self.db_path, base_url='http://127.0.0.1:9', timeout=1)
+
+        self.assertEqual(categorizer.predict(['ANYTHING']).tolist(), [None])
+
+
+class TestRecategorizationJob(unittest.TestCase):
+    """Test cases for the RecategorizationJob class."""
+
+    def setUp(self):
+        """Set up a database with miscategorized transactions."""
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        conn = sqlite3.connect(self.db_path)
+        conn.executescript('''
+        CREATE TABLE categories (category_id INTEGER PRIMARY KEY, name TEXT);
+        CREATE TABLE transactions (
+            transaction_id INTEGER PRIMARY KEY,
+            user_id INTEGER,
+            category_id INTEGER,
+            amount REAL,
+            transaction_date TEXT
+        );
+        ''')
+        conn.executemany("INSERT INTO categories VALUES (?, ?)", [
+            (1, 'Housing'), (2, 'Food'), (3, 'Transportation'), (7, 'Miscellaneous')
+        ])
+        ensure_schema(conn)
+
+        descriptions = ['GROCERY STORE #1', 'SHELL OIL 22', 'RENT PAYMENT', 'ACME WIDGETS', None]
+        # Imported rows that fell back to Miscellaneous when no rule matched
+        conn.executemany(
+            """INSERT INTO transactions
+            (user_id, category_id, amount, transaction_date, description, category_source)
+            VALUES (?, ?, ?, ?, ?, 'default')""",
+            [(1, 7, 10.0 + i, f'2024-{i % 12 + 1:02d}-15', descriptions[i % 5]) for i in range(100)]
+        )
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        """Remove the temporary database."""
+        os.close(self.db_fd)
+        os.unlink(self.db_path)
+
+    def query(self, sql):
+        """Run a query against the test database."""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            return conn.execute(sql).fetchall()
+        finally:
+            conn.close()
+
+    def test_recategorizes_in_resumable_chunks(self):
+        """Test that the job stops after max_chunks and resumes from its checkpoint."""
+        finished = []
+        job = RecategorizationJob(self.db_path, chunk_size=30, pause=0, on_finish=lambda: finished.append(True))
+
+        status = job.run(max_chunks=2)
+        self.assertEqual(status['last_transaction_id'], 74)
+        self.assertEqual(status['scanned'], 60)
+        self.assertIsNone(status['finished_at'])
+        self.assertEqual(finished, [])
+
+        status = RecategorizationJob(self.db_path, chunk_size=30, pause=0,
+                                     on_finish=lambda: finished.append(True)).run()
+        self.assertEqual(status['scanned'], 80)
+        self.assertEqual(status['updated'], 60)
+        self.assertIsNotNone(status['finished_at'])
+        self.assertEqual(finished, [True])
+
+        counts = dict(self.query("SELECT category_id, COUNT(*) FROM transactions GROUP BY category_id"))
+        self.assertEqual(counts, {1: 20, 2: 20, 3: 20, 7: 40})
+
+    def test_rollups_stay_consistent(self):
+        """Test that the monthly rollups match the transactions after the job."""
+        RecategorizationJob(self.db_path, chunk_size=7, pause=0).run()
+
+        expected = self.query(
+            """SELECT user_id, category_id, strftime('%Y-%m', transaction_date), ROUND(SUM(amount), 2), COUNT(*)
+            FROM transactions GROUP BY 1, 2, 3 ORDER BY 1, 2, 3"""
+        )
+        rollups = self.query(
+            """SELECT user_id, category_id, month, ROUND(total_amount, 2), txn_count
+            FROM monthly_rollups ORDER BY 1, 2, 3"""
+        )
+        self.assertEqual(rollups, expected)
+
+    def test_source_categories_and_edits_are_respected(self):
+        """Test the category filter and that rows edited since the read are skipped."""
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("UPDATE transactions SET category_id = 1 WHERE description = 'SHELL OIL 22'")
+        conn.commit()
+        conn.close()
+
+        RecategorizationJob(self.db_path, pause=0, source_category_ids=[7]).run()
+
+        counts = dict(self.query(
+            "SELECT description, category_id FROM transactions WHERE description IS NOT NULL GROUP BY 1"
+        ))
+        self.assertEqual(counts['SHELL OIL 22'], 1)
+        self.assertEqual(counts['GROCERY STORE #1'], 2)
+
+    def test_user_choices_and_other_users_are_kept(self):
+        """Test that mapped, manual, legacy and other users' rows are not re-categorized."""
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("UPDATE transactions SET category_source = 'mapping' WHERE description = 'SHELL OIL 22'")
+        conn.execute("UPDATE transactions SET category_source = NULL WHERE description = 'RENT PAYMENT'")
+        conn.execute(
+            """INSERT INTO transactions
+            (user_id, category_id, amount, transaction_date, description, category_source)
+            VALUES (2, 7, 5.0, '2024-01-01', 'GROCERY STORE #9', 'default')"""
+        )
+        conn.commit()
+        conn.close()
+
+        status = RecategorizationJob(self.db_path, pause=0, user_id=1).run()
+
+        self.assertEqual(status['scanned'], 40)
+        categories = dict(self.query(
+            "SELECT description, category_id FROM transactions WHERE description IS NOT NULL GROUP BY 1"
+        ))
+        self.assertEqual(categories, {
+            'ACME WIDGETS': 7, 'GROCERY STORE #1': 2, 'GROCERY STORE #9': 7,
+            'RENT PAYMENT': 7, 'SHELL OIL 22': 7
+        })
+        self.assertEqual(self.query(
+            "SELECT DISTINCT category_source FROM transactions WHERE description = 'GROCERY STORE #1'"
+        ), [('rules',)])
+
+    def test_classifier_categorizes_rows_no_rule_matches(self):
+        """Test that a retrained classifier reaches rows the rules leave alone."""
+        model_dir = tempfile.mkdtemp()
+        try:
+            classifier = CategoryClassifier(model_dir)
+            classifier.partial_fit(['ACME WIDGETS', 'ACME WIDGETS 2', 'NETFLIX.COM'],
+                                   ['Housing', 'Housing', 'Food'])
+
+            RecategorizationJob(self.db_path, pause=0, classifier=classifier).run()
+        finally:
+            shutil.rmtree(model_dir)
+
+        rows = self.query(
+            "SELECT DISTINCT category_id, category_source FROM transactions WHERE description = 'ACME WIDGETS'"
+        )
+        self.assertEqual(rows, [(1, 'classifier')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,196 @@
+"""Tests for the data processing utilities."""
+
+import os
+import sqlite3
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from utils.data_processor import (
+    MerchantNormalizer, MappingProfileStore, column_signature,
+    compact_transactions, transactions_between, expand_transactions
+)
+
+
+class TestMerchantNormalizer(unittest.TestCase):
+    """Test cases for the MerchantNormalizer class."""
+
+    def setUp(self):
+        """Set up a normalizer with an empty cache."""
+        self.normalizer = MerchantNormalizer(cache_size=128)
+
+    def test_strips_store_numbers_card_suffixes_and_dates(self):
+        """Test canonicalizing typical raw descriptions."""
+        cases = {
+            'GAS STATION #789': 'GAS STATION',
+            'grocery store #123': 'GROCERY STORE',
+            'SQ *BLUE BOTTLE COFFEE': 'BLUE BOTTLE COFFEE',
+            'PURCHASE AUTHORIZED ON 01/05 SAFEWAY #0042': 'SAFEWAY',
+            'CHECKCARD 0105 STARBUCKS STORE 05512': 'STARBUCKS',
+            'XXXX-XXXX-XXXX-1234 WALGREENS': 'WALGREENS',
+            'AMAZON.COM*MK1234AB': 'AMAZON.COM',
+            'DISNEY+ 2023-01-05': 'DISNEY+',
+            '7-ELEVEN 12345': '7-ELEVEN',
+            'AT&T BILL': 'AT&T BILL',
+        }
+        for raw, expected in cases.items():
+            self.assertEqual(self.normalizer.normalize(raw), expected, raw)
+        self.assertEqual(self.normalizer.normalize_series(list(cases)).tolist(), list(cases.values()))
+
+    def test_missing_descriptions(self):
+        """Test that missing descriptions normalize to an empty string."""
+        self.assertEqual(self.normalizer.normalize(None), '')
+        self.assertEqual(self.normalizer.normalize(float('nan')), '')
+
+    def test_normalize_series(self):
+        """Test normalizing a column keeps its index and handles missing values."""
+        descriptions = pd.Series(['GAS STATION #789', None, 'GAS STATION #123'], index=[5, 6, 7])
+        result = self.normalizer.normalize_series(descriptions)
+
+        self.assertEqual(list(result.index), [5, 6, 7])
+        self.assertEqual(result.tolist(), ['GAS STATION', '', 'GAS STATION'])
+
+    def test_normalize_series_matches_single_lookups(self):
+        """Test that batch normalization is line-safe and bypasses the cache."""
+        descriptions = [
+            'POS\nSHELL OIL 5744', 'CARD ENDING\nIN 1234 HULU', 'XX\n1234 TARGET -',
+            '  SQ *\tBLUE BOTTLE  ', '- . STORE 12 KROGER', '', 'NO 01/05',
+        ]
+        result = self.normalizer.normalize_series(descriptions)
+
+        self.assertEqual(result.tolist(), [MerchantNormalizer._normalize(d) for d in descriptions])
+        self.assertEqual(self.normalizer.cache_info().currsize, 0)
+
+    def test_cache_hit_ratio(self):
+        """Test that repeated merchants are served from the cache."""
+        self.assertEqual(self.normalizer.hit_ratio, 0.0)
+        merchants = ['GAS STATION #789', 'RENT PAYMENT', 'NETFLIX.COM']
+
+        for _ in range(4):
+            for merchant in merchants:
+                self.normalizer.normalize(merchant)
+
+        info = self.normalizer.cache_info()
+        self.assertEqual((info.hits, info.misses), (9, 3))
+        self.assertAlmostEqual(self.normalizer.hit_ratio, 0.75)
+
+        self.normalizer.clear_cache()
+        self.assertEqual(self.normalizer.hit_ratio, 0.0)
+
+
+class TestMappingProfileStore(unittest.TestCase):
+    """Test cases for the MappingProfileStore class."""
+
+    def setUp(self):
+        """Set up a temporary database."""
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        self.store = MappingProfileStore(self.db_path)
+
+    def tearDown(self):
+        """Remove the temporary database."""
+        os.close(self.db_fd)
+        os.unlink(self.db_path)
+
+    def test_column_signature(self):
+        """Test that the signature ignores column order, case and whitespace."""
+        signature = column_signature(['Transaction Date', 'Description', 'Category', 'Amount'])
+
+        self.assertEqual(signature, column_signature([' amount', 'CATEGORY', 'description', 'Transaction Date']))
+        self.assertNotEqual(signature, column_signature(['Date', 'Description', 'Category', 'Amount']))
+
+    def test_save_and_update_profile(self):
+        """Test that profiles are stored per user and source and can be updated."""
+        signature = column_signature(['Date', 'Category', 'Amount'])
+        self.store.save_profile(1, signature, {'Groceries': 2, 'Dining': 7, 42: 3})
+        self.store.save_profile(2, signature, {'Groceries': 4})
+
+        self.assertEqual(self.store.get_profile(1, signature), {'Groceries': 2, 'Dining': 7, '42': 3})
+        self.assertEqual(self.store.get_profile(1, 'other'), {})
+
+        self.store.save_profile(1, signature, {'Dining': 2})
+        self.assertEqual(self.store.get_profile(1, signature)['Dining'], 2)
+        self.assertEqual(self.store.get_profile(2, signature), {'Groceries': 4})
+
+    def test_profile_lookup_uses_primary_key(self):
+        """Test that loading a profile is a primary key search, not a table scan."""
+        conn = sqlite3.connect(self.db_path)
+        plan = ' '.join(row[-1] for row in conn.execute(
+            """EXPLAIN QUERY PLAN SELECT source_category, category_id FROM category_mapping_profiles
+            WHERE user_id = ? AND signature = ?""", (1, 'abc')
+        ))
+        conn.close()
+
+        self.assertIn('SEARCH', plan)
+        self.assertIn('PRIMARY KEY', plan)
+
+
+class TestCompactTransactions(unittest.TestCase):
+    """Test cases for the compact transaction frame."""
+
+    def setUp(self):
+        """Set up transactions in the order the database returns them."""
+        self.transactions = pd.DataFrame({
+            'transaction_id': [4, 3, 2, 1],
+            'amount': [19.99, 0.1, 1250.0, 45.67],
+            'transaction_date': pd.to_datetime(['2024-03-01', '2024-02-15', '2024-02-15', '2024-01-31']),
+            'category': ['Food', 'Food', 'Housing', 'Food'],
+            'category_id': [2, 2, 1, 2],
+            'description': ['NETFLIX.COM', None, 'RENT', 'NETFLIX.COM'],
+        })
+
+    def test_compact_dtypes_and_order(self):
+        """Test that the frame is narrow and sorted by date then ID."""
+        compact = compact_transactions(self.transactions)
+
+        self.assertEqual(compact['transaction_id'].tolist(), [1, 2, 3, 4])
+        self.assertEqual(compact['amount_cents'].tolist(), [4567, 125000, 10, 1999])
+        for column in ('transaction_id', 'date_code', 'amount_cents', 'category_id'):
+            self.assertEqual(compact[column].dtype, np.int32)
+        self.assertIsInstance(compact['category'].dtype, pd.CategoricalDtype)
+        self.assertEqual(list(compact['category'].cat.categories), ['Food', 'Housing'])
+
+    def test_large_amounts_and_unique_descriptions(self):
+        """Test that amounts beyond int32 cents widen and unique text stays plain."""
+        transactions = self.transactions.assign(
+            amount=[19.99, 0.1, 25_000_000.0, -30_000_000.0],
+            description=['NETFLIX.COM', 'RENT', 'SHELL OIL 5744', 'PAYROLL']
+        )
+        compact = compact_transactions(transactions)
+
+        self.assertEqual(compact['amount_cents'].dtype, np.int64)
+        self.assertEqual(compact['amount_cents'].tolist(), [-3_000_000_000, 2_500_000_000, 10, 1999])
+        self.assertEqual(compact['description'].dtype, object)
+        self.assertEqual(expand_transactions(compact)['description'].tolist(),
+                         ['PAYROLL', 'SHELL OIL 5744', 'RENT', 'NETFLIX.COM'])
+
+        repeated = compact_transactions(self.transactions.assign(description=['RENT'] * 4))
+        self.assertIsInstance(repeated['description'].dtype, pd.CategoricalDtype)
+
+    def test_range_slice_and_expand(self):
+        """Test date slicing and the round trip back to display format."""
+        compact = compact_transactions(self.transactions)
+
+        sliced = transactions_between(compact, '2024-02-15', '2024-02-29')
+        self.assertEqual(sliced['transaction_id'].tolist(), [2, 3])
+        self.assertEqual(len(transactions_between(compact, end_date='2024-01-30')), 0)
+
+        expanded = expand_transactions(compact)
+        expected = self.transactions.sort_values(['transaction_date', 'transaction_id'])
+        self.assertEqual(expanded['amount'].tolist(), expected['amount'].tolist())
+        self.assertTrue((expanded['transaction_date'].to_numpy() == expected['transaction_date'].to_numpy()).all())
+        self.assertEqual(expanded['description'].isna().tolist(), [False, False, True, False])
+        self.assertEqual(expanded['description'].iloc[3], 'NETFLIX.COM')
+
+    def test_empty_frame(self):
+        """Test that an empty result keeps the compact columns."""
+        compact = compact_transactions(self.transactions.iloc[:0])
+
+        self.assertTrue(compact.empty)
+        self.assertEqual(compact['date_code'].dtype, np.int32)
+        self.assertTrue(expand_transactions(compact).empty)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,10 +2,14 @@
 
 import os
 import sqlite3
+import unittest
 import pandas as pd
 from datetime import datetime, timedelta
 
-from models.forecaster import SpendingForecaster
+import numpy as np
+
+from models.forecaster import SpendingForecaster, detect_seasonality
+from models.recommender import RecurringPaymentDetector
 
 # Create a test database
 DB_PATH = "test_finance.db"
@@ -143,6 +147,134 @@ def test_forecaster():
     simple_forecast = forecaster.forecast_spending(2, forecast_months=2)
     print(simple_forecast)
 
+class TestForecastGranularity(unittest.TestCase):
+    """Tests for SQL-side bucketing at different granularities."""
+
+    @classmethod
+    def setUpClass(cls):
+        setup_test_db()
+        cls.forecaster = SpendingForecaster(DB_PATH)
+
+    @classmethod
+    def tearDownClass(cls):
+        if os.path.exists(DB_PATH):
+            os.remove(DB_PATH)
+
+    def test_history_totals_match_for_every_granularity(self):
+        monthly_total = self.forecaster.get_user_spending_history(1).to_numpy().sum()
+        for granularity in ['day', 'week', 'quarter']:
+            history = self.forecaster.get_user_spending_history(1, granularity=granularity)
+            self.assertAlmostEqual(history.to_numpy().sum(), monthly_total, places=6)
+
+    def test_daily_history_uses_dense_calendar(self):
+        history = self.forecaster.get_user_spending_history(1, granularity='day')
+        dates = pd.to_datetime(history.index)
+        self.assertEqual(len(history), (dates[-1] - dates[0]).days + 1)
+        self.assertTrue((history.sum(axis=1) == 0).any())
+
+    def test_max_periods_caps_history(self):
+        history = self.forecaster.get_user_spending_history(1, granularity='week', max_periods=4)
+        self.assertLessEqual(len(history), 4)
+
+    def test_daily_forecast_uses_future_days(self):
+        history = self.forecaster.get_user_spending_history(1, granularity='day')
+        forecast = self.forecaster.forecast_spending(1, forecast_months=7, granularity='day')
+        self.assertEqual(len(forecast), 7)
+        self.assertEqual(
+            pd.Timestamp(forecast.index[0]),
+            pd.Timestamp(history.index[-1]) + pd.Timedelta(days=1)
+        )
+        self.assertFalse(forecast.isna().any().any())
+
+    def test_rollups_follow_transaction_changes(self):
+        conn = sqlite3.connect(DB_PATH)
+        conn.execute("UPDATE transactions SET category_id = 2 WHERE category_id = 7")
+        conn.commit()
+        rollup_total, transaction_total = conn.execute(
+            "SELECT (SELECT SUM(total_amount) FROM monthly_rollups WHERE category_id = 2), "
+            "(SELECT SUM(amount) FROM transactions WHERE category_id = 2)"
+        ).fetchone()
+        leftover = conn.execute(
+            "SELECT COUNT(*) FROM monthly_rollups WHERE category_id = 7"
+        ).fetchone()[0]
+        conn.close()
+        self.assertAlmostEqual(rollup_total, transaction_total)
+        self.assertEqual(leftover, 0)
+
+
+class TestSeasonalityDetection(unittest.TestCase):
+    """Tests for the batched periodogram seasonality detector."""
+
+    def setUp(self):
+        rng = np.random.default_rng(42)
+        months = np.arange(48)
+        self.values = rng.normal(500, 20, size=(48, 200))
+        # Yearly cycle in the first 20 series, a December spike in the next 20
+        self.values[:, :20] += 150 * np.sin(2 * np.pi * months / 12)[:, None]
+        self.values[:, 20:40] += 400 * (months % 12 == 11)[:, None]
+
+    def test_flags_only_seasonal_series(self):
+        flags, strength = detect_seasonality(self.values, 12)
+        self.assertTrue(flags[:40].all())
+        self.assertLessEqual(flags[40:].sum(), 2)
+        self.assertGreater(strength[:20].min(), strength[40:].max())
+
+    def test_short_series_are_not_flagged(self):
+        flags, _ = detect_seasonality(self.values[:18], 12)
+        self.assertFalse(flags.any())
+
+    def test_seasonal_engine_follows_the_cycle(self):
+        history = pd.DataFrame(self.values[:, :1], columns=['Utilities'])
+        forecast = SpendingForecaster._forecast_seasonal_vectorized(history, 12, 12)['Utilities']
+        # The forecast peak should fall in the same phase as the sine peak (month 3)
+        self.assertEqual(int(np.argmax(forecast)) % 12, 3)
+
+
+class TestRecurringPaymentForecast(unittest.TestCase):
+    """Tests for forecasting with recurring payments taken out of the history."""
+
+    @classmethod
+    def setUpClass(cls):
+        setup_test_db()
+        conn = sqlite3.connect(DB_PATH)
+        conn.execute("INSERT INTO users (user_id, name, income) VALUES (3, 'Renter', 4000)")
+        conn.execute("INSERT INTO users (user_id, name, income) VALUES (4, 'Month-end renter', 3000)")
+        months = pd.period_range(end=pd.Period(datetime.now(), freq='M') - 1, periods=12, freq='M')
+        rows = []
+        for i, month in enumerate(months):
+            rows.append((3, 1, 1200.0, f"{month}-01"))
+            rows.append((3, 2, 300.0 + 40 * (i % 3), f"{month}-15"))
+            # Month-end rent lands a day or more off the calendar-stepped schedule
+            rows.append((4, 1, 900.0, str(month.end_time.date())))
+        conn.executemany(
+            "INSERT INTO transactions (user_id, category_id, amount, transaction_date) VALUES (?, ?, ?, ?)",
+            rows
+        )
+        conn.commit()
+        conn.close()
+        RecurringPaymentDetector(DB_PATH).refresh()
+        cls.forecaster = SpendingForecaster(DB_PATH)
+
+    @classmethod
+    def tearDownClass(cls):
+        if os.path.exists(DB_PATH):
+            os.remove(DB_PATH)
+
+    def test_recurring_category_is_forecast_from_schedule(self):
+        forecast = self.forecaster.forecast_spending(3, forecast_months=4)
+        self.assertEqual(forecast['Housing'].tolist(), [1200.0] * 4)
+        self.assertTrue((forecast['Food'] > 0).all())
+
+    def test_daily_forecast_does_not_double_count_recurring(self):
+        history = self.forecaster.get_user_spending_history(4, granularity='day', max_periods=365)
+        forecast = self.forecaster.forecast_spending(4, forecast_months=90, granularity='day')
+
+        # Ninety days of forecast should carry about three months of rent, at the
+        # same daily rate as the history, rather than the rent counted twice
+        daily_rate = history['Housing'].sum() / len(history)
+        self.assertAlmostEqual(forecast['Housing'].sum() / 90, daily_rate, delta=daily_rate * 0.1)
+
+
 if __name__ == "__main__":
     setup_test_db()
     test_forecaster()
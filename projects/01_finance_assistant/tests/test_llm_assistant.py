@@ -0,0 +1,1006 @@
+"""Tests for the Ollama assistant."""
+
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+
+from db_init import ensure_schema
+from models.llm_assistant import (
+    AsyncOllamaClient, ConversationMemory, EndpointPool, FinanceTools, FinancialContextBuilder,
+    OllamaAssistant, OllamaBusyError, OllamaHealthMonitor, ResponseCache, create_session
+)
+
+
+class StubOllamaHandler(BaseHTTPRequestHandler):
+    """Mimics Ollama's /api/generate and /api/chat endpoints, streaming one word per line."""
+
+    protocol_version = 'HTTP/1.1'
+    answer = 'You spent $120.50 on food.'
+    requests_seen = []
+    client_ports = set()
+    unavailable_responses = 0
+    tool_calls = []
+    always_call_tools = False
+    tools_supported = True
+    hold = None
+    stall = None
+    delay = 0.0
+    models = ['stub:latest']
+    active = 0
+    max_active = 0
+    active_lock = threading.Lock()
+
+    def do_GET(self):
+        """List the installed models, or report unavailable while asked to."""
+        self.client_ports.add(self.client_address[1])
+        if self.path != '/api/tags':
+            self.send_error(404)
+            return
+        if StubOllamaHandler.unavailable_responses > 0:
+            StubOllamaHandler.unavailable_responses -= 1
+            status, body = 503, b'{}'
+        else:
+            status, body = 200, json.dumps({'models': [{'name': name} for name in self.models]}).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        """Answer a generate request, streamed as NDJSON when asked to."""
+        self.client_ports.add(self.client_address[1])
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        with StubOllamaHandler.active_lock:
+            StubOllamaHandler.active += 1
+            StubOllamaHandler.max_active = max(StubOllamaHandler.max_active, StubOllamaHandler.active)
+        try:
+            if StubOllamaHandler.hold is not None:
+                StubOllamaHandler.hold.wait(5)
+            # Time the model takes to start answering
+            time.sleep(self.delay)
+            if self.path == '/api/chat':
+                self._chat(payload)
+            elif self.path != '/api/generate':
+                self.send_error(404)
+            else:
+                self._generate(payload)
+        finally:
+            with StubOllamaHandler.active_lock:
+                StubOllamaHandler.active -= 1
+
+    def _generate(self, payload):
+        """Answer a generate request."""
+        self.requests_seen.append(payload)
+        try:
+            self._send_generate(payload)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client closed the stream early
+            pass
+
+    def _send_generate(self, payload):
+        """Write the response to a generate request."""
+        if 'prompt' not in payload:
+            # A request without a prompt only loads the model
+            body = json.dumps({'model': payload['model'], 'response': '', 'done': True}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        # One token per word of the prompt and answer, continuing any context sent
+        context = payload.get('context', []) + list(range(len((payload['prompt'] + ' ' + self.answer).split())))
+
+        if not payload.get('stream', True):
+            body = json.dumps({'model': payload['model'], 'response': self.answer, 'done': True,
+                               'context': context}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        words = self.answer.split(' ')
+        for i, word in enumerate(words):
+            token = word if i == 0 else ' ' + word
+            self._write_chunk(json.dumps({'response': token, 'done': False}).encode() + b'\n')
+            if StubOllamaHandler.stall is not None:
+                # Stop mid-answer, like a model that is slow to produce its next token
+                StubOllamaHandler.stall.wait(5)
+            time.sleep(0.05)
+        self._write_chunk(json.dumps({'response': '', 'done': True, 'context': context}).encode() + b'\n')
+        self._write_chunk(b'')
+
+    def _chat(self, payload):
+        """Answer a chat request with the scripted tool calls, then with the answer."""
+        self.requests_seen.append(payload)
+        if 'tools' in payload and not self.tools_supported:
+            body = json.dumps({'error': 'stub does not support tools'}).encode()
+            self.send_response(400)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        calls_tools = 'tools' in payload and (self.always_call_tools or payload['messages'][-1]['role'] == 'user')
+        if calls_tools and self.tool_calls:
+            message = {'role': 'assistant', 'content': '', 'tool_calls': self.tool_calls}
+            self._write_chunk(json.dumps({'message': message, 'done': False}).encode() + b'\n')
+        else:
+            for i, word in enumerate(self.answer.split(' ')):
+                token = word if i == 0 else ' ' + word
+                message = {'role': 'assistant', 'content': token}
+                self._write_chunk(json.dumps({'message': message, 'done': False}).encode() + b'\n')
+        message = {'role': 'assistant', 'content': ''}
+        self._write_chunk(json.dumps({'message': message, 'done': True}).encode() + b'\n')
+        self._write_chunk(b'')
+
+    def _write_chunk(self, data):
+        """Send one chunk of a chunked response, as Ollama does per token."""
+        self.wfile.write(f'{len(data):x}\r\n'.encode() + data + b'\r\n')
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        """Keep test output quiet."""
+
+
+class TestOllamaAssistant(unittest.TestCase):
+    """Test cases for the OllamaAssistant class."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Start a stub Ollama server on a free port."""
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubOllamaHandler)
+        cls.base_url = f'http://127.0.0.1:{cls.server.server_address[1]}'
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        """Stop the stub Ollama server."""
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        """Set up an assistant pointed at the stub server."""
+        StubOllamaHandler.requests_seen.clear()
+        StubOllamaHandler.client_ports.clear()
+        StubOllamaHandler.unavailable_responses = 0
+        self.assistant = OllamaAssistant(model_name='stub', base_url=self.base_url, session=create_session())
+        self.financial_data = {'user_info': {'name': 'Test', 'income': 5000}}
+
+    def test_generate_response(self):
+        """Test the blocking call returns the whole answer."""
+        answer = self.assistant.generate_response('What did I spend?', self.financial_data)
+
+        self.assertEqual(answer, StubOllamaHandler.answer)
+        self.assertFalse(StubOllamaHandler.requests_seen[0]['stream'])
+
+    def test_stream_response_yields_tokens_before_completion(self):
+        """Test that the first token arrives before the answer is finished."""
+        start = time.monotonic()
+        stream = self.assistant.stream_response('What did I spend?', self.financial_data)
+        first_token = next(stream)
+        first_token_latency = time.monotonic() - start
+        tokens = [first_token] + list(stream)
+        total_latency = time.monotonic() - start
+
+        self.assertEqual(''.join(tokens), StubOllamaHandler.answer)
+        self.assertGreater(len(tokens), 1)
+        self.assertLess(first_token_latency, total_latency / 2)
+        self.assertTrue(StubOllamaHandler.requests_seen[0]['stream'])
+        self.assertEqual(self.assistant.conversation_history, [
+            {'role': 'user', 'content': 'What did I spend?'},
+            {'role': 'assistant', 'content': StubOllamaHandler.answer},
+        ])
+
+    def test_session_reuses_connection(self):
+        """Test that consecutive calls share one keep-alive connection."""
+        self.assertTrue(self.assistant.check_ollama_availability())
+        self.assertEqual(self.assistant.get_available_models(), ['stub:latest'])
+        self.assistant.generate_response('Hello', self.financial_data)
+        list(self.assistant.stream_response('Hello again', self.financial_data))
+        self.assistant.generate_response('Bye', self.financial_data)
+
+        self.assertEqual(len(StubOllamaHandler.client_ports), 1)
+
+    def test_unavailable_responses_are_retried(self):
+        """Test that a 503 is retried with backoff before giving up."""
+        assistant = OllamaAssistant(base_url=self.base_url,
+                                    session=create_session(retries=2, backoff_factor=0.01))
+        StubOllamaHandler.unavailable_responses = 2
+        self.assertTrue(assistant.check_ollama_availability())
+
+        StubOllamaHandler.unavailable_responses = 3
+        self.assertFalse(assistant.check_ollama_availability())
+
+    def test_cached_answers_skip_the_server(self):
+        """Test that repeated questions are answered from the cache until the data changes."""
+        cache = ResponseCache()
+        financial_data = dict(self.financial_data, data_version=1)
+
+        def new_assistant():
+            return OllamaAssistant(model_name='stub', base_url=self.base_url, session=create_session(),
+                                   response_cache=cache)
+
+        first = new_assistant().generate_response('What did I spend?', financial_data)
+        assistant = new_assistant()
+        second = ''.join(assistant.stream_response('What did I spend?', financial_data))
+        self.assertEqual(first, second)
+        self.assertEqual(len(StubOllamaHandler.requests_seen), 1)
+        self.assertEqual(len(assistant.conversation_history), 2)
+
+        new_assistant().generate_response('What did I spend?', dict(financial_data, data_version=2))
+        new_assistant().generate_response('What did I spend?', financial_data, temperature=0.2)
+        self.assertEqual(len(StubOllamaHandler.requests_seen), 3)
+
+        # Asking again later in the same conversation is still a cache hit
+        assistant.generate_response('Any advice?', dict(financial_data, data_version=3))
+        self.assertEqual(assistant.generate_response('What did I spend?', financial_data), first)
+        self.assertEqual(len(StubOllamaHandler.requests_seen), 4)
+
+    def test_later_turns_continue_from_model_context(self):
+        """Test that follow-up questions send the token state instead of the full prompt."""
+        financial_data = {'user_info': {'user_id': 1, 'name': 'Test', 'income': 5000}, 'data_version': 1}
+        self.assistant.generate_response('What did I spend?', financial_data)
+        list(self.assistant.stream_response('And last month?', financial_data))
+        self.assistant.generate_response('Any advice?', financial_data)
+
+        first, second, third = StubOllamaHandler.requests_seen
+        self.assertNotIn('context', first)
+        self.assertIn('Financial Data Summary', first['prompt'])
+        self.assertEqual(second['prompt'], 'User question: And last month?\n\nResponse:')
+        self.assertNotIn('system', second)
+        self.assertTrue(second['context'])
+        self.assertEqual(third['context'][:len(second['context'])], second['context'])
+        self.assertEqual(first['keep_alive'], self.assistant.keep_alive)
+
+        # New data, a new model or a cleared conversation start from a full prompt
+        financial_data['data_version'] = 2
+        self.assistant.generate_response('What now?', financial_data)
+        self.assertNotIn('context', StubOllamaHandler.requests_seen[-1])
+        self.assistant.clear_conversation()
+        self.assertIsNone(self.assistant.memory.model_context)
+
+    def test_model_context_dropped_when_window_is_full(self):
+        """Test that a token state too long for the context window is not continued."""
+        self.assistant.context_window = 510
+        financial_data = {'user_info': {'user_id': 1, 'name': 'Test', 'income': 5000}, 'data_version': 1}
+        self.assistant.generate_response('What did I spend?', financial_data)
+        self.assistant.generate_response('And last month?', financial_data)
+
+        self.assertNotIn('context', StubOllamaHandler.requests_seen[-1])
+        self.assertIn('Recent conversation', StubOllamaHandler.requests_seen[-1]['prompt'])
+
+    def test_warm_up_loads_model(self):
+        """Test that warming up sends a prompt-less request that keeps the model loaded."""
+        self.assertTrue(self.assistant.warm_up('other'))
+        self.assertEqual(StubOllamaHandler.requests_seen[-1],
+                         {'model': 'other', 'keep_alive': self.assistant.keep_alive, 'stream': False})
+
+    def test_stream_response_connection_error(self):
+        """Test that an unreachable server yields one error message."""
+        assistant = OllamaAssistant(model_name='stub', base_url='http://127.0.0.1:9')
+        tokens = list(assistant.stream_response('Hello', self.financial_data))
+
+        self.assertEqual(len(tokens), 1)
+        self.assertIn("couldn't connect", tokens[0])
+
+
+class TestAsyncOllamaClient(unittest.TestCase):
+    """Test cases for the AsyncOllamaClient request queue."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Start a stub Ollama server on a free port."""
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubOllamaHandler)
+        cls.base_url = f'http://127.0.0.1:{cls.server.server_address[1]}'
+        cls.url = f'{cls.base_url}/api/generate'
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        """Stop the stub Ollama server."""
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        """Reset the stub server's records."""
+        StubOllamaHandler.requests_seen.clear()
+        StubOllamaHandler.max_active = 0
+        StubOllamaHandler.hold = None
+        StubOllamaHandler.stall = None
+        self.clients = []
+
+    def tearDown(self):
+        """Release held requests and stop the clients."""
+        for name in ('hold', 'stall'):
+            event = getattr(StubOllamaHandler, name)
+            if event is not None:
+                event.set()
+                setattr(StubOllamaHandler, name, None)
+        for client in self.clients:
+            client.close()
+
+    def make_client(self, **kwargs):
+        """Create a client that is closed after the test."""
+        client = AsyncOllamaClient(session=create_session(), **kwargs)
+        self.clients.append(client)
+        return client
+
+    def payload(self, prompt='Hi', stream=True):
+        return {'model': 'stub', 'prompt': prompt, 'stream': stream}
+
+    def wait_for(self, condition, timeout=5):
+        """Wait until a condition holds."""
+        end = time.monotonic() + timeout
+        while not condition() and time.monotonic() < end:
+            time.sleep(0.01)
+        self.assertTrue(condition())
+
+    def test_limits_requests_in_flight(self):
+        """Test that concurrent callers never have more than max_in_flight requests at Ollama."""
+        client = self.make_client(max_in_flight=2)
+        answers = []
+
+        def ask(i):
+            chunks = client.stream(self.url, self.payload(f'q{i}'))
+            answers.append(''.join(chunk.get('response', '') for chunk in chunks))
+
+        threads = [threading.Thread(target=ask, args=(i,)) for i in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+
+        self.assertEqual(answers, [StubOllamaHandler.answer] * 5)
+        self.assertEqual(StubOllamaHandler.max_active, 2)
+        self.wait_for(lambda: client.metrics()['in_flight'] == 0)
+        metrics = client.metrics()
+        self.assertEqual((metrics['submitted'], metrics['completed'], metrics['queued']), (5, 5, 0))
+        self.assertGreater(metrics['wait_p95'], 0)
+
+    def test_full_queue_rejects_and_deadlines_expire(self):
+        """Test that a full queue turns requests away and waiting requests time out."""
+        StubOllamaHandler.hold = threading.Event()
+        client = self.make_client(max_in_flight=1, max_queue=1)
+        running = threading.Thread(target=lambda: list(client.stream(self.url, self.payload('first'))),
+                                   daemon=True)
+        running.start()
+        self.wait_for(lambda: client.metrics()['in_flight'] == 1)
+
+        waiting = client.stream(self.url, self.payload('second'), deadline=0.2)
+        with self.assertRaises(TimeoutError):
+            next(waiting)
+        # The request that timed out gave up its place in the queue
+        self.assertEqual(client.metrics()['queued'], 0)
+        queued = threading.Thread(target=lambda: list(client.stream(self.url, self.payload('third'))),
+                                  daemon=True)
+        queued.start()
+        self.wait_for(lambda: client.metrics()['queued'] == 1)
+        with self.assertRaises(OllamaBusyError):
+            next(client.stream(self.url, self.payload('fourth')))
+
+        StubOllamaHandler.hold.set()
+        running.join(5)
+        queued.join(5)
+        metrics = client.metrics()
+        self.assertEqual((metrics['completed'], metrics['timed_out'], metrics['rejected']), (2, 1, 1))
+        # The request that timed out while waiting was never sent
+        self.assertEqual([payload['prompt'] for payload in StubOllamaHandler.requests_seen], ['first', 'third'])
+
+    def test_closing_the_stream_cancels_the_request(self):
+        """Test that a caller that stops reading frees its slot."""
+        client = self.make_client(max_in_flight=1)
+        chunks = client.stream(self.url, self.payload())
+        next(chunks)
+        chunks.close()
+
+        self.assertEqual(client.metrics()['cancelled'], 1)
+        self.wait_for(lambda: client.metrics()['in_flight'] == 0)
+        self.assertEqual(list(client.stream(self.url, self.payload(stream=False)))[0]['response'],
+                         StubOllamaHandler.answer)
+
+    def test_cancelling_shuts_down_a_stalled_response(self):
+        """Test that cancelling ends a read blocked waiting for the next chunk."""
+        StubOllamaHandler.stall = threading.Event()
+        client = self.make_client(max_in_flight=1)
+        chunks = client.stream(self.url, self.payload())
+        next(chunks)
+        start = time.monotonic()
+        chunks.close()
+
+        # The worker is not left waiting for Ollama's next line
+        self.wait_for(lambda: client.metrics()['in_flight'] == 0, timeout=1)
+        self.assertLess(time.monotonic() - start, 1)
+        # Let the stub's handler finish so it does not count as active later
+        StubOllamaHandler.stall.set()
+        StubOllamaHandler.stall = None
+        self.wait_for(lambda: StubOllamaHandler.active == 0)
+        self.assertEqual(list(client.stream(self.url, self.payload(stream=False)))[0]['response'],
+                         StubOllamaHandler.answer)
+
+    def test_assistant_uses_the_queue(self):
+        """Test that an assistant sends its generations through the client."""
+        client = self.make_client()
+        assistant = OllamaAssistant(model_name='stub', base_url=self.base_url, client=client)
+        answer = assistant.generate_response('Hello', {'user_info': {'name': 'Test', 'income': 5000}})
+
+        self.assertEqual(answer, StubOllamaHandler.answer)
+        self.assertEqual(client.metrics()['completed'], 1)
+
+        StubOllamaHandler.hold = threading.Event()
+        busy = self.make_client(max_in_flight=1, max_queue=0, deadline=0.2)
+        assistant.client = busy
+        self.assertIn('took too long', assistant.generate_response('Hello', {}))
+        self.assertIn('busy', assistant.generate_response('Hello', {}))
+
+
+class TestEndpointPool(unittest.TestCase):
+    """Test cases for spreading requests over several stub servers."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Start a fast, a second fast and a slow stub server, each with its own request log."""
+        cls.servers = {}
+        for name, delay in (('fast', 0.0), ('other', 0.0), ('slow', 0.6)):
+            handler = type(f'{name.title()}Handler', (StubOllamaHandler,),
+                           {'delay': delay, 'requests_seen': [], 'models': ['stub:latest', f'{name}-only:latest']})
+            server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            cls.servers[name] = (server, handler, f'http://127.0.0.1:{server.server_address[1]}')
+
+    @classmethod
+    def tearDownClass(cls):
+        """Stop the stub servers."""
+        for server, _, _ in cls.servers.values():
+            server.shutdown()
+            server.server_close()
+
+    def setUp(self):
+        """Clear the servers' request logs."""
+        StubOllamaHandler.hold = None
+        for _, handler, _ in self.servers.values():
+            handler.requests_seen.clear()
+
+    def tearDown(self):
+        """Release held requests."""
+        if StubOllamaHandler.hold is not None:
+            StubOllamaHandler.hold.set()
+            StubOllamaHandler.hold = None
+
+    def url(self, name):
+        return self.servers[name][2]
+
+    def seen(self, name):
+        return [payload['model'] for payload in self.servers[name][1].requests_seen]
+
+    def ask(self, pool, model='stub', stream=True):
+        """Send a generate request through the pool and return the answer."""
+        chunks = pool.read_chunks('/api/generate', {'model': model, 'prompt': 'Hi', 'stream': stream}, 5)
+        return ''.join(chunk.get('response', '') for chunk in chunks)
+
+    def test_least_outstanding(self):
+        """Test that concurrent requests are spread evenly."""
+        pool = EndpointPool([self.url('fast'), self.url('other')], session=create_session())
+        StubOllamaHandler.hold = threading.Event()
+        threads = [threading.Thread(target=self.ask, args=(pool,), daemon=True) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        end = time.monotonic() + 5
+        while sum(status['outstanding'] for status in pool.status()) < 4 and time.monotonic() < end:
+            time.sleep(0.01)
+
+        self.assertEqual([status['outstanding'] for status in pool.status()], [2, 2])
+        StubOllamaHandler.hold.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual([status['outstanding'] for status in pool.status()], [0, 0])
+
+    def test_model_affinity(self):
+        """Test that a model goes back to the endpoint that served it last."""
+        pool = EndpointPool([self.url('fast'), self.url('other')], session=create_session(),
+                            balancing='model_affinity')
+        StubOllamaHandler.hold = threading.Event()
+        first = threading.Thread(target=self.ask, args=(pool, 'model-a'), daemon=True)
+        first.start()
+        while pool.status()[0]['outstanding'] == 0:
+            time.sleep(0.01)
+        second = threading.Thread(target=self.ask, args=(pool, 'model-b'), daemon=True)
+        second.start()
+        StubOllamaHandler.hold.set()
+        first.join(5)
+        second.join(5)
+
+        for _ in range(3):
+            self.ask(pool, 'model-b')
+            self.ask(pool, 'model-a')
+        self.assertEqual(self.seen('fast'), ['model-a'] * 4)
+        self.assertEqual(self.seen('other'), ['model-b'] * 4)
+
+    def test_failover_and_health(self):
+        """Test that an unreachable endpoint is skipped once it has failed."""
+        pool = EndpointPool(['http://127.0.0.1:9', self.url('fast')], session=create_session(retries=0),
+                            failure_threshold=1)
+
+        self.assertEqual(self.ask(pool), StubOllamaHandler.answer)
+        self.assertEqual(self.ask(pool, stream=False), StubOllamaHandler.answer)
+        dead, live = pool.status()
+        self.assertEqual((dead['healthy'], dead['requests'], dead['failures']), (False, 1, 1))
+        self.assertEqual((live['healthy'], live['requests'], live['models']), (True, 2, ['stub']))
+
+        # A health check learns which models each endpoint has installed
+        pool = EndpointPool([self.url('fast'), self.url('other')], session=create_session())
+        pool.check()
+        self.ask(pool, 'other-only')
+        self.assertEqual(self.seen('other'), ['other-only'])
+
+    def test_health_monitor_checks_every_endpoint(self):
+        """Test that the monitor probes the pool and reports the healthy instances' models."""
+        pool = EndpointPool(['http://127.0.0.1:9', self.url('fast'), self.url('other')],
+                            session=create_session())
+        monitor = OllamaHealthMonitor(pool=pool, interval=0.05, session=create_session(retries=0))
+        monitor.start()
+        try:
+            deadline = time.monotonic() + 5
+            while not monitor.status()['checked'] and time.monotonic() < deadline:
+                time.sleep(0.01)
+        finally:
+            monitor.stop()
+
+        status = monitor.status()
+        self.assertTrue(status['available'])
+        self.assertEqual(status['models'], ['stub:latest', 'fast-only:latest', 'other-only:latest'])
+        self.assertEqual([endpoint['healthy'] for endpoint in pool.status()], [False, True, True])
+
+        # A pool with no healthy instance reads as unavailable
+        monitor = OllamaHealthMonitor(pool=EndpointPool(['http://127.0.0.1:9']), session=create_session(retries=0))
+        self.assertEqual(monitor.refresh()['available'], False)
+
+    def test_hedging_slow_requests(self):
+        """Test that a slow endpoint's request is raced against a fast one."""
+        pool = EndpointPool([self.url('slow'), self.url('fast')], session=create_session(), hedge_after=0.1)
+        start = time.monotonic()
+        answer = self.ask(pool)
+
+        self.assertEqual(answer, StubOllamaHandler.answer)
+        self.assertLess(time.monotonic() - start, 0.6)
+        self.assertEqual((pool.hedged, pool.hedge_wins), (1, 1))
+        self.assertEqual(self.seen('fast'), ['stub'])
+
+        # Without hedging the same request waits for the slow endpoint
+        pool = EndpointPool([self.url('slow'), self.url('fast')], session=create_session())
+        start = time.monotonic()
+        self.ask(pool)
+        self.assertGreaterEqual(time.monotonic() - start, 0.6)
+
+    def test_hedges_count_against_the_client_limit(self):
+        """Test that a hedge is only sent while the client has a free slot."""
+        payload = {'model': 'stub', 'prompt': 'Hi', 'stream': True}
+        for max_in_flight, hedged in ((1, 0), (2, 1)):
+            pool = EndpointPool([self.url('slow'), self.url('fast')], session=create_session(), hedge_after=0.1)
+            client = AsyncOllamaClient(max_in_flight=max_in_flight, session=create_session())
+            try:
+                chunks = client.stream('/api/generate', payload, timeout=5,
+                                       reader=partial(pool.read_chunks, slots=client))
+                self.assertEqual(''.join(chunk.get('response', '') for chunk in chunks),
+                                 StubOllamaHandler.answer)
+                self.assertEqual(pool.hedged, hedged)
+                deadline = time.monotonic() + 5
+                while client.metrics()['in_flight'] and time.monotonic() < deadline:
+                    time.sleep(0.01)
+                self.assertEqual(client.metrics()['in_flight'], 0)
+            finally:
+                client.close()
+
+    def test_assistant_with_several_endpoints(self):
+        """Test that an assistant given several base URLs uses them all."""
+        assistant = OllamaAssistant(model_name='stub', base_url=[self.url('fast'), self.url('other')],
+                                    session=create_session())
+        StubOllamaHandler.hold = threading.Event()
+        financial_data = {'user_info': {'name': 'Test', 'income': 5000}}
+        threads = [threading.Thread(target=assistant.generate_response, args=('Hi', financial_data), daemon=True)
+                   for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        while sum(status['outstanding'] for status in assistant.pool.status()) < 2:
+            time.sleep(0.01)
+        StubOllamaHandler.hold.set()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual((self.seen('fast'), self.seen('other')), (['stub'], ['stub']))
+        self.assertEqual(assistant.base_url, self.url('fast'))
+
+
+class TestToolCalling(unittest.TestCase):
+    """Test cases for answering with FinanceTools over /api/chat."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Start a stub Ollama server on a free port."""
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubOllamaHandler)
+        cls.base_url = f'http://127.0.0.1:{cls.server.server_address[1]}'
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        """Stop the stub Ollama server."""
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        """Set up a database with described transactions and an assistant."""
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        conn = sqlite3.connect(self.db_path)
+        conn.executescript('''
+        CREATE TABLE categories (category_id INTEGER PRIMARY KEY, name TEXT);
+        CREATE TABLE transactions (
+            transaction_id INTEGER PRIMARY KEY,
+            user_id INTEGER,
+            category_id INTEGER,
+            amount REAL,
+            transaction_date TEXT,
+            description TEXT
+        );
+        INSERT INTO categories VALUES (2, 'Food'), (3, 'Transportation');
+        ''')
+        ensure_schema(conn)
+        conn.executemany(
+            """INSERT INTO transactions (user_id, category_id, amount, transaction_date, description)
+            VALUES (?, ?, ?, ?, ?)""",
+            [
+                (1, 3, 40.0, '2024-01-03', 'SHELL OIL 5744'),
+                (1, 3, 35.5, '2024-02-10', 'SHELL OIL 1234'),
+                (1, 2, 80.0, '2024-02-12', 'WHOLE FOODS MKT #10'),
+                (2, 3, 99.0, '2024-02-14', 'SHELL OIL 1234'),
+            ]
+        )
+        conn.commit()
+        conn.close()
+
+        StubOllamaHandler.requests_seen.clear()
+        StubOllamaHandler.tool_calls = []
+        StubOllamaHandler.always_call_tools = False
+        StubOllamaHandler.tools_supported = True
+        forecast = pd.DataFrame({'Food': [90.0, 95.0], 'Transportation': [40.0, 42.0]},
+                                index=pd.period_range('2024-03', periods=2, freq='M'))
+        self.tools = FinanceTools(self.db_path, 1, forecast=forecast)
+        self.assistant = OllamaAssistant(model_name='stub', base_url=self.base_url, session=create_session())
+
+    def tearDown(self):
+        """Remove the temporary database."""
+        StubOllamaHandler.tool_calls = []
+        StubOllamaHandler.always_call_tools = False
+        StubOllamaHandler.tools_supported = True
+        os.close(self.db_fd)
+        os.unlink(self.db_path)
+
+    def test_tools(self):
+        """Test each tool against the database."""
+        totals = self.tools.call('category_totals', {'start_date': '2024-02-01', 'end_date': '2024-02-29'})
+        self.assertEqual(totals['total'], 115.5)
+        self.assertEqual(totals['categories'][0], {'category': 'Food', 'total': 80.0, 'count': 1})
+
+        merchants = self.tools.call('top_merchants', {'limit': 1})
+        self.assertEqual(merchants['merchants'], [{'merchant': 'WHOLE FOODS MKT', 'total': 80.0, 'count': 1}])
+
+        forecast = self.tools.call('forecast', {'category': 'Food'})
+        self.assertEqual(forecast['periods'][0], {'period': '2024-03', 'amount': 90.0})
+
+        search = self.tools.call('search_transactions', {'query': 'shell'})
+        self.assertEqual((search['total'], search['count']), (75.5, 2))
+        self.assertIn('2024-01-03', self.tools.overview())
+
+    def test_tool_errors_are_returned_to_the_model(self):
+        """Test that bad tool calls produce an error the model can read."""
+        self.assertIn('error', self.tools.call('drop_table', {}))
+        self.assertIn('error', self.tools.call('top_merchants', {'merchant': 'x'}))
+        self.assertIn('error', self.tools.call('forecast', {'category': 'Travel'}))
+
+    def test_loop_runs_requested_tools(self):
+        """Test that tool calls are run and their results sent back before the answer."""
+        StubOllamaHandler.tool_calls = [
+            {'function': {'name': 'category_totals', 'arguments': {'start_date': '2024-02-01',
+                                                                   'end_date': '2024-02-29'}}},
+            {'function': {'name': 'search_transactions', 'arguments': '{"query": "shell"}'}},
+        ]
+        tokens = list(self.assistant.stream_response_with_tools('What did I spend in February?', self.tools))
+
+        self.assertEqual(''.join(tokens), StubOllamaHandler.answer)
+        first, second = StubOllamaHandler.requests_seen
+        self.assertEqual([t['function']['name'] for t in first['tools']],
+                         ['category_totals', 'top_merchants', 'forecast', 'search_transactions'])
+        self.assertNotIn('Financial Data Summary', json.dumps(first['messages']))
+        tool_messages = [m for m in second['messages'] if m['role'] == 'tool']
+        self.assertEqual([m['tool_name'] for m in tool_messages], ['category_totals', 'search_transactions'])
+        self.assertEqual(json.loads(tool_messages[0]['content'])['total'], 115.5)
+        self.assertEqual(json.loads(tool_messages[1]['content'])['count'], 2)
+        self.assertEqual(self.assistant.conversation_history[-1]['content'], StubOllamaHandler.answer)
+
+    def test_repeated_question_is_cached(self):
+        """Test that asking again in the same conversation is answered from the cache."""
+        self.assistant.response_cache = ResponseCache()
+        first = self.assistant.generate_response_with_tools('What did I spend?', self.tools)
+        self.assistant.generate_response_with_tools('Any advice?', self.tools)
+        second = self.assistant.generate_response_with_tools('What did I spend?', self.tools)
+
+        self.assertEqual(first, second)
+        self.assertEqual(len(StubOllamaHandler.requests_seen), 2)
+
+    def test_loop_is_bounded(self):
+        """Test that a model that keeps calling tools must answer after max_rounds."""
+        StubOllamaHandler.tool_calls = [{'function': {'name': 'forecast', 'arguments': {}}}]
+        StubOllamaHandler.always_call_tools = True
+        answer = self.assistant.generate_response_with_tools('Forecast?', self.tools, max_rounds=2)
+
+        self.assertEqual(answer, StubOllamaHandler.answer)
+        self.assertEqual(len(StubOllamaHandler.requests_seen), 3)
+        self.assertNotIn('tools', StubOllamaHandler.requests_seen[-1])
+
+    def test_models_without_tools_fall_back_to_context(self):
+        """Test that a model rejecting tools is asked with the formatted context."""
+        StubOllamaHandler.tools_supported = False
+        answer = self.assistant.generate_response_with_tools(
+            'What did I spend?', self.tools, {'user_info': {'name': 'Test', 'income': 5000}}
+        )
+
+        self.assertEqual(answer, StubOllamaHandler.answer)
+        self.assertIn('Financial Data Summary', StubOllamaHandler.requests_seen[-1]['prompt'])
+
+
+class TestConversationMemory(unittest.TestCase):
+    """Test cases for the ConversationMemory class."""
+
+    def test_window_and_rolling_summary(self):
+        """Test that old messages move into the summary and memory stays bounded."""
+        summarized = []
+
+        def summarizer(summary, messages):
+            summarized.append(len(messages))
+            return summary + ''.join(f"[{message['content']}]" for message in messages)
+
+        memory = ConversationMemory(max_messages=4, summarizer=summarizer)
+        for i in range(10):
+            memory.append('user' if i % 2 == 0 else 'assistant', f'm{i}')
+            memory.wait()
+
+        self.assertEqual([message['content'] for message in memory.messages], ['m6', 'm7', 'm8', 'm9'])
+        self.assertEqual(memory.summary, '[m0][m1][m2][m3][m4][m5]')
+        self.assertEqual(sum(summarized), 6)
+        self.assertIn('Earlier in this conversation:\n[m0]', memory.prompt_context())
+        self.assertIn('Assistant: m9', memory.prompt_context())
+
+    def test_append_does_not_wait_for_summary(self):
+        """Test that a slow summarizer runs in the background."""
+        release = threading.Event()
+
+        def summarizer(summary, messages):
+            release.wait(5)
+            return 'summary'
+
+        memory = ConversationMemory(max_messages=1, summarizer=summarizer)
+        start = time.monotonic()
+        for i in range(5):
+            memory.append('user', f'm{i}')
+        self.assertLess(time.monotonic() - start, 1)
+
+        release.set()
+        memory.wait()
+        self.assertEqual(memory.summary, 'summary')
+        self.assertEqual(len(memory.messages), 1)
+
+    def test_failed_summary_falls_back_to_extractive(self):
+        """Test the extractive fallback and the summary length cap."""
+        def summarizer(summary, messages):
+            raise RuntimeError('model unavailable')
+
+        memory = ConversationMemory(max_messages=1, summarizer=summarizer, max_summary_chars=60,
+                                    background=False)
+        memory.append('user', 'How much did I spend on food? Thanks.')
+        memory.append('assistant', 'You spent $120.50 on food. That is 3% of income.')
+        self.assertEqual(memory.summary, 'User asked: How much did I spend on food? Thanks.')
+
+        memory.append('user', 'And on rent?')
+        self.assertEqual(memory.summary, 'Assistant said: You spent $120.50 on food')
+
+        memory.clear()
+        self.assertEqual((memory.messages, memory.summary), ([], ''))
+
+    def test_summarizer_follows_the_current_assistant(self):
+        """Test that a shared memory summarizes with whichever assistant added the message."""
+        memory = ConversationMemory(max_messages=1, background=False)
+        OllamaAssistant(model_name='first-model', base_url='http://localhost:9', memory=memory)
+        OllamaAssistant(model_name='second-model', base_url='http://localhost:9', memory=memory)
+        self.assertIsNone(memory.summarizer)
+
+        used = []
+        memory.append('user', 'q1', lambda summary, messages: used.append('first') or 'one')
+        memory.append('user', 'q2', lambda summary, messages: used.append('first') or 'one')
+        memory.append('user', 'q3', lambda summary, messages: used.append('second') or 'two')
+
+        self.assertEqual(used, ['first', 'second'])
+        self.assertEqual(memory.summary, 'two')
+
+
+class TestFinancialContextBuilder(unittest.TestCase):
+    """Test cases for the FinancialContextBuilder class."""
+
+    def setUp(self):
+        """Set up a year of spending in many categories and many transactions."""
+        categories = [f'Category {i}' for i in range(12)]
+        months = pd.period_range('2024-01', periods=12, freq='M').strftime('%Y-%m')
+        self.financial_data = {
+            'user_info': {'user_id': 1, 'name': 'Test', 'income': 5000},
+            'spending_history': pd.DataFrame(
+                [[100.0 + 10 * i + j for i in range(12)] for j in range(12)], index=months, columns=categories
+            ),
+            'transactions': pd.DataFrame({
+                'amount': [float(i) for i in range(50)],
+                'category': ['Category 0'] * 50,
+                'transaction_date': pd.date_range('2024-12-31', periods=50, freq='-1D'),
+            }),
+            'forecast': pd.DataFrame([[200.0] * 12], columns=categories),
+            'data_version': 7,
+        }
+
+    def test_detail_level_fits_budget(self):
+        """Test that the most detailed summary within the budget is chosen."""
+        builder = FinancialContextBuilder()
+        levels = builder.render_levels(self.financial_data)
+        sizes = [builder.estimate_tokens(levels[level]) for level in ('full', 'standard', 'brief')]
+        self.assertEqual(sizes, sorted(sizes, reverse=True))
+
+        self.assertEqual(builder.build(self.financial_data, token_budget=sizes[0]), levels['full'])
+        self.assertEqual(builder.build(self.financial_data, token_budget=sizes[0] - 1), levels['standard'])
+        self.assertEqual(builder.build(self.financial_data, token_budget=sizes[1] - 1), levels['brief'])
+        self.assertLessEqual(builder.estimate_tokens(builder.build(self.financial_data, token_budget=10)), 10)
+        self.assertIn('* Category 11:', levels['full'])
+        self.assertEqual(levels['standard'].count('  * $'), 3)
+
+    def test_summary_cached_per_data_version(self):
+        """Test that summaries are rendered once per user and data version."""
+        builder = FinancialContextBuilder()
+        first = builder.build(self.financial_data)
+
+        self.financial_data['spending_history'] = self.financial_data['spending_history'] * 2
+        self.assertEqual(builder.build(self.financial_data), first)
+        self.financial_data['data_version'] = 8
+        self.assertNotEqual(builder.build(self.financial_data), first)
+
+    def test_merchant_search_is_added_per_question(self):
+        """Test that the question's merchant lookup is always included."""
+        builder = FinancialContextBuilder()
+        builder.build(self.financial_data)
+        self.financial_data['merchant_search'] = {
+            'merchant': 'Shell', 'total': 44.5, 'count': 2, 'first_date': '2024-01-03', 'last_date': '2024-02-11'
+        }
+
+        context = builder.build(self.financial_data, token_budget=100)
+        self.assertTrue(context.endswith('- Spending at Shell: $44.50 across 2 transactions (2024-01-03 to 2024-02-11)\n'))
+        self.assertLessEqual(builder.estimate_tokens(context), 100)
+
+
+class TestResponseCache(unittest.TestCase):
+    """Test cases for the ResponseCache class."""
+
+    def test_lru_eviction(self):
+        """Test that the least recently used answer is evicted first."""
+        cache = ResponseCache(max_entries=2)
+        keys = [ResponseCache.make_key('model', question) for question in ('a', 'b', 'c')]
+        cache.put(keys[0], 'A')
+        cache.put(keys[1], 'B')
+        self.assertEqual(cache.get(keys[0]), 'A')
+        cache.put(keys[2], 'C')
+
+        self.assertIsNone(cache.get(keys[1]))
+        self.assertEqual(cache.get(keys[0]), 'A')
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+
+    def test_ttl(self):
+        """Test that expired answers are not served."""
+        cache = ResponseCache(ttl=0.05)
+        cache.put('key', 'answer')
+        time.sleep(0.1)
+        self.assertIsNone(cache.get('key'))
+
+    def test_sqlite_tier_survives_restart(self):
+        """Test that a new cache on the same database serves stored answers."""
+        db_fd, db_path = tempfile.mkstemp()
+        try:
+            ResponseCache(db_path=db_path).put('key', 'answer')
+            cache = ResponseCache(db_path=db_path)
+            self.assertEqual(cache.get('key'), 'answer')
+
+            cache.clear()
+            self.assertIsNone(ResponseCache(db_path=db_path).get('key'))
+        finally:
+            os.close(db_fd)
+            os.unlink(db_path)
+
+
+class TestOllamaHealthMonitor(unittest.TestCase):
+    """Test cases for the OllamaHealthMonitor class."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Start a stub Ollama server on a free port."""
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubOllamaHandler)
+        cls.base_url = f'http://127.0.0.1:{cls.server.server_address[1]}'
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        """Stop the stub Ollama server."""
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        """Reset the stub server's state."""
+        StubOllamaHandler.client_ports.clear()
+        StubOllamaHandler.unavailable_responses = 0
+
+    def test_status_before_and_after_probe(self):
+        """Test that status reads the cached probe result."""
+        monitor = OllamaHealthMonitor(self.base_url, session=create_session(retries=0))
+        self.assertEqual(monitor.status(), {'available': False, 'models': [], 'checked': False, 'age': None})
+
+        monitor.refresh()
+        status = monitor.status()
+        self.assertTrue(status['available'])
+        self.assertEqual(status['models'], ['stub:latest'])
+
+        # Reading the state again does not touch the server
+        StubOllamaHandler.client_ports.clear()
+        monitor.status()
+        self.assertEqual(StubOllamaHandler.client_ports, set())
+
+    def test_unreachable_and_stale_results(self):
+        """Test that down servers and expired results both read as unavailable."""
+        monitor = OllamaHealthMonitor('http://127.0.0.1:9', session=create_session(retries=0))
+        self.assertFalse(monitor.refresh()['available'])
+
+        monitor = OllamaHealthMonitor(self.base_url, ttl=0.05, session=create_session(retries=0))
+        monitor.refresh()
+        time.sleep(0.1)
+        self.assertEqual(monitor.status()['available'], False)
+        self.assertEqual(monitor.status()['models'], [])
+
+    def test_background_polling(self):
+        """Test that the thread keeps the state current until stopped."""
+        monitor = OllamaHealthMonitor(self.base_url, interval=0.05, session=create_session(retries=0))
+        monitor.start()
+        try:
+            deadline = time.monotonic() + 5
+            while not monitor.status()['checked'] and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertTrue(monitor.status()['available'])
+
+            StubOllamaHandler.unavailable_responses = 1000
+            time.sleep(0.3)
+            self.assertFalse(monitor.status()['available'])
+        finally:
+            monitor.stop()
+        self.assertFalse(monitor.is_running)
+
+
+if __name__ == '__main__':
+    unittest.main()
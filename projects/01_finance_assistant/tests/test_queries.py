@@ -0,0 +1,256 @@
+"""Tests for the finance query module."""
+
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from db_init import ensure_schema
+from utils.queries import MAX_IN_PARAMS, FinanceQueries, id_batches
+
+
+class TestFinanceQueries(unittest.TestCase):
+    """Test cases for the FinanceQueries class."""
+
+    def setUp(self):
+        """Set up a database with described transactions."""
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        self.conn = sqlite3.connect(self.db_path)
+        self.conn.executescript('''
+        CREATE TABLE categories (category_id INTEGER PRIMARY KEY, name TEXT);
+        CREATE TABLE transactions (
+            transaction_id INTEGER PRIMARY KEY,
+            user_id INTEGER,
+            category_id INTEGER,
+            amount REAL,
+            transaction_date TEXT
+        );
+        INSERT INTO categories VALUES (2, 'Food'), (3, 'Transportation'), (7, 'Miscellaneous');
+        ''')
+        # Rows inserted before the index exists are picked up by its rebuild
+        self.conn.execute(
+            """INSERT INTO transactions (user_id, category_id, amount, transaction_date)
+            VALUES (1, 7, 5.0, '2024-01-01')"""
+        )
+        self.conn.execute("ALTER TABLE transactions ADD COLUMN description TEXT")
+        self.conn.execute(
+            """INSERT INTO transactions (user_id, category_id, amount, transaction_date, description)
+            VALUES (1, 3, 40.0, '2024-01-03', 'SHELL OIL 5744')"""
+        )
+        ensure_schema(self.conn)
+        self.conn.executemany(
+            """INSERT INTO transactions (user_id, category_id, amount, transaction_date, description)
+            VALUES (?, ?, ?, ?, ?)""",
+            [
+                (1, 3, 35.5, '2024-02-10', 'Shell Service Station'),
+                (1, 2, 4.5, '2024-02-11', 'SHELL OIL 5744'),
+                (1, 2, 80.0, '2024-02-12', 'WHOLE FOODS MKT #10'),
+                (1, 2, 20.0, '2024-02-13', 'SHELLFISH SHACK'),
+                (2, 3, 99.0, '2024-02-14', 'SHELL OIL 1234'),
+            ]
+        )
+        self.conn.commit()
+        self.queries = FinanceQueries(self.db_path)
+
+    def tearDown(self):
+        """Close and remove the temporary database."""
+        self.conn.close()
+        os.close(self.db_fd)
+        os.unlink(self.db_path)
+
+    def test_match_expression_quotes_terms(self):
+        """Test that user text is turned into quoted prefix terms."""
+        self.assertEqual(FinanceQueries.match_expression('Whole Foods'), '"whole"* "foods"*')
+        self.assertEqual(FinanceQueries.match_expression('AT&T "OR" NEAR('), '"at&t"* "or"* "near"*')
+        self.assertIsNone(FinanceQueries.match_expression('?!'))
+
+    def test_search_transactions(self):
+        """Test that searches match word prefixes for one user, most recent first."""
+        self.assertTrue(self.queries.has_full_text_index())
+        results = self.queries.search_transactions(1, 'shell')
+
+        self.assertEqual(results['description'].tolist(),
+                         ['SHELLFISH SHACK', 'SHELL OIL 5744', 'Shell Service Station', 'SHELL OIL 5744'])
+        self.assertEqual(results['category'].tolist()[-1], 'Transportation')
+
+        results = self.queries.search_transactions(1, 'shell oil', start_date='2024-02-01', limit=5)
+        self.assertEqual(results['amount'].tolist(), [4.5])
+
+    def test_search_summary(self):
+        """Test the aggregates over matching transactions."""
+        summary = self.queries.search_summary(1, 'Shell Oil')
+
+        self.assertEqual(summary['count'], 2)
+        self.assertAlmostEqual(summary['total'], 44.5)
+        self.assertEqual((summary['first_date'], summary['last_date']), ('2024-01-03', '2024-02-11'))
+        self.assertEqual(summary['by_category']['category'].tolist(), ['Transportation', 'Food'])
+        self.assertEqual(self.queries.search_summary(1, 'netflix')['count'], 0)
+
+    def test_top_merchants(self):
+        """Test that descriptions of one merchant are ranked together."""
+        self.conn.execute(
+            """INSERT INTO transactions (user_id, category_id, amount, transaction_date, description)
+            VALUES (1, 3, 60.0, '2024-02-20', 'SHELL OIL 9999')"""
+        )
+        self.conn.commit()
+        merchants = self.queries.top_merchants(1, limit=2)
+
+        self.assertEqual(merchants['merchant'].tolist(), ['SHELL OIL', 'WHOLE FOODS MKT'])
+        self.assertEqual((merchants['total'].iloc[0], merchants['count'].iloc[0]), (104.5, 3))
+        self.assertEqual(self.queries.top_merchants(1, start_date='2024-02-12', end_date='2024-02-13')
+                         ['merchant'].tolist(), ['WHOLE FOODS MKT', 'SHELLFISH SHACK'])
+        self.assertTrue(self.queries.top_merchants(3).empty)
+
+    def test_transactions_page_walks_history(self):
+        """Test that keyset cursors page through a user's history without gaps."""
+        self.conn.executemany(
+            """INSERT INTO transactions (user_id, category_id, amount, transaction_date, description)
+            VALUES (1, 7, ?, '2024-02-12', 'SAME DAY')""",
+            [(float(amount),) for amount in range(3)]
+        )
+        self.conn.commit()
+
+        pages = []
+        cursor = None
+        while True:
+            page, cursor = self.queries.transactions_page(1, page_size=3, after=cursor)
+            pages.append(page['transaction_id'].tolist())
+            if cursor is None:
+                break
+
+        all_ids = [transaction_id for page in pages for transaction_id in page]
+        expected = [row[0] for row in self.conn.execute(
+            """SELECT transaction_id FROM transactions WHERE user_id = 1
+            ORDER BY transaction_date DESC, transaction_id DESC"""
+        )]
+        self.assertEqual(all_ids, expected)
+        self.assertEqual([len(page) for page in pages], [3, 3, 3])
+
+    def test_transactions_page_filters(self):
+        """Test the date-range and category filters."""
+        page, cursor = self.queries.transactions_page(
+            1, start_date='2024-02-01', end_date='2024-02-12', category_ids=[2]
+        )
+
+        self.assertIsNone(cursor)
+        self.assertEqual(page['amount'].tolist(), [80.0, 4.5])
+        self.assertEqual(page['category'].unique().tolist(), ['Food'])
+
+    def test_spending_aggregate(self):
+        """Test that rollup and transaction aggregates agree and honour the filters."""
+        monthly = self.queries.spending_aggregate(1, categories=['Food'], granularity='month')
+        self.assertEqual(monthly['period'].tolist(), ['2024-02'])
+        self.assertAlmostEqual(monthly['total'].iloc[0], 104.5)
+        self.assertEqual(monthly['count'].iloc[0], 3)
+
+        # A range that splits a month is grouped from the transactions instead
+        partial = self.queries.spending_aggregate(1, start_date='2024-02-11', end_date='2024-02-12',
+                                                  granularity='month', by_category=False)
+        self.assertAlmostEqual(partial['total'].iloc[0], 84.5)
+
+        totals = self.queries.spending_aggregate(1, granularity=None)
+        self.assertEqual(totals['category'].tolist(), ['Food', 'Miscellaneous', 'Transportation'])
+        self.assertAlmostEqual(totals['total'].sum(), 185.0)
+        self.assertEqual(self.queries.spending_aggregate(3, granularity=None, by_category=False)['total'].tolist(), [0.0])
+        with self.assertRaises(ValueError):
+            self.queries.spending_aggregate(1, granularity='fortnight')
+
+    def test_average_spending_counts_empty_periods(self):
+        """Test that averages run over every period in the user's history."""
+        self.assertEqual(self.queries.activity_span(1), ('2024-01-01', '2024-02-13'))
+        self.assertAlmostEqual(self.queries.average_spending(1, 'month'), 92.5)
+        self.assertAlmostEqual(self.queries.average_spending(1, 'month', categories=['Food']), 52.25)
+        self.assertAlmostEqual(self.queries.average_spending(1, 'day'), 185.0 / 44)
+        self.assertEqual(self.queries.average_spending(3, 'week'), 0.0)
+
+    def test_data_version_follows_changes(self):
+        """Test that every change to a user's transactions bumps their data version."""
+        version = self.queries.data_version(1)
+        self.assertGreater(version, 0)
+        self.assertEqual(self.queries.data_version(3), 0)
+
+        self.conn.execute("UPDATE transactions SET amount = 41.0 WHERE description = 'SHELL OIL 5744' AND user_id = 1")
+        self.conn.execute("DELETE FROM transactions WHERE description = 'SHELLFISH SHACK'")
+        self.conn.execute("UPDATE transactions SET user_id = 3 WHERE description = 'SHELL OIL 1234'")
+        self.conn.commit()
+
+        self.assertEqual(self.queries.data_version(1), version + 3)
+        self.assertEqual(self.queries.data_version(2), 2)
+        self.assertEqual(self.queries.data_version(3), 1)
+
+    def test_index_follows_updates_and_deletes(self):
+        """Test that the triggers keep the index in sync with the transactions."""
+        self.conn.execute("UPDATE transactions SET description = 'NETFLIX.COM' WHERE description = 'SHELLFISH SHACK'")
+        self.conn.execute("DELETE FROM transactions WHERE description = 'Shell Service Station'")
+        self.conn.commit()
+
+        self.assertEqual(self.queries.search_summary(1, 'shell')['count'], 2)
+        self.assertEqual(self.queries.search_transactions(1, 'netflix')['amount'].tolist(), [20.0])
+
+    def test_index_has_no_stale_rows_without_descriptions(self):
+        """Test that deleting a row without a description also removes it from the index."""
+        def indexed_rowids():
+            return {row[0] for row in self.conn.execute(
+                """SELECT rowid FROM transactions_fts WHERE transactions_fts MATCH 'user_id : "1"'"""
+            )}
+
+        # The row without a description was indexed by the rebuild
+        self.assertIn(1, indexed_rowids())
+        self.conn.execute("DELETE FROM transactions WHERE description IS NULL")
+        self.conn.execute(
+            """INSERT INTO transactions (user_id, category_id, amount, transaction_date)
+            VALUES (1, 7, 6.0, '2024-03-01')"""
+        )
+        new_id = self.conn.execute("SELECT MAX(transaction_id) FROM transactions").fetchone()[0]
+        self.conn.execute("UPDATE transactions SET user_id = 2 WHERE transaction_id = ?", (new_id,))
+        self.conn.commit()
+
+        user_rows = {row[0] for row in self.conn.execute("SELECT transaction_id FROM transactions WHERE user_id = 1")}
+        self.assertEqual(indexed_rowids(), user_rows)
+        self.conn.execute("INSERT INTO transactions_fts (transactions_fts) VALUES ('integrity-check')")
+
+    def test_triggers_from_older_versions_are_replaced(self):
+        """Test that guarded triggers from older versions are replaced and the index rebuilt."""
+        self.conn.executescript('''
+        DROP TRIGGER trg_fts_delete;
+        CREATE TRIGGER trg_fts_delete AFTER DELETE ON transactions
+        WHEN OLD.description IS NOT NULL
+        BEGIN
+            INSERT INTO transactions_fts (transactions_fts, rowid, description, user_id)
+            VALUES ('delete', OLD.transaction_id, OLD.description, OLD.user_id);
+        END;
+        ''')
+        ensure_schema(self.conn)
+
+        trigger = self.conn.execute("SELECT sql FROM sqlite_master WHERE name = 'trg_fts_delete'").fetchone()[0]
+        self.assertNotIn('WHEN', trigger)
+        self.conn.execute("DELETE FROM transactions WHERE description IS NULL")
+        self.conn.commit()
+        self.conn.execute("INSERT INTO transactions_fts (transactions_fts) VALUES ('integrity-check')")
+
+    def test_like_fallback_without_index(self):
+        """Test that searches still work on a database without the FTS5 table."""
+        self.conn.execute("DROP TABLE transactions_fts")
+        self.conn.commit()
+        queries = FinanceQueries(self.db_path)
+
+        self.assertFalse(queries.has_full_text_index())
+        self.assertEqual(queries.search_summary(1, 'shell oil')['count'], 2)
+
+
+
+class TestIdBatches(unittest.TestCase):
+    """Test cases for splitting IDs into IN (...) lists."""
+
+    def test_batches_keep_order_and_size(self):
+        """Test that batches cover every ID in order without exceeding the cap."""
+        ids = list(range(2 * MAX_IN_PARAMS + 5))
+        batches = id_batches(ids)
+
+        self.assertEqual([len(batch) for batch in batches], [MAX_IN_PARAMS, MAX_IN_PARAMS, 5])
+        self.assertEqual([value for batch in batches for value in batch], ids)
+        self.assertEqual(id_batches([]), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,316 @@
+"""Tests for the recommendation engine module."""
+
+import os
+import sqlite3
+import tempfile
+import unittest
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from db_init import ensure_schema
+from models.recommender import (
+    SpendingAnomalyDetector, RecurringPaymentDetector, BudgetRecommender, recurring_schedule
+)
+
+
+def create_test_db(db_path):
+    """Create an empty database with the application schema."""
+    conn = sqlite3.connect(db_path)
+    conn.executescript('''
+    CREATE TABLE users (
+        user_id INTEGER PRIMARY KEY,
+        name TEXT,
+        income REAL
+    );
+    CREATE TABLE categories (
+        category_id INTEGER PRIMARY KEY,
+        name TEXT
+    );
+    CREATE TABLE transactions (
+        transaction_id INTEGER PRIMARY KEY,
+        user_id INTEGER,
+        category_id INTEGER,
+        amount REAL,
+        transaction_date TEXT
+    );
+    ''')
+    conn.executemany("INSERT INTO users VALUES (?, ?, ?)", [(1, 'Test User', 5000), (2, 'Other User', 4000)])
+    conn.executemany("INSERT INTO categories VALUES (?, ?)", [
+        (1, "Housing"), (2, "Food"), (3, "Transportation"), (4, "Utilities"),
+        (5, "Entertainment"), (6, "Healthcare"), (7, "Miscellaneous")
+    ])
+    conn.commit()
+    conn.close()
+
+
+def make_transactions(user_id, category_id, amounts, start_id=1, start=date(2024, 1, 1)):
+    """Build a transaction frame with one transaction per day."""
+    return pd.DataFrame({
+        'transaction_id': range(start_id, start_id + len(amounts)),
+        'user_id': user_id,
+        'category_id': category_id,
+        'amount': amounts,
+        'transaction_date': [(start + timedelta(days=i)).isoformat() for i in range(len(amounts))],
+    })
+
+
+class TestSpendingAnomalyDetector(unittest.TestCase):
+    """Tests for the streaming EWMA anomaly detector."""
+
+    def setUp(self):
+        handle, self.db_path = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        create_test_db(self.db_path)
+        self.detector = SpendingAnomalyDetector(self.db_path)
+
+    def tearDown(self):
+        os.remove(self.db_path)
+
+    def test_flags_spike_after_warm_up(self):
+        rng = np.random.default_rng(0)
+        amounts = list(rng.normal(60, 5, size=30)) + [400.0]
+        scores = self.detector.score_transactions(make_transactions(1, 2, amounts))
+
+        self.assertTrue(scores['is_anomaly'].iloc[-1])
+        self.assertFalse(scores['is_anomaly'].iloc[:-1].any())
+
+        with sqlite3.connect(self.db_path) as conn:
+            flagged = conn.execute("SELECT transaction_id FROM anomalies").fetchall()
+        self.assertEqual(flagged, [(31,)])
+
+    def test_incremental_scoring_matches_batch(self):
+        rng = np.random.default_rng(1)
+        amounts = rng.gamma(4, 20, size=40)
+        frame = make_transactions(1, 3, amounts)
+
+        batch = self.detector.score_transactions(frame)
+
+        other_path = self.db_path + '.incremental'
+        create_test_db(other_path)
+        try:
+            incremental = SpendingAnomalyDetector(other_path)
+            scores = pd.concat([
+                incremental.score_transactions(frame.iloc[i:i + 1]) for i in range(len(frame))
+            ], ignore_index=True)
+        finally:
+            os.remove(other_path)
+
+        np.testing.assert_allclose(batch['score'], scores['score'])
+        np.testing.assert_allclose(batch['expected_amount'], scores['expected_amount'])
+
+    def test_groups_are_scored_independently(self):
+        housing = make_transactions(1, 1, [1500.0] * 10 + [1510.0])
+        food = make_transactions(2, 2, [50.0, 55.0, 45.0, 60.0, 52.0, 48.0, 51.0, 57.0, 49.0, 1500.0], start_id=100)
+        frame = pd.concat([food, housing], ignore_index=True)
+
+        scores = self.detector.score_transactions(frame)
+
+        self.assertEqual(scores['transaction_id'].tolist(), frame['transaction_id'].tolist())
+        flagged = set(scores.loc[scores['is_anomaly'], 'transaction_id'])
+        self.assertEqual(flagged, {109})
+
+    def test_scores_more_users_than_sqlite_variables(self):
+        # One transaction each for 1,200 users loads their state in several batches
+        frame = pd.concat([
+            make_transactions(user_id, 2, [50.0], start_id=user_id) for user_id in range(1, 1201)
+        ], ignore_index=True)
+        self.detector.score_transactions(frame)
+        scores = self.detector.score_transactions(make_transactions(1200, 2, [60.0], start_id=5000))
+
+        self.assertAlmostEqual(scores['expected_amount'].iloc[0], 50.0)
+        with sqlite3.connect(self.db_path) as conn:
+            users = conn.execute("SELECT COUNT(DISTINCT user_id) FROM anomaly_state").fetchone()[0]
+        self.assertEqual(users, 1200)
+
+    def test_rebuild_scores_full_history(self):
+        amounts = [80.0, 82.0, 79.0, 81.0, 80.0, 83.0, 78.0, 84.0, 77.0, 80.0, 900.0]
+        frame = make_transactions(1, 5, amounts)
+        with sqlite3.connect(self.db_path) as conn:
+            conn.executemany(
+                "INSERT INTO transactions VALUES (?, ?, ?, ?, ?)",
+                frame.itertuples(index=False, name=None)
+            )
+
+        self.assertEqual(self.detector.rebuild(), 1)
+        anomalies = self.detector.get_anomalies(1)
+        self.assertEqual(anomalies['transaction_id'].tolist(), [11])
+        self.assertEqual(anomalies['category'].iloc[0], 'Entertainment')
+
+
+class TestRecurringPaymentDetector(unittest.TestCase):
+    """Tests for the sort-based recurring payment detector."""
+
+    def setUp(self):
+        handle, self.db_path = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        create_test_db(self.db_path)
+        self.detector = RecurringPaymentDetector(self.db_path)
+
+        months = pd.date_range('2024-01-01', '2024-12-01', freq='MS')
+        weeks = pd.date_range('2024-09-02', '2024-12-02', freq='7D')
+        rng = np.random.default_rng(3)
+        self.transactions = pd.concat([
+            # Rent on the first of every month
+            pd.DataFrame({'user_id': 1, 'category_id': 1, 'amount': 1200.0,
+                          'transaction_date': months.strftime('%Y-%m-%d'),
+                          'description': 'RENT PAYMENT'}),
+            # Streaming subscription with a store number in the description
+            pd.DataFrame({'user_id': 1, 'category_id': 5, 'amount': 15.99,
+                          'transaction_date': (months + pd.Timedelta(days=4)).strftime('%Y-%m-%d'),
+                          'description': [f'NETFLIX.COM #{i}' for i in range(len(months))]}),
+            # Weekly gym class
+            pd.DataFrame({'user_id': 1, 'category_id': 6, 'amount': 25.0,
+                          'transaction_date': weeks.strftime('%Y-%m-%d'),
+                          'description': 'CITY GYM'}),
+            # Gym membership that stopped in June
+            pd.DataFrame({'user_id': 1, 'category_id': 6, 'amount': 49.0,
+                          'transaction_date': months[:6].strftime('%Y-%m-%d'),
+                          'description': 'OLD GYM'}),
+            # Irregular grocery shopping
+            pd.DataFrame({'user_id': 1, 'category_id': 2, 'amount': rng.uniform(20, 200, 40),
+                          'transaction_date': pd.to_datetime('2024-01-01') + pd.to_timedelta(
+                              np.sort(rng.integers(0, 335, 40)), unit='D'),
+                          'description': 'GROCERY STORE'}),
+        ], ignore_index=True)
+        self.transactions['transaction_date'] = pd.to_datetime(
+            self.transactions['transaction_date']).dt.strftime('%Y-%m-%d')
+
+    def tearDown(self):
+        os.remove(self.db_path)
+
+    def test_detects_active_regular_payments(self):
+        payments = self.detector.detect(self.transactions).set_index('merchant')
+
+        self.assertEqual(sorted(payments.index), ['city gym', 'netflix.com', 'rent payment'])
+        self.assertEqual(payments.loc['rent payment', 'cadence'], 'monthly')
+        self.assertEqual(payments.loc['rent payment', 'next_date'], '2025-01-01')
+        self.assertEqual(payments.loc['city gym', 'cadence'], 'weekly')
+        self.assertAlmostEqual(payments.loc['netflix.com', 'amount'], 15.99)
+
+    def test_amount_changes_split_buckets(self):
+        transactions = self.transactions.copy()
+        rent = transactions['description'] == 'RENT PAYMENT'
+        transactions.loc[rent & (transactions['transaction_date'] >= '2024-07-01'), 'amount'] = 1500.0
+
+        payments = self.detector.detect(transactions)
+        rent_payments = payments[payments['merchant'] == 'rent payment']
+
+        self.assertEqual(rent_payments['amount'].tolist(), [1500.0])
+        self.assertEqual(rent_payments['occurrences'].tolist(), [6])
+
+    def test_refresh_falls_back_to_categories(self):
+        with sqlite3.connect(self.db_path) as conn:
+            conn.executemany(
+                "INSERT INTO transactions (user_id, category_id, amount, transaction_date) VALUES (?, ?, ?, ?)",
+                self.transactions[['user_id', 'category_id', 'amount', 'transaction_date']]
+                .itertuples(index=False, name=None)
+            )
+
+        self.detector.refresh(1)
+        stored = self.detector.get_recurring_payments(1)
+
+        self.assertIn('category:1', stored['merchant'].tolist())
+        self.assertEqual(stored.loc[stored['merchant'] == 'category:1', 'category'].iloc[0], 'Housing')
+
+    def test_missing_descriptions_fall_back_to_categories(self):
+        transactions = self.transactions.copy()
+        transactions['description'] = None
+
+        payments = self.detector.detect(transactions)
+        self.assertIn('category:1', payments['merchant'].tolist())
+
+        transactions.loc[transactions['category_id'] == 5, 'description'] = 'NETFLIX.COM'
+        payments = self.detector.detect(transactions)
+        self.assertIn('netflix.com', payments['merchant'].tolist())
+        self.assertIn('category:1', payments['merchant'].tolist())
+
+    def test_schedule_steps_from_last_payment(self):
+        payments = pd.DataFrame({'category': ['Housing'], 'amount': [1200.0], 'cadence': ['monthly'],
+                                 'last_date': ['2024-12-01'], 'occurrences': [12]})
+        schedule = recurring_schedule(payments, '2025-03-15')
+
+        self.assertEqual(len(schedule), 15)
+        self.assertEqual(schedule['date'].iloc[0], pd.Timestamp('2024-01-01'))
+        self.assertEqual(schedule['date'].iloc[-1], pd.Timestamp('2025-03-01'))
+
+
+class TestBudgetRecommender(unittest.TestCase):
+    """Tests for the vectorized budget recommender."""
+
+    def setUp(self):
+        handle, self.db_path = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        create_test_db(self.db_path)
+        with sqlite3.connect(self.db_path) as conn:
+            conn.executemany(
+                "INSERT INTO transactions (user_id, category_id, amount, transaction_date) VALUES (?, ?, ?, ?)",
+                [
+                    # User 1: three months (one without spending), housing over 30% of income
+                    (1, 1, 1800.0, '2024-01-01'), (1, 2, 300.0, '2024-01-05'),
+                    (1, 1, 1800.0, '2024-03-01'), (1, 5, 600.0, '2024-03-09'),
+                    # User 2: one month, low spending
+                    (2, 2, 400.0, '2024-02-10'), (2, 4, 200.0, '2024-02-11'),
+                ]
+            )
+            ensure_schema(conn)
+        self.recommender = BudgetRecommender(self.db_path)
+
+    def tearDown(self):
+        os.remove(self.db_path)
+
+    def test_compute_matches_per_user_arithmetic(self):
+        summary, categories = self.recommender.compute()
+        summary = summary.set_index('user_id')
+
+        # User 1 spent 4500 over three months against a 5000 income
+        self.assertEqual(summary.loc[1, 'months'], 3)
+        self.assertAlmostEqual(summary.loc[1, 'avg_spending'], 1500.0)
+        self.assertAlmostEqual(summary.loc[1, 'savings_rate'], 0.7)
+        self.assertAlmostEqual(summary.loc[1, 'needs_share'], 1300.0 / 5000)
+        self.assertAlmostEqual(summary.loc[1, 'wants_share'], 200.0 / 5000)
+        self.assertAlmostEqual(summary.loc[2, 'savings_gap'], 0.2 - 3400.0 / 4000)
+
+        housing = categories[(categories['user_id'] == 1) & (categories['category'] == 'Housing')].iloc[0]
+        self.assertAlmostEqual(housing['avg_spending'], 1200.0)
+        self.assertAlmostEqual(housing['target'], 1500.0)
+        self.assertFalse(housing['over_budget'])
+        self.assertEqual(len(categories[categories['user_id'] == 2]), 2)
+
+    def test_refresh_materializes_lookups(self):
+        self.assertEqual(self.recommender.refresh(), 2)
+
+        budget, categories = self.recommender.get_recommendations(1)
+        self.assertAlmostEqual(budget['avg_spending'], 1500.0)
+        self.assertEqual(categories['category'].tolist(), ['Housing', 'Entertainment', 'Food'])
+        missing, missing_categories = self.recommender.get_recommendations(3)
+        self.assertIsNone(missing)
+        self.assertTrue(missing_categories.empty)
+
+    def test_refresh_single_user_keeps_others(self):
+        self.recommender.refresh()
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute(
+                "INSERT INTO transactions (user_id, category_id, amount, transaction_date) "
+                "VALUES (2, 1, 3000.0, '2024-02-01')"
+            )
+        self.recommender.refresh([2])
+
+        _, categories = self.recommender.get_recommendations(2)
+        self.assertTrue(categories.set_index('category').loc['Housing', 'over_budget'])
+        self.assertIsNotNone(self.recommender.get_recommendations(1)[0])
+
+    def test_refresh_more_users_than_sqlite_variables(self):
+        # 1,500 IDs would overflow a single IN (...) list on SQLite builds before 3.32
+        self.recommender.refresh()
+        user_ids = [1, 2] + list(range(1000, 2498))
+        self.assertEqual(self.recommender.refresh(user_ids), 2)
+
+        summary, _ = self.recommender.compute(user_ids)
+        self.assertEqual(sorted(summary['user_id']), [1, 2])
+        self.assertIsNotNone(self.recommender.get_recommendations(2)[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,9 @@
 import os
+import re
 import sys
+import math
 import sqlite3
+import threading
 import pandas as pd
 import streamlit as st
 import plotly.express as px
@@ -8,12 +11,52 @@ from datetime import datetime
 
 # Add the parent directory to the path so we can import from models
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from models.forecaster import SpendingForecaster
-from models.llm_assistant import OllamaAssistant
+from models.forecaster import SpendingForecaster, PERIOD_MONTHS
+from models.llm_assistant import (
+    AsyncOllamaClient, ConversationMemory, EndpointPool, FinanceTools, FinancialContextBuilder,
+    OllamaAssistant, OllamaHealthMonitor, ResponseCache
+)
+from models.recommender import SpendingAnomalyDetector, RecurringPaymentDetector, BudgetRecommender
+from models.categorizer import RuleCategorizer, CategoryClassifier, EmbeddingCategorizer, RecategorizationJob
+from utils.data_processor import MappingProfileStore, column_signature, compact_transactions, expand_transactions
+from utils.queries import FinanceQueries
 
 # Database path - use absolute path to avoid issues
 DB_PATH = os.path.abspath(os.path.join(os.path.dirname(os.path.dirname(__file__)), "finance.db"))
 
+# Learned categorizer weights, shared by every app process through mmap
+CATEGORY_MODEL_DIR = os.path.join(os.path.dirname(DB_PATH), "category_model")
+
+# Ollama model used to embed long-tail merchant descriptions
+EMBEDDING_MODEL = "nomic-embed-text"
+
+# Recent transactions loaded up front for the chat assistant; the Transactions
+# tab pages through the full history on demand
+RECENT_TRANSACTIONS = 50
+TRANSACTION_PAGE_SIZES = [25, 50, 100, 250]
+
+# Estimated tokens of financial context sent with each question
+LLM_CONTEXT_TOKENS = 768
+
+# Ollama instances to spread chat generations over; the first one also serves
+# the model list and embeddings
+OLLAMA_URLS = ["http://localhost:11434"]
+
+# Seconds without a response before a question is also sent to a second instance
+LLM_HEDGE_AFTER = 10.0
+
+# Generations sent to Ollama at once across all sessions, questions that may
+# wait for a slot, and seconds a question may take including the wait
+LLM_MAX_IN_FLIGHT = 2
+LLM_MAX_QUEUE = 16
+LLM_DEADLINE = 300
+
+# Chat messages kept per session (including the welcome message), and how many
+# are rendered at a time
+MAX_CHAT_HISTORY = 200
+CHAT_PAGE_SIZE = 20
+CHAT_WELCOME_MESSAGE = {"is_user": False, "text": "Hi there! I'm your Finance Assistant. How can I help you today?"}
+
 # Check if database exists, if not initialize it
 if not os.path.exists(DB_PATH):
     print("Database not found. Initializing database...")
@@ -167,44 +210,185 @@ def get_categories():
         # Return an empty DataFrame with the expected columns
         return pd.DataFrame(columns=['category_id', 'name'])
 
-def get_transactions(user_id):
-    """Get all transactions for a user from the database."""
+@st.cache_resource
+def get_rule_categorizer():
+    """Get the rule categorizer, compiled once per process."""
+    return RuleCategorizer()
+
+@st.cache_resource
+def get_category_classifier():
+    """Get the learned category classifier, loaded once per process."""
+    return CategoryClassifier(CATEGORY_MODEL_DIR)
+
+def refresh_category_derived_tables(user_id):
+    """Recompute the tables derived from a user's transaction categories."""
+    RecurringPaymentDetector(DB_PATH).refresh(user_id)
+    BudgetRecommender(DB_PATH).refresh([user_id])
+    # Anomaly profiles are per category, so moved transactions need a full rescore
+    SpendingAnomalyDetector(DB_PATH).rebuild(user_id)
+
+@st.cache_resource
+def get_ollama_monitor():
+    """Get the shared Ollama health monitor, polling every pooled instance in the background."""
+    monitor = OllamaHealthMonitor(pool=get_endpoint_pool())
+    monitor.start()
+    return monitor
+
+@st.cache_resource
+def get_response_cache():
+    """Get the shared LLM response cache, persisted in the app database."""
+    return ResponseCache(db_path=DB_PATH)
+
+@st.cache_resource
+def get_endpoint_pool():
+    """Get the shared pool of Ollama instances, which tracks their load and health."""
+    return EndpointPool(OLLAMA_URLS, balancing="model_affinity", hedge_after=LLM_HEDGE_AFTER)
+
+@st.cache_resource
+def get_llm_client():
+    """Get the shared queue that limits concurrent generations across sessions."""
+    return AsyncOllamaClient(max_in_flight=LLM_MAX_IN_FLIGHT, max_queue=LLM_MAX_QUEUE, deadline=LLM_DEADLINE)
+
+@st.cache_resource
+def get_context_builder():
+    """Get the shared LLM context builder, which caches each user's summary."""
+    return FinancialContextBuilder(token_budget=LLM_CONTEXT_TOKENS)
+
+@st.cache_resource
+def get_recategorization_job(user_id):
+    """Get the background re-categorization job for one user's transactions."""
+    return RecategorizationJob(
+        DB_PATH,
+        categorizer=get_rule_categorizer(),
+        job_name=f"recategorize_user_{user_id}",
+        on_finish=lambda: refresh_category_derived_tables(user_id),
+        classifier=get_category_classifier(),
+        user_id=user_id
+    )
+
+def get_transactions(user_id, limit=None):
+    """Get a user's transactions from the database in compact form.
+
+    Args:
+        user_id: The ID of the user
+        limit: Only load this many of the most recent transactions (default: all)
+
+    Returns:
+        Compact frame sorted by date (see ``compact_transactions``)
+    """
     try:
         conn = sqlite3.connect(DB_PATH)
         query = """
-        SELECT t.transaction_id, t.amount, t.transaction_date, c.name as category, t.category_id
+        SELECT t.transaction_id, t.amount, t.transaction_date, c.name as category, t.category_id, t.description
         FROM transactions t
         JOIN categories c ON t.category_id = c.category_id
         WHERE t.user_id = ?
-        ORDER BY t.transaction_date DESC
+        ORDER BY t.transaction_date DESC, t.transaction_id DESC
         """
-        transactions = pd.read_sql_query(query, conn, params=(user_id,))
+        params = [user_id]
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        transactions = pd.read_sql_query(query, conn, params=params)
         conn.close()
 
-        # Convert transaction_date to datetime
-        transactions['transaction_date'] = pd.to_datetime(transactions['transaction_date'])
-
-        return transactions
+        return compact_transactions(transactions)
     except (sqlite3.OperationalError, pd.errors.DatabaseError):
-        # Return an empty DataFrame with the expected columns
-        return pd.DataFrame(columns=['transaction_id', 'amount', 'transaction_date', 'category', 'category_id'])
+        # Return an empty frame with the expected columns
+        return compact_transactions(pd.DataFrame(
+            columns=['transaction_id', 'amount', 'transaction_date', 'category', 'category_id', 'description']
+        ))
+
+def get_page_cursors(filters):
+    """Get the keyset cursors of the pages visited in the Transactions tab.
+
+    The last cursor addresses the page being shown; the list starts over whenever
+    the user or the filters change.
+
+    Args:
+        filters: Hashable tuple of the user and the active filters
+    """
+    state = st.session_state.get('transaction_pages')
+    if state is None or state['filters'] != filters:
+        state = {'filters': filters, 'cursors': [None]}
+        st.session_state.transaction_pages = state
+    return state['cursors']
 
 def add_transaction(user_id, amount, category_id, transaction_date):
-    """Add a transaction to the database."""
+    """Add a transaction to the database and score it for anomalies."""
     try:
         conn = sqlite3.connect(DB_PATH)
         cursor = conn.cursor()
         cursor.execute(
-            "INSERT INTO transactions (user_id, amount, category_id, transaction_date) VALUES (?, ?, ?, ?)",
+            """INSERT INTO transactions (user_id, amount, category_id, transaction_date, category_source)
+            VALUES (?, ?, ?, ?, 'manual')""",
             (user_id, amount, category_id, transaction_date)
         )
+        transaction_id = cursor.lastrowid
         conn.commit()
         conn.close()
+
+        SpendingAnomalyDetector(DB_PATH).score_transactions(pd.DataFrame([{
+            'transaction_id': transaction_id,
+            'user_id': user_id,
+            'category_id': category_id,
+            'amount': amount,
+            'transaction_date': transaction_date
+        }]))
+        BudgetRecommender(DB_PATH).refresh([user_id])
         return True
     except sqlite3.Error:
         return False
 
-def process_csv_upload(uploaded_file, user_id, date_format, amount_col, date_col, category_col, category_mapping):
+def add_transactions(user_id, rows):
+    """Add many transactions in one database transaction and score them in one batch.
+
+    Args:
+        user_id: The ID of the user the transactions belong to
+        rows: List of (amount, category_id, transaction_date, description,
+            category_source) tuples; description may be None
+
+    Returns:
+        Tuple of (number of transactions added, number flagged as anomalies)
+    """
+    if not rows:
+        return 0, 0
+
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        cursor = conn.cursor()
+        # Take the write lock first so the explicit ids below cannot collide
+        cursor.execute("BEGIN IMMEDIATE")
+        first_id = cursor.execute(
+            "SELECT COALESCE(MAX(transaction_id), 0) + 1 FROM transactions"
+        ).fetchone()[0]
+        new_transactions = pd.DataFrame(
+            rows, columns=['amount', 'category_id', 'transaction_date', 'description', 'category_source']
+        )
+        new_transactions.insert(0, 'user_id', user_id)
+        new_transactions.insert(0, 'transaction_id', range(first_id, first_id + len(rows)))
+        cursor.executemany(
+            """INSERT INTO transactions
+            (transaction_id, user_id, amount, category_id, transaction_date, description, category_source)
+            VALUES (?, ?, ?, ?, ?, ?, ?)""",
+            new_transactions[['transaction_id', 'user_id', 'amount', 'category_id', 'transaction_date',
+                              'description', 'category_source']]
+            .itertuples(index=False, name=None)
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+    scores = SpendingAnomalyDetector(DB_PATH).score_transactions(new_transactions)
+
+    # New history can start or end recurring payments and changes the budget
+    RecurringPaymentDetector(DB_PATH).refresh(user_id)
+    BudgetRecommender(DB_PATH).refresh([user_id])
+
+    return len(rows), int(scores['is_anomaly'].sum())
+
+def process_csv_upload(uploaded_file, user_id, date_format, amount_col, date_col, category_col, category_mapping,
+                       description_col=None, embedding_categorizer=None):
     """Process an uploaded CSV file and add transactions to the database."""
     try:
         # Display the selected columns for debugging
@@ -234,6 +418,8 @@ def process_csv_upload(uploaded_file, user_id, date_format, amount_col, date_col
             missing_cols.append(f"Amount column '{amount_col}'")
         if category_col and category_col not in df.columns and category_col != 'None':
             missing_cols.append(f"Category column '{category_col}'")
+        if description_col and description_col not in df.columns:
+            missing_cols.append(f"Description column '{description_col}'")
 
         if missing_cols:
             st.error(f"The following selected columns were not found in the CSV: {', '.join(missing_cols)}")
@@ -244,10 +430,28 @@ def process_csv_upload(uploaded_file, user_id, date_format, amount_col, date_col
         categories = get_categories()
         category_dict = dict(zip(categories['name'], categories['category_id']))
 
+        # Categorize the whole description column up front for rows without a mapped category
+        classifier = get_category_classifier()
+        if description_col:
+            rule_categories = get_rule_categorizer().categorize(df[description_col])
+            learned_categories = classifier.predict(df[description_col])
+            learned_sources = pd.Series('classifier', index=df.index, dtype=object)
+            # Long-tail merchants missed by the rules and the linear model go to the embeddings
+            if embedding_categorizer is not None:
+                unresolved = rule_categories.isna() & learned_categories.isna()
+                learned_categories[unresolved] = embedding_categorizer.predict(df.loc[unresolved, description_col])
+                learned_sources[unresolved] = 'embeddings'
+        else:
+            rule_categories = None
+            learned_categories = None
+
         # Initialize counters
         success_count = 0
         error_count = 0
         total_count = len(df)
+        parsed_rows = []
+        # Descriptions the user categorized through the mapping, used to train the classifier
+        training_rows = []
 
         # Process each row
         for index, row in df.iterrows():
@@ -313,18 +517,35 @@ def process_csv_upload(uploaded_file, user_id, date_format, amount_col, date_col
                         category_name = category_mapping[category_val]
                         category_id = category_dict.get(category_name)
                     else:
-                        # Category not in mapping, use default
-                        category_id = category_dict.get('Miscellaneous', 7)
+                        # Category not in mapping, fall back to the description rules
+                        category_id = None
                 else:
-                    # No category column or value, use default
-                    category_id = category_dict.get('Miscellaneous', 7)
+                    # No category column or value, fall back to the description rules
+                    category_id = None
+
+                # Record how the category was chosen; only automatic choices are re-categorized later
+                category_source = 'mapping'
+                if category_id is None:
+                    category_name = None
+                    category_source = 'default'
+                    if rule_categories is not None:
+                        if rule_categories[index]:
+                            category_name, category_source = rule_categories[index], 'rules'
+                        elif learned_categories[index]:
+                            category_name, category_source = learned_categories[index], learned_sources[index]
+                    category_id = category_dict.get(category_name)
+                    if category_id is None:
+                        category_id = category_dict.get('Miscellaneous', 7)
+                        category_source = 'default'
+                elif description_col and not pd.isna(row[description_col]):
+                    training_rows.append((row[description_col], category_name))
 
-                # Add transaction to database
-                if add_transaction(user_id, amount, category_id, transaction_date):
-                    success_count += 1
+                if description_col and not pd.isna(row[description_col]):
+                    description = str(row[description_col]).strip()
                 else:
-                    st.error(f"Failed to add transaction to database: Row {index+1}")
-                    error_count += 1
+                    description = None
+
+                parsed_rows.append((amount, category_id, transaction_date, description, category_source))
 
             except Exception as e:
                 st.error(f"Error processing row {index+1}: {str(e)}")
@@ -332,6 +553,20 @@ def process_csv_upload(uploaded_file, user_id, date_format, amount_col, date_col
                 st.write(f"Problematic row data: {row.to_dict()}")
                 error_count += 1
 
+        # Add all parsed transactions to the database in one batch
+        try:
+            success_count, anomaly_count = add_transactions(user_id, parsed_rows)
+            if training_rows:
+                descriptions, category_names = zip(*training_rows)
+                classifier.partial_fit(descriptions, category_names)
+                if embedding_categorizer is not None:
+                    embedding_categorizer.add_examples(descriptions, category_names)
+            if anomaly_count > 0:
+                st.warning(f"{anomaly_count} imported transactions look unusually large for their category.")
+        except sqlite3.Error as e:
+            st.error(f"Failed to add transactions to database: {str(e)}")
+            error_count += len(parsed_rows)
+
         return success_count, error_count, total_count
 
     except Exception as e:
@@ -386,9 +621,9 @@ def plot_spending_distribution(spending_history):
 
     return fig
 
-def plot_forecast(forecast):
-    """Create a line chart of spending forecast by month."""
-    # Calculate total spending by month
+def plot_forecast(forecast, period_label='Month'):
+    """Create a line chart of spending forecast by period."""
+    # Calculate total spending by period
     monthly_total = forecast.sum(axis=1)
 
     # Create the plot
@@ -396,13 +631,13 @@ def plot_forecast(forecast):
         x=monthly_total.index,
         y=monthly_total.values,
         title='Spending Forecast',
-        labels={'x': 'Month', 'y': 'Amount ($)'},
+        labels={'x': period_label, 'y': 'Amount ($)'},
         markers=True
     )
 
     # Customize the layout
     fig.update_layout(
-        xaxis_title='Month',
+        xaxis_title=period_label,
         yaxis_title='Amount ($)',
         height=400
     )
@@ -443,6 +678,47 @@ def plot_forecast(forecast):
 
     return fig
 
+# Advice for categories over their recommended share of income (None is the default)
+BUDGET_ADVICE = {
+    "Housing": "Your housing expenses (${monthly_avg:.2f}/month, {percent_of_income:.1f}% of income) exceed the recommended 30% of income. Consider if there are ways to reduce these costs.",
+    "Food": "You spend ${monthly_avg:.2f}/month on food ({percent_of_income:.1f}% of income). Consider meal planning or cooking at home more to reduce costs.",
+    "Transportation": "Your transportation costs (${monthly_avg:.2f}/month, {percent_of_income:.1f}% of income) are significant. Consider carpooling, public transit, or other alternatives if possible.",
+    "Entertainment": "You spend ${monthly_avg:.2f}/month on entertainment ({percent_of_income:.1f}% of income). Look for free or low-cost entertainment options to reduce this expense.",
+    None: "Your spending on {category} (${monthly_avg:.2f}/month, {percent_of_income:.1f}% of income) is relatively high. Consider if there are ways to reduce this expense."
+}
+
+def get_budget_recommendations(user_id):
+    """Get the stored budget recommendations for a user, computing them if missing."""
+    recommender = BudgetRecommender(DB_PATH)
+    budget, category_budgets = recommender.get_recommendations(user_id)
+    if budget is None:
+        recommender.refresh([user_id])
+        budget, category_budgets = recommender.get_recommendations(user_id)
+    return budget, category_budgets
+
+# Questions about a merchant, e.g. "How much did I spend at Shell this year?"
+MERCHANT_QUESTION_PATTERN = re.compile(
+    r"\b(?:spen[dt]|spending|pa(?:y|id)|bought|purchases?|transactions?)\b.*?\b(?:at|from)\s+"
+    r"(?P<merchant>[\w&'.\- ]+?)\s*(?:\b(?:this|last|in|during|since|over|per|each|so far)\b.*)?[?.!]*$",
+    re.IGNORECASE
+)
+
+def get_merchant_summary(user_id, question):
+    """Search the user's transactions for the merchant named in a question.
+
+    Returns:
+        Tuple of (merchant text, search summary), or None if the question does not
+        name a merchant or nothing matches
+    """
+    match = MERCHANT_QUESTION_PATTERN.search(question)
+    if not match:
+        return None
+    merchant = match.group('merchant').strip()
+    summary = FinanceQueries(DB_PATH).search_summary(user_id, merchant)
+    if summary['count'] == 0:
+        return None
+    return merchant, summary
+
 def get_chatbot_response(user_id, question, spending_history, forecast, transactions, user_info):
     """Generate a response to a user's question about their finances."""
     # Convert question to lowercase for easier matching
@@ -453,8 +729,20 @@ def get_chatbot_response(user_id, question, spending_history, forecast, transact
     has_transactions = not transactions.empty
     has_forecast = not forecast.empty
 
+    # Merchant questions are answered from the full-text index over descriptions
+    merchant_summary = get_merchant_summary(user_id, question)
+
+    if merchant_summary:
+        merchant, summary = merchant_summary
+        categories_text = ", ".join(
+            f"{category}: ${total:,.2f}" for category, total in
+            summary['by_category'][['category', 'total']].itertuples(index=False)
+        )
+        return (f"You've spent ${summary['total']:,.2f} at {merchant} across {summary['count']} transactions "
+                f"between {summary['first_date']} and {summary['last_date']} ({categories_text}).")
+
     # Greeting responses
-    if any(keyword in question_lower for keyword in ['hello', 'hi', 'hey', 'greetings']):
+    elif any(keyword in question_lower for keyword in ['hello', 'hi', 'hey', 'greetings']):
         return f"Hello {user_info['name']}! How can I help you with your finances today?"
 
     # Income-related responses
@@ -521,33 +809,21 @@ def get_chatbot_response(user_id, question, spending_history, forecast, transact
     # Budget recommendations
     elif any(keyword in question_lower for keyword in ['budget', 'recommend', 'suggestion', 'advice']):
         if has_history:
-            # Calculate spending by category
-            total_by_category = spending_history.sum()
-            monthly_income = user_info['income']
-
-            # Find the top spending categories
-            top_categories = total_by_category.nlargest(3)
+            # Recommendations are precomputed for all users; this is a lookup
+            budget, category_budgets = get_budget_recommendations(user_id)
             recommendations = []
 
-            # Generate specific recommendations for each category
-            for category, amount in top_categories.items():
-                monthly_avg = amount / len(spending_history)
-                percent_of_income = (monthly_avg / monthly_income) * 100
-
-                if category == "Housing" and percent_of_income > 30:
-                    recommendations.append(f"Your housing expenses (${monthly_avg:.2f}/month, {percent_of_income:.1f}% of income) exceed the recommended 30% of income. Consider if there are ways to reduce these costs.")
-                elif category == "Food" and percent_of_income > 15:
-                    recommendations.append(f"You spend ${monthly_avg:.2f}/month on food ({percent_of_income:.1f}% of income). Consider meal planning or cooking at home more to reduce costs.")
-                elif category == "Transportation" and percent_of_income > 15:
-                    recommendations.append(f"Your transportation costs (${monthly_avg:.2f}/month, {percent_of_income:.1f}% of income) are significant. Consider carpooling, public transit, or other alternatives if possible.")
-                elif category == "Entertainment" and percent_of_income > 10:
-                    recommendations.append(f"You spend ${monthly_avg:.2f}/month on entertainment ({percent_of_income:.1f}% of income). Look for free or low-cost entertainment options to reduce this expense.")
-                elif percent_of_income > 10:
-                    recommendations.append(f"Your spending on {category} (${monthly_avg:.2f}/month, {percent_of_income:.1f}% of income) is relatively high. Consider if there are ways to reduce this expense.")
+            # Generate specific recommendations for the top spending categories
+            for category, monthly_avg, share, over_budget in category_budgets.head(3)[
+                    ['category', 'avg_spending', 'share_of_income', 'over_budget']].itertuples(index=False):
+                if over_budget:
+                    advice = BUDGET_ADVICE.get(category, BUDGET_ADVICE[None])
+                    recommendations.append(advice.format(
+                        category=category, monthly_avg=monthly_avg, percent_of_income=share * 100
+                    ))
 
             # Calculate overall budget health
-            avg_monthly_spending = spending_history.sum(axis=1).mean()
-            savings_rate = ((monthly_income - avg_monthly_spending) / monthly_income) * 100
+            savings_rate = budget['savings_rate'] * 100
 
             if savings_rate < 0:
                 budget_health = "You're spending more than you earn, which is unsustainable long-term. Focus on reducing expenses or increasing income."
@@ -605,7 +881,7 @@ def get_chatbot_response(user_id, question, spending_history, forecast, transact
         if has_transactions:
             # Get recent transactions
             num_transactions = 3
-            recent_transactions = transactions.head(min(num_transactions, len(transactions)))
+            recent_transactions = expand_transactions(transactions.tail(num_transactions).iloc[::-1])
 
             # Format transaction details
             transaction_details = []
@@ -621,20 +897,32 @@ def get_chatbot_response(user_id, question, spending_history, forecast, transact
             return "I don't have any transaction data for you. Please upload some transaction data."
 
     # Category-specific spending
-    elif any(category.lower() in question_lower for category in spending_history.columns) and has_history:
+    elif any(category.lower() in question_lower for category in get_categories()['name']) and has_history:
         # Find which category was mentioned
-        mentioned_categories = [category for category in spending_history.columns if category.lower() in question_lower]
+        mentioned_categories = [category for category in get_categories()['name'] if category.lower() in question_lower]
 
         if mentioned_categories:
             category = mentioned_categories[0]
-            monthly_avg = spending_history[category].mean()
-            total_spent = spending_history[category].sum()
-            percent_of_total = (spending_history[category].sum() / spending_history.sum().sum()) * 100
+            finance_queries = FinanceQueries(DB_PATH)
+            totals = finance_queries.spending_aggregate(user_id, granularity=None)
+            total_spent = totals.loc[totals['category'] == category, 'total'].sum()
+            monthly_avg = finance_queries.average_spending(user_id, 'month', categories=[category])
+            percent_of_total = (total_spent / totals['total'].sum()) * 100
             percent_of_income = (monthly_avg / user_info['income']) * 100
 
             # Get trend if enough data
-            if len(spending_history) >= 3:
-                recent_months = spending_history[category].tail(3).values
+            first_date, last_date = finance_queries.activity_span(user_id)
+            recent_periods = pd.period_range(end=pd.Period(last_date, freq='M'), periods=3, freq='M')
+            if recent_periods[0] >= pd.Period(first_date, freq='M'):
+                recent = finance_queries.spending_aggregate(
+                    user_id,
+                    start_date=recent_periods[0].start_time.strftime('%Y-%m-%d'),
+                    categories=[category],
+                    by_category=False
+                )
+                recent_months = recent.set_index('period')['total'].reindex(
+                    recent_periods.strftime('%Y-%m'), fill_value=0.0
+                ).values
                 if recent_months[-1] > recent_months[-2] > recent_months[-3]:
                     trend = "increasing"
                 elif recent_months[-1] < recent_months[-2] < recent_months[-3]:
@@ -650,23 +938,22 @@ def get_chatbot_response(user_id, question, spending_history, forecast, transact
 
     # Time period analysis
     elif any(period in question_lower for period in ['month', 'year', 'week', 'day']) and has_history:
+        finance_queries = FinanceQueries(DB_PATH)
         if 'month' in question_lower:
             # Monthly analysis already covered in spending questions
-            avg_monthly_spending = spending_history.sum(axis=1).mean()
+            avg_monthly_spending = finance_queries.average_spending(user_id, 'month')
             return f"Your average monthly spending is ${avg_monthly_spending:,.2f}."
         elif 'year' in question_lower or 'annual' in question_lower:
-            avg_monthly_spending = spending_history.sum(axis=1).mean()
+            avg_monthly_spending = finance_queries.average_spending(user_id, 'month')
             annual_spending = avg_monthly_spending * 12
             annual_income = user_info['income'] * 12
             savings = annual_income - annual_spending
             return f"Based on your monthly averages, your annual spending is approximately ${annual_spending:,.2f}. With an annual income of ${annual_income:,.2f}, you save about ${savings:,.2f} per year."
         elif 'week' in question_lower:
-            avg_monthly_spending = spending_history.sum(axis=1).mean()
-            weekly_spending = avg_monthly_spending / 4.33  # Average weeks in a month
+            weekly_spending = finance_queries.average_spending(user_id, 'week')
             return f"Your average weekly spending is approximately ${weekly_spending:,.2f}."
         elif 'day' in question_lower:
-            avg_monthly_spending = spending_history.sum(axis=1).mean()
-            daily_spending = avg_monthly_spending / 30  # Average days in a month
+            daily_spending = finance_queries.average_spending(user_id, 'day')
             return f"Your average daily spending is approximately ${daily_spending:,.2f}."
 
     # Help/features response
@@ -733,16 +1020,32 @@ def main():
     st.sidebar.title("AI Assistant Settings")
 
     # Initialize Ollama assistant
-    ollama_assistant = OllamaAssistant()
-
-    # Check if Ollama is available
-    ollama_available = ollama_assistant.check_ollama_availability()
+    if 'conversation_memory' not in st.session_state:
+        st.session_state.conversation_memory = ConversationMemory()
+    ollama_assistant = OllamaAssistant(response_cache=get_response_cache(),
+                                       memory=st.session_state.conversation_memory,
+                                       context_builder=get_context_builder(),
+                                       client=get_llm_client(),
+                                       pool=get_endpoint_pool())
+
+    # Read Ollama's availability from the background monitor instead of probing on every rerun
+    ollama_status = get_ollama_monitor().status()
+    ollama_available = ollama_status['available']
 
     if ollama_available:
         st.sidebar.success("✅ Ollama LLM is available")
 
+        # Show the shared queue's load when other sessions are waiting on the model
+        llm_load = ollama_assistant.client.metrics()
+        if llm_load['in_flight'] or llm_load['queued']:
+            st.sidebar.caption(f"LLM load: {llm_load['in_flight']} generating, {llm_load['queued']} waiting "
+                               f"(recent wait {llm_load['wait_avg']:.1f}s)")
+        if len(OLLAMA_URLS) > 1:
+            healthy = sum(endpoint['healthy'] for endpoint in ollama_assistant.pool.status())
+            st.sidebar.caption(f"Ollama instances: {healthy} of {len(OLLAMA_URLS)} healthy")
+
         # Get available models
-        available_models = ollama_assistant.get_available_models()
+        available_models = ollama_status['models']
 
         if available_models:
             # Model selection
@@ -755,6 +1058,12 @@ def main():
             # Update the model in the assistant
             ollama_assistant.model_name = selected_model
 
+            # Load a newly picked model in the background so the first question does not wait for it
+            if st.session_state.get('warmed_model') != selected_model:
+                st.session_state.warmed_model = selected_model
+                threading.Thread(target=ollama_assistant.warm_up, args=(selected_model,),
+                                 name="ollama-warm-up", daemon=True).start()
+
             # Temperature setting
             temperature = st.sidebar.slider(
                 "Temperature",
@@ -764,14 +1073,29 @@ def main():
                 step=0.1,
                 help="Higher values make the output more random, lower values make it more deterministic"
             )
+
+            # Tool calling
+            use_tools = st.sidebar.checkbox(
+                "Let the assistant query your data",
+                value=True,
+                help="The model looks up the figures each question needs instead of reading a fixed summary. "
+                     "Models without tool support get the summary."
+            )
         else:
             st.sidebar.warning("No models available. Please pull a model using Ollama CLI.")
             selected_model = None
             temperature = 0.7
+            use_tools = False
+    elif not ollama_status['checked']:
+        st.sidebar.info("Checking for the Ollama LLM...")
+        selected_model = None
+        temperature = 0.7
+        use_tools = False
     else:
         st.sidebar.error("❌ Ollama LLM is not available. Make sure it's running at http://localhost:11434")
         selected_model = None
         temperature = 0.7
+        use_tools = False
 
     # Create forecaster instance
     forecaster = SpendingForecaster(DB_PATH)
@@ -782,8 +1106,8 @@ def main():
     # Generate forecast
     forecast = forecaster.forecast_spending(selected_user_id, forecast_months=forecast_months)
 
-    # Get transactions
-    transactions = get_transactions(selected_user_id)
+    # Get the most recent transactions
+    transactions = get_transactions(selected_user_id, limit=RECENT_TRANSACTIONS)
 
     # Create tabs
     tabs = st.tabs(["Spending History", "Forecast", "Transactions", "Upload Data", "Chat Assistant"])
@@ -800,18 +1124,51 @@ def main():
 
             # Plot spending distribution
             st.plotly_chart(plot_spending_distribution(spending_history), use_container_width=True)
+
+            # Budget targets from the precomputed recommendations
+            _, category_budgets = get_budget_recommendations(selected_user_id)
+            if not category_budgets.empty:
+                st.subheader("Budget Targets")
+                st.dataframe(
+                    category_budgets[['category', 'avg_spending', 'target', 'over_budget']],
+                    use_container_width=True,
+                    column_config={
+                        "category": "Category",
+                        "avg_spending": st.column_config.NumberColumn("Monthly Average", format="$%.2f"),
+                        "target": st.column_config.NumberColumn("Recommended Maximum", format="$%.2f"),
+                        "over_budget": st.column_config.CheckboxColumn("Over Budget")
+                    }
+                )
         else:
             st.info("No spending history available for this user.")
 
     # Forecast Tab
     with tabs[1]:
         if not forecast.empty:
+            granularity = st.selectbox(
+                "Granularity",
+                options=["month", "day", "week", "quarter"],
+                format_func=str.title,
+                help="Forecast resolution; the horizon stays at the selected number of months"
+            )
+
+            if granularity == "month":
+                period_forecast = forecast
+            else:
+                # Cover the same horizon at the finer or coarser resolution
+                forecast_periods = math.ceil(forecast_months / PERIOD_MONTHS[granularity])
+                period_forecast = forecaster.forecast_spending(
+                    selected_user_id,
+                    forecast_months=forecast_periods,
+                    granularity=granularity
+                )
+
             # Display forecast table
             st.subheader(f"Spending Forecast for the Next {forecast_months} Months")
-            st.dataframe(forecast.style.format("${:.2f}"), use_container_width=True)
+            st.dataframe(period_forecast.style.format("${:.2f}"), use_container_width=True)
 
             # Plot forecast
-            st.plotly_chart(plot_forecast(forecast), use_container_width=True)
+            st.plotly_chart(plot_forecast(period_forecast, granularity.title()), use_container_width=True)
 
             # Calculate and display savings potential
             if not spending_history.empty:
@@ -834,29 +1191,115 @@ def main():
                     st.markdown('<p class="metric-label">Savings Rate</p>', unsafe_allow_html=True)
                     st.markdown(f'<p class="metric-value">{savings_percent:.1f}%</p>', unsafe_allow_html=True)
                     st.markdown('</div>', unsafe_allow_html=True)
+
+            # Recurring payments are forecast from their schedule, not the model
+            recurring_payments = RecurringPaymentDetector(DB_PATH).get_recurring_payments(selected_user_id)
+            if not recurring_payments.empty:
+                st.subheader("Recurring Payments")
+                st.dataframe(
+                    recurring_payments[['merchant', 'category', 'amount', 'cadence', 'next_date']],
+                    use_container_width=True,
+                    column_config={
+                        "merchant": "Merchant",
+                        "category": "Category",
+                        "amount": st.column_config.NumberColumn("Amount", format="$%.2f"),
+                        "cadence": "Cadence",
+                        "next_date": "Next Payment"
+                    }
+                )
         else:
             st.info("Unable to generate forecast for this user.")
 
     # Transactions Tab
     with tabs[2]:
         if not transactions.empty:
-            # Display transactions
+            # Full-text search over transaction descriptions
+            search_text = st.text_input("Search transactions", placeholder="e.g. Shell, Netflix, whole foods")
+            if search_text.strip():
+                finance_queries = FinanceQueries(DB_PATH)
+                search_summary = finance_queries.search_summary(selected_user_id, search_text)
+                if search_summary['count'] > 0:
+                    st.write(f"**{search_summary['count']}** matching transactions totaling "
+                             f"**${search_summary['total']:,.2f}** "
+                             f"({search_summary['first_date']} to {search_summary['last_date']})")
+                    st.dataframe(
+                        finance_queries.search_transactions(selected_user_id, search_text),
+                        use_container_width=True,
+                        hide_index=True,
+                        column_config={
+                            "transaction_id": None,
+                            "transaction_date": "Date",
+                            "amount": st.column_config.NumberColumn("Amount", format="$%.2f"),
+                            "category": "Category",
+                            "description": "Description"
+                        }
+                    )
+                else:
+                    st.info(f"No transactions match '{search_text}'.")
+
+            # Display transactions one page at a time
             st.subheader("Recent Transactions")
 
-            # Format the dataframe
-            transactions_display = transactions.copy()
-            transactions_display['transaction_date'] = transactions_display['transaction_date'].dt.strftime('%Y-%m-%d')
-            transactions_display['amount'] = transactions_display['amount'].apply(lambda x: f"${x:,.2f}")
-
-            st.dataframe(
-                transactions_display[['transaction_date', 'category', 'amount']],
-                use_container_width=True,
-                column_config={
-                    "transaction_date": "Date",
-                    "category": "Category",
-                    "amount": "Amount"
-                }
+            filter_cols = st.columns([2, 3, 1])
+            with filter_cols[0]:
+                date_range = st.date_input("Date range", value=(), key="transactions_date_range")
+            with filter_cols[1]:
+                categories = get_categories()
+                category_names = st.multiselect("Categories", categories['name'].tolist(),
+                                                key="transactions_categories")
+            with filter_cols[2]:
+                page_size = st.selectbox("Rows per page", TRANSACTION_PAGE_SIZES, index=1,
+                                         key="transactions_page_size")
+
+            start_date = date_range[0].strftime('%Y-%m-%d') if len(date_range) > 0 else None
+            end_date = date_range[1].strftime('%Y-%m-%d') if len(date_range) > 1 else None
+            category_ids = categories.loc[categories['name'].isin(category_names), 'category_id'].tolist()
+
+            cursors = get_page_cursors((selected_user_id, start_date, end_date, tuple(category_ids), page_size))
+            page, next_cursor = FinanceQueries(DB_PATH).transactions_page(
+                selected_user_id, page_size=page_size, after=cursors[-1],
+                start_date=start_date, end_date=end_date, category_ids=category_ids
             )
+
+            if page.empty:
+                st.info("No transactions match these filters.")
+            else:
+                st.dataframe(
+                    page[['transaction_date', 'category', 'amount', 'description']],
+                    use_container_width=True,
+                    hide_index=True,
+                    column_config={
+                        "transaction_date": "Date",
+                        "category": "Category",
+                        "amount": st.column_config.NumberColumn("Amount", format="$%.2f"),
+                        "description": "Description"
+                    }
+                )
+
+            nav_cols = st.columns([1, 1, 4])
+            with nav_cols[0]:
+                st.button("Previous", on_click=cursors.pop, disabled=len(cursors) == 1,
+                          key="transactions_previous")
+            with nav_cols[1]:
+                st.button("Next", on_click=cursors.append, args=(next_cursor,),
+                          disabled=next_cursor is None, key="transactions_next")
+            with nav_cols[2]:
+                st.caption(f"Page {len(cursors)}")
+
+            # Show transactions flagged by the anomaly detector
+            anomalies = SpendingAnomalyDetector(DB_PATH).get_anomalies(selected_user_id)
+            if not anomalies.empty:
+                with st.expander(f"Unusual Transactions ({len(anomalies)})"):
+                    st.dataframe(
+                        anomalies[['transaction_date', 'category', 'amount', 'expected_amount']],
+                        use_container_width=True,
+                        column_config={
+                            "transaction_date": "Date",
+                            "category": "Category",
+                            "amount": st.column_config.NumberColumn("Amount", format="$%.2f"),
+                            "expected_amount": st.column_config.NumberColumn("Typical Amount", format="$%.2f")
+                        }
+                    )
         else:
             st.info("No transactions available for this user.")
 
@@ -901,6 +1344,17 @@ def main():
                     if category_col == "None":
                         category_col = None
 
+                    description_options = ["None"] + column_names
+                    description_col = st.selectbox(
+                        "Description Column (optional)",
+                        options=description_options,
+                        index=description_options.index('Description') if 'Description' in column_names else 0,
+                        help="Transactions without a mapped category are categorized from their description"
+                    )
+
+                    if description_col == "None":
+                        description_col = None
+
                 # Get categories from database for mapping
                 categories = get_categories()
                 category_names = categories['name'].tolist()
@@ -913,18 +1367,52 @@ def main():
                     # Get unique categories from the CSV
                     unique_categories = df_preview[category_col].dropna().unique().tolist()
 
-                    # Create a mapping form
+                    # Apply the mappings saved for this user and statement source
+                    profile_store = MappingProfileStore(DB_PATH)
+                    signature = column_signature(column_names)
+                    saved_profile = profile_store.get_profile(selected_user_id, signature)
+                    category_id_names = dict(zip(categories['category_id'], categories['name']))
+
                     category_mapping = {}
                     for csv_category in unique_categories:
+                        saved_name = category_id_names.get(saved_profile.get(str(csv_category)))
+                        if saved_name is not None:
+                            category_mapping[csv_category] = saved_name
+
+                    edit_saved = False
+                    if category_mapping:
+                        st.caption(f"{len(category_mapping)} of {len(unique_categories)} categories "
+                                   "mapped from your saved profile for this file format.")
+                        edit_saved = st.checkbox("Edit saved mappings")
+
+                    # Only categories without a saved mapping need a widget
+                    for csv_category in unique_categories:
+                        if csv_category in category_mapping and not edit_saved:
+                            continue
+                        default_name = category_mapping.get(csv_category)
                         mapped_category = st.selectbox(
                             f"Map '{csv_category}' to:",
                             options=category_names,
+                            index=category_names.index(default_name) if default_name in category_names else 0,
                             key=f"map_{csv_category}"
                         )
                         category_mapping[csv_category] = mapped_category
                 else:
                     category_mapping = {}
 
+                # Use Ollama embeddings for long-tail merchants when an embedding model is installed
+                embedding_categorizer = None
+                if ollama_available and description_col:
+                    embedding_model = next(
+                        (name for name in ollama_status['models']
+                         if name.split(':')[0] == EMBEDDING_MODEL),
+                        None
+                    )
+                    if embedding_model:
+                        embedding_categorizer = EmbeddingCategorizer(
+                            DB_PATH, base_url=ollama_assistant.base_url, model_name=embedding_model
+                        )
+
                 # Process button
                 if st.button("Import Transactions"):
                     with st.spinner("Importing transactions..."):
@@ -935,10 +1423,30 @@ def main():
                             amount_col,
                             date_col,
                             category_col,
-                            category_mapping
+                            category_mapping,
+                            description_col,
+                            embedding_categorizer
                         )
 
                         if success_count > 0:
+                            if category_mapping:
+                                category_name_ids = dict(zip(categories['name'], categories['category_id']))
+                                new_profile = {
+                                    csv_category: category_name_ids[name]
+                                    for csv_category, name in category_mapping.items()
+                                    if name in category_name_ids
+                                }
+                                MappingProfileStore(DB_PATH).save_profile(
+                                    selected_user_id, column_signature(column_names), new_profile
+                                )
+                                # The classifier has learned the edited mappings; let it
+                                # revisit this user's automatically categorized history
+                                if any(str(csv_category) in saved_profile
+                                       and saved_profile[str(csv_category)] != mapped_id
+                                       for csv_category, mapped_id in new_profile.items()):
+                                    get_recategorization_job(selected_user_id).start(restart=True)
+                                    st.info("Your mappings changed, so your earlier transactions "
+                                            "are being re-categorized in the background.")
                             st.success(f"Successfully imported {success_count} of {total_count} transactions.")
                             if error_count > 0:
                                 st.warning(f"Failed to import {error_count} transactions. Check the errors above.")
@@ -1006,6 +1514,27 @@ def main():
                     )
                     st.write(description)
 
+        # Re-apply the current rules to transactions imported earlier
+        with st.expander("Re-categorize existing transactions"):
+            st.write("Apply the current categorization rules and learned model to your stored transactions "
+                     "that were categorized automatically. Categories from your mappings or entered by hand "
+                     "are kept. The job runs in the background in small chunks and resumes where it stopped.")
+            recategorization_job = get_recategorization_job(selected_user_id)
+            job_status = recategorization_job.status()
+
+            if recategorization_job.is_running:
+                st.info("Re-categorization is running.")
+                if st.button("Stop re-categorization"):
+                    recategorization_job.stop()
+            elif st.button("Start re-categorization"):
+                recategorization_job.start()
+                st.info("Re-categorization started.")
+
+            if job_status:
+                state = "finished" if job_status['finished_at'] else "in progress"
+                st.caption(f"Last run {state}: {job_status['scanned']:,} transactions scanned, "
+                           f"{job_status['updated']:,} re-categorized (updated {job_status['updated_at']}).")
+
     # Chat Assistant Tab
     with tabs[4]:
         st.subheader("Chat with Finance Assistant")
@@ -1043,7 +1572,7 @@ def main():
         if 'chat_history' not in st.session_state:
             st.session_state.chat_history = []
             # Add a welcome message from the assistant
-            st.session_state.chat_history.append({"is_user": False, "text": "Hi there! I'm your Finance Assistant. How can I help you today?"})
+            st.session_state.chat_history.append(dict(CHAT_WELCOME_MESSAGE))
 
         # Create a container for the chat messages with custom styling
         with chat_col1:
@@ -1051,12 +1580,19 @@ def main():
             with chat_container:
                 st.markdown('<div class="chat-container">', unsafe_allow_html=True)
 
-                # Display chat history with custom styling
-                for message in st.session_state.chat_history:
-                    if message['is_user']:
-                        st.markdown(f'<div class="chat-message-user">{message["text"]}</div>', unsafe_allow_html=True)
-                    else:
-                        st.markdown(f'<div class="chat-message-assistant">{message["text"]}</div>', unsafe_allow_html=True)
+                # Show the most recent messages; older ones load on request
+                visible_count = st.session_state.get('chat_visible', CHAT_PAGE_SIZE)
+                hidden_count = len(st.session_state.chat_history) - visible_count
+                if hidden_count > 0 and st.button(f"Load older messages ({hidden_count})"):
+                    st.session_state.chat_visible = visible_count + CHAT_PAGE_SIZE
+                    st.rerun()
+
+                # Display chat history with custom styling, as one block
+                st.markdown(''.join(
+                    f'<div class="{"chat-message-user" if message["is_user"] else "chat-message-assistant"}">'
+                    f'{message["text"]}</div>'
+                    for message in st.session_state.chat_history[-visible_count:]
+                ), unsafe_allow_html=True)
 
                 st.markdown('</div>', unsafe_allow_html=True)
 
@@ -1065,7 +1601,9 @@ def main():
             # Add a button to clear chat history
             if st.session_state.chat_history and st.button("Clear Chat"):
                 # Keep only the welcome message
-                st.session_state.chat_history = [st.session_state.chat_history[0]]
+                st.session_state.chat_history = [dict(CHAT_WELCOME_MESSAGE)]
+                st.session_state.chat_visible = CHAT_PAGE_SIZE
+                st.session_state.conversation_memory.clear()
                 st.rerun()
 
             # Add some example quick questions as buttons
@@ -1109,18 +1647,19 @@ def main():
                     "user_info": dict(user_info),
                     "spending_history": spending_history,
                     "forecast": forecast,
-                    "transactions": transactions
+                    "transactions": expand_transactions(transactions.iloc[::-1]),
+                    "data_version": FinanceQueries(DB_PATH).data_version(selected_user_id)
                 }
 
-                # Use Ollama LLM if available, otherwise fall back to rule-based responses
-                if ollama_available and selected_model:
-                    response = ollama_assistant.generate_response(
-                        user_question,
-                        financial_data,
-                        temperature=temperature
-                    )
-                else:
-                    # Fall back to rule-based responses if Ollama is not available
+                # Give the model the matching transactions when the question names a merchant
+                merchant_summary = get_merchant_summary(selected_user_id, user_question)
+                if merchant_summary:
+                    financial_data["merchant_search"] = {
+                        "merchant": merchant_summary[0], **merchant_summary[1]
+                    }
+
+                # Fall back to rule-based responses if Ollama is not available
+                if not (ollama_available and selected_model):
                     response = get_chatbot_response(
                         selected_user_id,
                         user_question,
@@ -1130,8 +1669,46 @@ def main():
                         user_info
                     )
 
-            # Add assistant response to chat history
+            # Use Ollama LLM if available, showing the answer as it is generated
+            if ollama_available and selected_model:
+                with chat_container:
+                    st.markdown(f'<div class="chat-message-user">{user_question}</div>', unsafe_allow_html=True)
+                    response_placeholder = st.empty()
+
+                # Say so when the question has to wait behind other sessions
+                llm_load = ollama_assistant.client.metrics()
+                if llm_load['in_flight'] >= llm_load['max_in_flight']:
+                    response_placeholder.markdown(
+                        f'<div class="chat-message-assistant">Waiting for the language model '
+                        f'({llm_load["queued"] + 1} in line)...</div>', unsafe_allow_html=True
+                    )
+
+                if use_tools:
+                    tools = FinanceTools(DB_PATH, selected_user_id, forecast=forecast)
+                    tokens = ollama_assistant.stream_response_with_tools(
+                        user_question,
+                        tools,
+                        financial_data,
+                        temperature=temperature
+                    )
+                else:
+                    tokens = ollama_assistant.stream_response(
+                        user_question,
+                        financial_data,
+                        temperature=temperature
+                    )
+
+                response = ""
+                for token in tokens:
+                    response += token
+                    response_placeholder.markdown(
+                        f'<div class="chat-message-assistant">{response}▌</div>', unsafe_allow_html=True
+                    )
+
+            # Add assistant response to chat history, dropping the oldest messages past the cap
+            # but keeping the welcome message at the start
             st.session_state.chat_history.append({"is_user": False, "text": response})
+            del st.session_state.chat_history[1:-(MAX_CHAT_HISTORY - 1)]
 
             # Rerun to update the UI
             st.rerun()
@@ -0,0 +1,350 @@
+"""Data processing utilities for cleaning and normalizing transaction data.
+
+This module provides the merchant normalization stage used before grouping,
+deduplicating and categorizing transactions, the saved category mapping
+profiles applied when a statement is imported, and the compact in-memory
+representation of a user's transactions.
+"""
+
+import hashlib
+import re
+import sqlite3
+from functools import lru_cache
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+# Patterns applied in order to an upper-cased description
+MERCHANT_PATTERNS = [
+    # Payment processor and point-of-sale prefixes
+    (re.compile(r'^(?:SQ|TST|SP|PP|PAYPAL|IN|POS|DD|PY)\s*\*\s*'), ''),
+    (re.compile(r'^(?:POS|DEBIT CARD|CHECKCARD|RECURRING)\s+(?:PURCHASE\s+)?(?:\d{4}\s+)?'), ''),
+    (re.compile(r'\bPURCHASE AUTHORIZED ON\s+\d{1,2}/\d{1,2}\b'), ' '),
+    # Card numbers and suffixes
+    (re.compile(r'\b(?:CARD|ACCT)?\s*(?:ENDING(?: IN)?|NO\.?)\s*\d{4}\b'), ' '),
+    (re.compile(r'(?:X{2,}[-\s]?)+\d{4}\b'), ' '),
+    (re.compile(r'\*+\d{2,}'), ' '),
+    # Dates, times and phone numbers
+    (re.compile(r'\b\d{4}-\d{2}-\d{2}\b'), ' '),
+    (re.compile(r'\b\d{1,2}/\d{1,2}(?:/\d{2,4})?\b'), ' '),
+    (re.compile(r'\b\d{1,2}:\d{2}(?::\d{2})?\b'), ' '),
+    (re.compile(r'\b\d{3}[-.]\d{3}[-.]\d{4}\b'), ' '),
+    # Store numbers and reference ids
+    (re.compile(r'(?:#|\bNO\.?\s*|\bSTORE\s+)\s*\d+\b'), ' '),
+    (re.compile(r"(?<![-&'+])\b[A-Z]*\d[A-Z\d]*\b(?![-&'+])"), ' '),
+    # Leftover punctuation and whitespace
+    (re.compile(r"[^A-Z0-9&.'+ -]+"), ' '),
+    (re.compile(r'(?:^|\s)[-.]+(?=\s|$)'), ' '),
+    (re.compile(r'\s+'), ' '),
+]
+
+
+def _line_pattern(pattern: re.Pattern) -> re.Pattern:
+    """Rewrite a merchant pattern to run line by line over newline-joined text.
+
+    Whitespace classes stop matching newlines and anchors match at every line,
+    so each line is rewritten exactly as the original pattern rewrites a single
+    description.
+    """
+    text = pattern.pattern.replace('[^', '[^\\n')
+    text = text.replace(r'[-\s]', r'(?:-|[^\S\n])').replace(r'\s', r'[^\S\n]')
+    return re.compile(text, re.MULTILINE)
+
+
+# Batch versions of MERCHANT_PATTERNS, applied once to all distinct descriptions
+_BATCH_PATTERNS = [(_line_pattern(pattern), replacement) for pattern, replacement in MERCHANT_PATTERNS]
+_BATCH_PATTERNS.append((re.compile(r'^ | $', re.MULTILINE), ''))
+
+
+class MerchantNormalizer:
+    """Canonicalizes raw merchant descriptions.
+
+    Store numbers, card suffixes, dates and processor prefixes are stripped with
+    precompiled patterns, so ``GAS STATION #789`` and ``GAS STATION #123`` both
+    become ``GAS STATION``. Single lookups are kept in an LRU cache whose hit
+    ratio is exposed for tuning; whole columns skip the cache and run each
+    pattern once over all of their distinct values.
+    """
+
+    def __init__(self, cache_size: int = 4096):
+        """Initialize the normalizer.
+
+        Args:
+            cache_size: Maximum number of distinct descriptions kept in the cache
+        """
+        self.cache_size = cache_size
+        self._cached_normalize = lru_cache(maxsize=cache_size)(self._normalize)
+
+    @staticmethod
+    def _normalize(description: str) -> str:
+        """Normalize one description without the cache."""
+        text = description.upper()
+        for pattern, replacement in MERCHANT_PATTERNS:
+            text = pattern.sub(replacement, text)
+        return text.strip()
+
+    def normalize(self, description) -> str:
+        """Normalize a single description.
+
+        Args:
+            description: The raw transaction description
+
+        Returns:
+            The canonical merchant string ('' for missing descriptions)
+        """
+        if description is None or (isinstance(description, float) and np.isnan(description)):
+            return ''
+        return self._cached_normalize(str(description))
+
+    def normalize_series(self, descriptions: Iterable[str]) -> pd.Series:
+        """Normalize a whole column of descriptions.
+
+        The distinct descriptions are joined into one newline-separated text and
+        every pattern is applied to it in a single call, which avoids a Python
+        loop and a cache lookup per value. The results are broadcast back to
+        every row and the LRU cache is left untouched.
+
+        Args:
+            descriptions: Raw transaction descriptions
+
+        Returns:
+            Series of canonical merchant strings aligned with the input
+        """
+        descriptions = pd.Series(descriptions)
+        codes, uniques = pd.factorize(descriptions)
+        text = '\n'.join(str(value).replace('\n', '\r') for value in uniques).upper()
+        for pattern, replacement in _BATCH_PATTERNS:
+            text = pattern.sub(replacement, text)
+        lines = text.split('\n') if len(uniques) else []
+        normalized = np.array(lines + [''], dtype=object)
+        return pd.Series(normalized[codes], index=descriptions.index, dtype=object)
+
+    def cache_info(self):
+        """Get the LRU cache statistics (hits, misses, maxsize, currsize)."""
+        return self._cached_normalize.cache_info()
+
+    @property
+    def hit_ratio(self) -> float:
+        """Fraction of lookups answered from the cache."""
+        info = self.cache_info()
+        lookups = info.hits + info.misses
+        return info.hits / lookups if lookups else 0.0
+
+    def clear_cache(self):
+        """Empty the cache and reset its statistics."""
+        self._cached_normalize.cache_clear()
+
+
+# Shared normalizer so every caller in the process benefits from one cache
+default_normalizer = MerchantNormalizer()
+
+
+def normalize_merchants(descriptions: Iterable[str]) -> pd.Series:
+    """Normalize a column of descriptions with the shared normalizer.
+
+    Args:
+        descriptions: Raw transaction descriptions
+
+    Returns:
+        Series of canonical merchant strings aligned with the input
+    """
+    return default_normalizer.normalize_series(descriptions)
+
+
+def column_signature(columns: Iterable[str]) -> str:
+    """Identify a statement source by its column headers.
+
+    Exports from the same bank or card keep the same headers, so the signature
+    ignores column order, case and surrounding whitespace.
+
+    Args:
+        columns: The CSV column names
+
+    Returns:
+        A short hexadecimal signature
+    """
+    names = sorted(str(column).strip().lower() for column in columns)
+    return hashlib.sha1('\x1f'.join(names).encode('utf-8')).hexdigest()[:16]
+
+
+class MappingProfileStore:
+    """Persists how each user maps a statement source's categories.
+
+    A profile is the set of source category to category_id mappings chosen for
+    one user and one column signature. They share the primary key prefix
+    (user_id, signature), so loading a profile is a single index range scan.
+    """
+
+    def __init__(self, db_path: str):
+        """Initialize the store.
+
+        Args:
+            db_path: Path to the SQLite database
+        """
+        self.db_path = db_path
+
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute('''
+            CREATE TABLE IF NOT EXISTS category_mapping_profiles (
+                user_id INTEGER,
+                signature TEXT,
+                source_category TEXT,
+                category_id INTEGER,
+                updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (user_id, signature, source_category)
+            ) WITHOUT ROWID
+            ''')
+
+    def get_profile(self, user_id: int, signature: str) -> Dict[str, int]:
+        """Load the saved mappings for a user and statement source.
+
+        Args:
+            user_id: The ID of the user
+            signature: The source's column signature
+
+        Returns:
+            Dictionary of source category to category_id
+        """
+        conn = sqlite3.connect(self.db_path)
+        try:
+            rows = conn.execute(
+                """SELECT source_category, category_id FROM category_mapping_profiles
+                WHERE user_id = ? AND signature = ?""",
+                (user_id, signature)
+            ).fetchall()
+        finally:
+            conn.close()
+        return dict(rows)
+
+    def save_profile(self, user_id: int, signature: str, mappings: Dict[str, int]):
+        """Save or update mappings for a user and statement source.
+
+        Args:
+            user_id: The ID of the user
+            signature: The source's column signature
+            mappings: Dictionary of source category to category_id
+        """
+        if not mappings:
+            return
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.executemany(
+                """INSERT INTO category_mapping_profiles (user_id, signature, source_category, category_id)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (user_id, signature, source_category) DO UPDATE SET
+                    category_id = excluded.category_id,
+                    updated_at = CURRENT_TIMESTAMP""",
+                [(user_id, signature, str(source), int(category_id)) for source, category_id in mappings.items()]
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+
+# Column order of the frames built by compact_transactions
+COMPACT_COLUMNS = ['transaction_id', 'date_code', 'amount_cents', 'category_id', 'category', 'description']
+
+# Day zero of the date codes
+_EPOCH = np.datetime64('1970-01-01', 'D')
+
+# Descriptions are stored as a categorical only when at most this share of
+# them is distinct; mostly unique text takes more memory as codes plus a
+# category index than as plain strings
+DESCRIPTION_CATEGORICAL_MAX_UNIQUE = 0.5
+
+_INT32 = np.iinfo(np.int32)
+
+
+def _narrow_int(values: np.ndarray) -> np.ndarray:
+    """Cast integer values to int32, or int64 if any falls outside its range."""
+    if len(values) and (values.min() < _INT32.min or values.max() > _INT32.max):
+        return values.astype(np.int64)
+    return values.astype(np.int32)
+
+
+def compact_transactions(transactions: pd.DataFrame) -> pd.DataFrame:
+    """Pack transactions into a memory-compact frame.
+
+    Amounts become int32 cents and dates become int32 day numbers. IDs are
+    stored as int32; amounts and IDs that do not fit (about $21.4M in cents)
+    fall back to int64. Categories become a categorical, and so do
+    descriptions when they repeat enough for it to save memory. Rows are
+    sorted by (date, transaction_id), so a date range is a binary search (see
+    ``transactions_between``). Use ``expand_transactions`` to convert rows
+    back to display format.
+
+    Args:
+        transactions: DataFrame with transaction_id, transaction_date, amount,
+            category, category_id and (optionally) description columns
+
+    Returns:
+        DataFrame with transaction_id, date_code, amount_cents, category_id,
+        category and description columns
+    """
+    dates = pd.to_datetime(transactions['transaction_date']).to_numpy(dtype='datetime64[D]')
+    if 'description' in transactions:
+        descriptions = transactions['description'].to_numpy(dtype=object)
+    else:
+        descriptions = np.full(len(transactions), None, dtype=object)
+    if pd.unique(descriptions).size <= DESCRIPTION_CATEGORICAL_MAX_UNIQUE * len(descriptions):
+        descriptions = pd.Categorical(descriptions)
+
+    compact = pd.DataFrame({
+        'transaction_id': _narrow_int(transactions['transaction_id'].to_numpy(dtype=np.int64)),
+        'date_code': (dates - _EPOCH).astype(np.int32),
+        'amount_cents': _narrow_int(np.rint(transactions['amount'].to_numpy(dtype=float) * 100)),
+        'category_id': _narrow_int(transactions['category_id'].to_numpy(dtype=np.int64)),
+        'category': pd.Categorical(transactions['category']),
+        'description': pd.Series(descriptions, dtype=descriptions.dtype),
+    }, columns=COMPACT_COLUMNS)
+
+    order = np.lexsort((compact['transaction_id'].to_numpy(), compact['date_code'].to_numpy()))
+    return compact.take(order).reset_index(drop=True)
+
+
+def transactions_between(compact: pd.DataFrame, start_date: Optional[str] = None,
+                         end_date: Optional[str] = None) -> pd.DataFrame:
+    """Slice a compact frame to a date range without scanning it.
+
+    Args:
+        compact: Frame built by ``compact_transactions``
+        start_date: Earliest transaction date (YYYY-MM-DD), inclusive
+        end_date: Latest transaction date (YYYY-MM-DD), inclusive
+
+    Returns:
+        The rows in the range, still in compact form
+    """
+    date_codes = compact['date_code'].to_numpy()
+    start = 0
+    end = len(compact)
+    if start_date:
+        start = np.searchsorted(date_codes, (np.datetime64(start_date, 'D') - _EPOCH).astype(np.int32), 'left')
+    if end_date:
+        end = np.searchsorted(date_codes, (np.datetime64(end_date, 'D') - _EPOCH).astype(np.int32), 'right')
+    return compact.iloc[start:end]
+
+
+def expand_transactions(compact: pd.DataFrame) -> pd.DataFrame:
+    """Convert compact rows to display format.
+
+    Only call this on the rows being shown, e.g. a date slice or the most
+    recent few, so the full history never exists in the wide format.
+
+    Args:
+        compact: Frame built by ``compact_transactions``, or a slice of one
+
+    Returns:
+        DataFrame with transaction_id, amount (dollars), transaction_date
+        (datetime), category, category_id and description columns
+    """
+    return pd.DataFrame({
+        'transaction_id': compact['transaction_id'].to_numpy(dtype=np.int64),
+        'amount': compact['amount_cents'].to_numpy() / 100.0,
+        'transaction_date': pd.to_datetime(
+            _EPOCH + compact['date_code'].to_numpy().astype('timedelta64[D]')
+        ),
+        'category': compact['category'].to_numpy(dtype=object),
+        'category_id': compact['category_id'].to_numpy(dtype=np.int64),
+        'description': compact['description'].to_numpy(dtype=object),
+    }, index=compact.index)
@@ -0,0 +1,451 @@
+"""Read queries over the finance database used by the UI and the chatbot.
+
+This module keeps the SQL for searching and aggregating transactions in one
+place, so the Streamlit app and the chat assistant answer the same question
+the same way and every query can use the database's indexes.
+"""
+
+import re
+import sqlite3
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from utils.data_processor import normalize_merchants
+
+_SEARCH_TERM_PATTERN = re.compile(r"[\w&']+")
+
+# Spending granularities: pandas period frequency and the SQL expression that
+# buckets a date column into the period label
+PERIOD_BUCKETS = {
+    'day': ('D', "strftime('%Y-%m-%d', {col})"),
+    'week': ('W-SUN', "date({col}, 'weekday 0', '-6 days')"),
+    'month': ('M', "strftime('%Y-%m', {col})"),
+    'quarter': ('Q', "strftime('%Y', {col}) || 'Q' || ((CAST(strftime('%m', {col}) AS INTEGER) + 2) / 3)"),
+    'year': ('Y', "strftime('%Y', {col})"),
+}
+
+# Granularities made of whole months, which can be answered from monthly_rollups
+ROLLUP_GRANULARITIES = (None, 'month', 'quarter', 'year')
+
+# Most IDs bound in one IN (...) list. SQLite caps the number of bound parameters
+# per statement at SQLITE_MAX_VARIABLE_NUMBER: 999 before 3.32.0 and 32766 since.
+# Staying under the old cap keeps every build working and leaves room for the
+# statement's other parameters.
+MAX_IN_PARAMS = 900
+
+
+def id_batches(ids) -> List[List[int]]:
+    """Split IDs into lists small enough for one IN (...) clause.
+
+    Args:
+        ids: Iterable of integer IDs
+
+    Returns:
+        Lists of at most ``MAX_IN_PARAMS`` IDs, in the input order
+    """
+    ids = [int(value) for value in ids]
+    return [ids[start:start + MAX_IN_PARAMS] for start in range(0, len(ids), MAX_IN_PARAMS)]
+
+
+class FinanceQueries:
+    """Indexed read queries over transactions."""
+
+    def __init__(self, db_path: str):
+        """Initialize the queries.
+
+        Args:
+            db_path: Path to the SQLite database
+        """
+        self.db_path = db_path
+        self._has_fts = None
+
+    def _connect(self):
+        """Open a connection to the database."""
+        return sqlite3.connect(self.db_path)
+
+    def has_full_text_index(self) -> bool:
+        """Whether the database has the ``transactions_fts`` search index."""
+        if self._has_fts is None:
+            conn = self._connect()
+            try:
+                self._has_fts = conn.execute(
+                    "SELECT 1 FROM sqlite_master WHERE name = 'transactions_fts'"
+                ).fetchone() is not None
+            finally:
+                conn.close()
+        return self._has_fts
+
+    @staticmethod
+    def match_expression(text: str) -> Optional[str]:
+        """Turn free text into an FTS5 query where every word is a prefix match.
+
+        Words are quoted, so user input can never be parsed as FTS5 syntax.
+
+        Args:
+            text: The search text, e.g. "shell" or "whole foods"
+
+        Returns:
+            The MATCH expression, or None if the text has no searchable words
+        """
+        terms = _SEARCH_TERM_PATTERN.findall(text.lower())
+        if not terms:
+            return None
+        return ' '.join('"' + term.replace('"', '""') + '"*' for term in terms)
+
+    def _search_filter(self, user_id: int, text: str, start_date: Optional[str],
+                       end_date: Optional[str]) -> Tuple[str, str, List]:
+        """Build the FROM and WHERE clauses shared by the search queries."""
+        params: List = []
+        if self.has_full_text_index():
+            # The user filter is part of the MATCH, so FTS5 intersects the postings
+            # itself; CROSS JOIN keeps SQLite from probing the index once per row
+            from_clause = """transactions_fts f
+            CROSS JOIN transactions t ON t.transaction_id = f.rowid"""
+            where_clause = "transactions_fts MATCH ?"
+            params.append(f'user_id : "{int(user_id)}" AND description : ({self.match_expression(text)})')
+        else:
+            from_clause = "transactions t"
+            where_clause = "t.user_id = ?"
+            params.append(user_id)
+            for term in _SEARCH_TERM_PATTERN.findall(text.lower()):
+                where_clause += " AND LOWER(t.description) LIKE ?"
+                params.append(f'%{term}%')
+
+        if start_date:
+            where_clause += " AND t.transaction_date >= ?"
+            params.append(start_date)
+        if end_date:
+            where_clause += " AND t.transaction_date <= ?"
+            params.append(end_date)
+        return from_clause, where_clause, params
+
+    def data_version(self, user_id: int) -> int:
+        """Get the user's data version, which changes whenever their data does.
+
+        Args:
+            user_id: The ID of the user
+
+        Returns:
+            The version counter from ``data_versions`` (0 if never changed)
+        """
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT version FROM data_versions WHERE user_id = ?", (user_id,)).fetchone()
+        finally:
+            conn.close()
+        return row[0] if row else 0
+
+    def activity_span(self, user_id: int) -> Tuple[Optional[str], Optional[str]]:
+        """Get the dates of a user's first and last transaction.
+
+        Args:
+            user_id: The ID of the user
+
+        Returns:
+            Tuple of (first_date, last_date), or (None, None) for a user without
+            transactions
+        """
+        conn = self._connect()
+        try:
+            return tuple(conn.execute(
+                "SELECT MIN(transaction_date), MAX(transaction_date) FROM transactions WHERE user_id = ?",
+                (user_id,)
+            ).fetchone())
+        finally:
+            conn.close()
+
+    def spending_aggregate(self, user_id: int, start_date: Optional[str] = None,
+                           end_date: Optional[str] = None, categories: Optional[List[str]] = None,
+                           granularity: Optional[str] = 'month', by_category: bool = True) -> pd.DataFrame:
+        """Total a user's spending per period and category in SQL.
+
+        Whole-month questions (monthly or coarser buckets, with a date range that
+        starts and ends on month boundaries) are answered from the
+        ``monthly_rollups`` table. Everything else groups ``transactions`` over
+        the (user_id, transaction_date) index. Only the aggregate rows are
+        returned.
+
+        Args:
+            user_id: The ID of the user
+            start_date: Earliest transaction date (YYYY-MM-DD), inclusive
+            end_date: Latest transaction date (YYYY-MM-DD), inclusive
+            categories: Only include these category names (default: all)
+            granularity: One of 'day', 'week', 'month', 'quarter', 'year', or None
+                for a single total over the whole range
+            by_category: Whether to split the totals by category
+
+        Returns:
+            DataFrame with period (unless granularity is None), category (if
+            by_category), total and count columns, ordered by period
+        """
+        if granularity is not None and granularity not in PERIOD_BUCKETS:
+            raise ValueError(f"Unsupported granularity: {granularity}")
+
+        whole_months = (
+            granularity in ROLLUP_GRANULARITIES
+            and (not start_date or pd.Timestamp(start_date).is_month_start)
+            and (not end_date or pd.Timestamp(end_date).is_month_end)
+        )
+        if whole_months:
+            source = "monthly_rollups t"
+            date_col = "t.month || '-01'"
+            amount, count = "t.total_amount", "t.txn_count"
+            start_value = start_date[:7] if start_date else None
+            end_value = end_date[:7] if end_date else None
+            range_col = "t.month"
+        else:
+            source = "transactions t"
+            date_col = "t.transaction_date"
+            amount, count = "t.amount", "1"
+            start_value, end_value = start_date, end_date
+            range_col = "t.transaction_date"
+
+        where_clause = "t.user_id = ?"
+        params: List = [user_id]
+        if start_value:
+            where_clause += f" AND {range_col} >= ?"
+            params.append(start_value)
+        if end_value:
+            where_clause += f" AND {range_col} <= ?"
+            params.append(end_value)
+        if categories:
+            where_clause += f" AND c.name IN ({','.join('?' * len(categories))})"
+            params.extend(categories)
+
+        group_columns = []
+        if granularity is not None:
+            group_columns.append((PERIOD_BUCKETS[granularity][1].format(col=date_col), 'period'))
+        if by_category:
+            group_columns.append(("c.name", 'category'))
+        select_groups = ''.join(f"{expression} AS {name}, " for expression, name in group_columns)
+        group_clause = (f"GROUP BY {', '.join(name for _, name in group_columns)} "
+                        f"ORDER BY {', '.join(name for _, name in group_columns)}") if group_columns else ""
+
+        conn = self._connect()
+        try:
+            aggregate = pd.read_sql_query(
+                f"""SELECT {select_groups}SUM({amount}) AS total, SUM({count}) AS count
+                FROM {source}
+                JOIN categories c ON c.category_id = t.category_id
+                WHERE {where_clause}
+                {group_clause}""",
+                conn, params=params
+            )
+        finally:
+            conn.close()
+
+        # An ungrouped SUM over no rows still returns one row of NULLs
+        aggregate['total'] = aggregate['total'].fillna(0.0)
+        aggregate['count'] = aggregate['count'].fillna(0).astype(int)
+        return aggregate
+
+    def average_spending(self, user_id: int, granularity: str = 'month',
+                         categories: Optional[List[str]] = None) -> float:
+        """Average a user's spending per period.
+
+        The average covers every period from the user's first to last transaction,
+        so periods without spending count as zero.
+
+        Args:
+            user_id: The ID of the user
+            granularity: One of 'day', 'week', 'month', 'quarter' or 'year'
+            categories: Only include these category names (default: all)
+
+        Returns:
+            The average spending per period (0.0 for a user without transactions)
+        """
+        if granularity not in PERIOD_BUCKETS:
+            raise ValueError(f"Unsupported granularity: {granularity}")
+
+        first_date, last_date = self.activity_span(user_id)
+        if first_date is None:
+            return 0.0
+        freq = PERIOD_BUCKETS[granularity][0]
+        n_periods = pd.Period(last_date, freq=freq).ordinal - pd.Period(first_date, freq=freq).ordinal + 1
+        total = self.spending_aggregate(user_id, categories=categories, granularity=None,
+                                        by_category=False)['total'].iloc[0]
+        return float(total) / n_periods
+
+    def transactions_page(self, user_id: int, page_size: int = 50,
+                          after: Optional[Tuple[str, int]] = None,
+                          start_date: Optional[str] = None, end_date: Optional[str] = None,
+                          category_ids: Optional[List[int]] = None
+                          ) -> Tuple[pd.DataFrame, Optional[Tuple[str, int]]]:
+        """Load one page of a user's transactions, most recent first.
+
+        Pages are addressed by a keyset cursor on (transaction_date,
+        transaction_id) rather than an OFFSET, so every page is a range read on
+        the (user_id, transaction_date) index no matter how deep it is.
+
+        Args:
+            user_id: The ID of the user
+            page_size: Number of transactions per page
+            after: Cursor returned for the previous page (None for the first page)
+            start_date: Earliest transaction date (YYYY-MM-DD), inclusive
+            end_date: Latest transaction date (YYYY-MM-DD), inclusive
+            category_ids: Only include these categories (default: all)
+
+        Returns:
+            Tuple of (page DataFrame with transaction_id, transaction_date, amount,
+            category, category_id and description, cursor for the next page or
+            None if this is the last page)
+        """
+        where_clause = "t.user_id = ?"
+        params: List = [user_id]
+        if after is not None:
+            where_clause += " AND (t.transaction_date, t.transaction_id) < (?, ?)"
+            params.extend([after[0], int(after[1])])
+        if start_date:
+            where_clause += " AND t.transaction_date >= ?"
+            params.append(start_date)
+        if end_date:
+            where_clause += " AND t.transaction_date <= ?"
+            params.append(end_date)
+        if category_ids:
+            where_clause += f" AND t.category_id IN ({','.join('?' * len(category_ids))})"
+            params.extend(int(category_id) for category_id in category_ids)
+
+        conn = self._connect()
+        try:
+            # One extra row tells whether another page follows
+            page = pd.read_sql_query(
+                f"""SELECT t.transaction_id, t.transaction_date, t.amount, c.name AS category,
+                    t.category_id, t.description
+                FROM transactions t
+                JOIN categories c ON c.category_id = t.category_id
+                WHERE {where_clause}
+                ORDER BY t.transaction_date DESC, t.transaction_id DESC
+                LIMIT ?""",
+                conn, params=params + [page_size + 1]
+            )
+        finally:
+            conn.close()
+
+        if len(page) <= page_size:
+            return page, None
+        page = page.iloc[:page_size]
+        last = page.iloc[-1]
+        return page, (last['transaction_date'], int(last['transaction_id']))
+
+    def top_merchants(self, user_id: int, start_date: Optional[str] = None,
+                      end_date: Optional[str] = None, limit: int = 5) -> pd.DataFrame:
+        """Rank the merchants a user spent the most at.
+
+        Spending is grouped by raw description in SQL over the (user_id,
+        transaction_date) index, then descriptions of the same merchant are
+        merged with the shared merchant normalizer.
+
+        Args:
+            user_id: The ID of the user
+            start_date: Earliest transaction date (YYYY-MM-DD), inclusive
+            end_date: Latest transaction date (YYYY-MM-DD), inclusive
+            limit: Maximum number of merchants to return
+
+        Returns:
+            DataFrame with merchant, total and count columns, largest total first
+        """
+        where_clause = "user_id = ? AND description IS NOT NULL AND description != ''"
+        params: List = [user_id]
+        if start_date:
+            where_clause += " AND transaction_date >= ?"
+            params.append(start_date)
+        if end_date:
+            where_clause += " AND transaction_date <= ?"
+            params.append(end_date)
+
+        conn = self._connect()
+        try:
+            by_description = pd.read_sql_query(
+                f"""SELECT description, SUM(amount) AS total, COUNT(*) AS count
+                FROM transactions
+                WHERE {where_clause}
+                GROUP BY description""",
+                conn, params=params
+            )
+        finally:
+            conn.close()
+
+        by_description['merchant'] = normalize_merchants(by_description['description']).values
+        merchants = by_description.groupby('merchant', as_index=False)[['total', 'count']].sum()
+        return merchants.sort_values(['total', 'merchant'], ascending=[False, True]).head(limit).reset_index(drop=True)
+
+    def search_transactions(self, user_id: int, text: str, start_date: Optional[str] = None,
+                            end_date: Optional[str] = None, limit: int = 100) -> pd.DataFrame:
+        """Find a user's transactions whose description matches the text.
+
+        Args:
+            user_id: The ID of the user
+            text: Words to search for; each word matches as a prefix
+            start_date: Earliest transaction date (YYYY-MM-DD), inclusive
+            end_date: Latest transaction date (YYYY-MM-DD), inclusive
+            limit: Maximum number of transactions to return
+
+        Returns:
+            DataFrame with transaction_id, transaction_date, amount, category and
+            description, most recent first
+        """
+        columns = ['transaction_id', 'transaction_date', 'amount', 'category', 'description']
+        if self.match_expression(text) is None:
+            return pd.DataFrame(columns=columns)
+
+        from_clause, where_clause, params = self._search_filter(user_id, text, start_date, end_date)
+        conn = self._connect()
+        try:
+            return pd.read_sql_query(
+                f"""SELECT t.transaction_id, t.transaction_date, t.amount, c.name AS category, t.description
+                FROM {from_clause}
+                JOIN categories c ON c.category_id = t.category_id
+                WHERE {where_clause}
+                ORDER BY t.transaction_date DESC, t.transaction_id DESC
+                LIMIT ?""",
+                conn, params=params + [limit]
+            )
+        finally:
+            conn.close()
+
+    def search_summary(self, user_id: int, text: str, start_date: Optional[str] = None,
+                       end_date: Optional[str] = None) -> Dict:
+        """Aggregate a user's transactions whose description matches the text.
+
+        Args:
+            user_id: The ID of the user
+            text: Words to search for; each word matches as a prefix
+            start_date: Earliest transaction date (YYYY-MM-DD), inclusive
+            end_date: Latest transaction date (YYYY-MM-DD), inclusive
+
+        Returns:
+            Dictionary with total, count, first_date, last_date and a by_category
+            DataFrame (category, total, count)
+        """
+        summary = {'total': 0.0, 'count': 0, 'first_date': None, 'last_date': None,
+                   'by_category': pd.DataFrame(columns=['category', 'total', 'count'])}
+        if self.match_expression(text) is None:
+            return summary
+
+        from_clause, where_clause, params = self._search_filter(user_id, text, start_date, end_date)
+        conn = self._connect()
+        try:
+            by_category = pd.read_sql_query(
+                f"""SELECT c.name AS category, SUM(t.amount) AS total, COUNT(*) AS count,
+                    MIN(t.transaction_date) AS first_date, MAX(t.transaction_date) AS last_date
+                FROM {from_clause}
+                JOIN categories c ON c.category_id = t.category_id
+                WHERE {where_clause}
+                GROUP BY c.name
+                ORDER BY total DESC""",
+                conn, params=params
+            )
+        finally:
+            conn.close()
+
+        if by_category.empty:
+            return summary
+        summary.update({
+            'total': float(by_category['total'].sum()),
+            'count': int(by_category['count'].sum()),
+            'first_date': by_category['first_date'].min(),
+            'last_date': by_category['last_date'].max(),
+            'by_category': by_category[['category', 'total', 'count']],
+        })
+        return summary